@@ -0,0 +1,272 @@
+"""
+Сборка статики веб-сервиса: имена с хешем содержимого и заранее сжатые копии.
+
+При старте сервиса (или командой python assets.py) файлы из static/
+собираются в ASSETS_DIR:
+
+    style.css        -> style.3f2a1b4c5d.css      (+ .gz, .br)
+    gilroy-bold.ttf  -> gilroy-bold.8c1d2e3f4a.woff2
+    <баннер>.png     -> asset.1a2b3c4d5e.png      (+ .webp)
+
+- шрифты TTF/OTF конвертируются в WOFF2 (fontTools и brotli);
+- ссылки url(...) в CSS переписываются на собранные имена, поэтому хеш CSS
+  меняется вместе с любым шрифтом или картинкой, на которые он ссылается;
+- текстовые файлы (CSS, JS, SVG) сжимаются заранее в .gz (gzip -9) и .br
+  (brotli 11), если копия хотя бы на 10% меньше;
+- большие PNG/JPEG получают копию в WebP для браузеров с image/webp в Accept.
+
+Соответствие исходных имен собранным хранится в manifest.json. Шаблоны
+получают ссылки через asset_url('style.css'), а /assets/<имя> отдает файл
+с Cache-Control: immutable: имя меняется вместе с содержимым, поэтому
+браузер не перепроверяет файл и не приходит за ним повторно. Сборка
+повторяется, только если изменились исходники или набор доступных библиотек.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import sys
+from io import BytesIO
+from urllib.parse import unquote
+
+from flask import abort, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # без brotli нет .br и WOFF2
+    brotli = None
+
+try:
+    from fontTools.ttLib import TTFont
+except ImportError:  # без fontTools шрифты отдаются как есть (со сжатыми копиями)
+    TTFont = None
+
+try:
+    from PIL import Image
+except ImportError:  # без Pillow картинки отдаются только в исходном формате
+    Image = None
+
+ASSETS_DIR = os.getenv("ASSETS_DIR", "static_build")
+ASSET_MAX_AGE = 365 * 24 * 3600
+# Увеличивается, когда меняется результат сборки при тех же исходниках
+PIPELINE_VERSION = 1
+HASH_LENGTH = 10
+
+FONT_EXTENSIONS = {".ttf", ".otf"}
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".json", ".txt", ".ttf", ".otf"}
+RASTER_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+# Копия в WebP делается для картинок от этого размера
+WEBP_MIN_BYTES = 32 * 1024
+# Сжатая копия сохраняется, если она не больше этой доли исходника
+MIN_RATIO = 0.9
+# Content-Encoding -> расширение сжатой копии, в порядке предпочтения
+ENCODINGS = {"br": "br", "gzip": "gz"}
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+_UNSAFE = re.compile(r"[^A-Za-z0-9_-]+")
+
+mimetypes.add_type("font/woff2", ".woff2")
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def _hashed_name(logical, data, extension=None):
+    """dir/name.ext -> dir/name.<хеш>.ext; имена не из ASCII заменяются на asset"""
+    directory, filename = posixpath.split(logical)
+    stem, original_extension = posixpath.splitext(filename)
+    stem = _UNSAFE.sub("-", stem).strip("-") or "asset"
+    return posixpath.join(directory, f"{stem}.{_digest(data)}{extension or original_extension.lower()}")
+
+
+class AssetPipeline:
+    """Собранная статика: исходное имя -> имя с хешем и сведения для отдачи"""
+
+    def __init__(self, static_dir, output_dir=ASSETS_DIR, static_url="/static"):
+        self.static_dir = static_dir
+        self.output_dir = output_dir
+        self.static_url = static_url.rstrip("/")
+        self.assets = {}  # исходное имя -> собранное
+        self.files = {}  # собранное имя -> {"mimetype", "encodings", "webp"}
+        self._load_or_build()
+
+    def url(self, logical):
+        """Ссылка на собранный файл; неизвестный файл отдается обычным /static"""
+        built = self.assets.get(logical)
+        if built is None:
+            return url_for("static", filename=logical)
+        return url_for("asset", filename=built)
+
+    def _sources(self):
+        """Относительные пути (через /) всех исходных файлов"""
+        paths = []
+        for directory, _, names in os.walk(self.static_dir):
+            for name in names:
+                relative = os.path.relpath(os.path.join(directory, name), self.static_dir)
+                paths.append(relative.replace(os.sep, "/"))
+        return sorted(paths)
+
+    def _fingerprint(self, sources):
+        """Отпечаток исходников и доступных библиотек: изменился — пора пересобрать"""
+        digest = hashlib.sha256(
+            f"{PIPELINE_VERSION}|{brotli is not None}|{TTFont is not None}|{Image is not None}".encode()
+        )
+        for logical in sources:
+            stat = os.stat(os.path.join(self.static_dir, logical))
+            digest.update(f"|{logical}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()
+
+    def _load_or_build(self):
+        sources = self._sources()
+        fingerprint = self._fingerprint(sources)
+        manifest_path = os.path.join(self.output_dir, "manifest.json")
+        try:
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+
+        if manifest is None or manifest.get("source") != fingerprint:
+            manifest = self.build(sources)
+            manifest["source"] = fingerprint
+            temp_path = f"{manifest_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, manifest_path)
+            print(f"📦 Статика собрана: {len(manifest['assets'])} файлов в {self.output_dir}")
+
+        self.assets = manifest["assets"]
+        self.files = manifest["files"]
+
+    def build(self, sources=None):
+        """Собирает все файлы; CSS — последним, когда имена шрифтов и картинок уже известны"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        sources = self._sources() if sources is None else sources
+        assets, files = {}, {}
+        stylesheets = [logical for logical in sources if logical.endswith(".css")]
+
+        for logical in [logical for logical in sources if not logical.endswith(".css")] + stylesheets:
+            with open(os.path.join(self.static_dir, logical), "rb") as f:
+                data = f.read()
+            extension = posixpath.splitext(logical)[1].lower()
+
+            if extension == ".css":
+                data = self._rewrite_css(logical, data, assets)
+            elif extension in FONT_EXTENSIONS and TTFont is not None and brotli is not None:
+                data, extension = self._to_woff2(data), ".woff2"
+
+            built = _hashed_name(logical, data, extension)
+            entry = {"mimetype": mimetypes.guess_type(built)[0] or "application/octet-stream", "encodings": []}
+            self._write(built, data)
+
+            if extension in COMPRESSIBLE_EXTENSIONS:
+                for encoding, suffix in ENCODINGS.items():
+                    compressed = self._compress(data, encoding)
+                    if compressed is not None and len(compressed) <= len(data) * MIN_RATIO:
+                        self._write(f"{built}.{suffix}", compressed)
+                        entry["encodings"].append(encoding)
+            elif extension in RASTER_EXTENSIONS and Image is not None and len(data) >= WEBP_MIN_BYTES:
+                webp = self._to_webp(data)
+                if len(webp) <= len(data) * MIN_RATIO:
+                    self._write(f"{built}.webp", webp)
+                    entry["webp"] = True
+
+            assets[logical] = built
+            files[built] = entry
+        return {"version": PIPELINE_VERSION, "assets": assets, "files": files}
+
+    def _rewrite_css(self, logical, data, assets):
+        """Заменяет url(...) на собранные файлы; внешние ссылки и data: не трогает"""
+        base = posixpath.dirname(f"{self.static_url}/{logical}")
+        prefix = f"{self.static_url}/"
+
+        def replace(match):
+            reference = match.group(2).strip()
+            if re.match(r"^(?:[a-z]+:|//|#)", reference, re.IGNORECASE):
+                return match.group(0)
+            path = unquote(reference.split("?", 1)[0].split("#", 1)[0])
+            path = posixpath.normpath(path if path.startswith("/") else posixpath.join(base, path))
+            built = assets.get(path[len(prefix):]) if path.startswith(prefix) else None
+            if built is None:
+                return match.group(0)
+            return f'url("/assets/{built}")'
+
+        return _CSS_URL.sub(replace, data.decode("utf-8")).encode("utf-8")
+
+    @staticmethod
+    def _to_woff2(data):
+        # Без пересчета времени в заголовке: одинаковый шрифт — одинаковый хеш при каждой сборке
+        font = TTFont(BytesIO(data), recalcTimestamp=False)
+        font.flavor = "woff2"
+        buffer = BytesIO()
+        font.save(buffer)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _to_webp(data):
+        image = Image.open(BytesIO(data))
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        buffer = BytesIO()
+        image.save(buffer, format="WEBP", quality=85, method=6)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _compress(data, encoding):
+        if encoding == "gzip":
+            return gzip.compress(data, compresslevel=9, mtime=0)
+        if encoding == "br" and brotli is not None:
+            return brotli.compress(data, quality=11)
+        return None
+
+    def _write(self, name, data):
+        """Файлы адресованы содержимым: существующий файл с тем же именем уже верен"""
+        path = os.path.join(self.output_dir, *name.split("/"))
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+
+def register_assets(app, pipeline):
+    """Добавляет asset_url() в шаблоны и GET /assets/<имя>"""
+    app.jinja_env.globals["asset_url"] = pipeline.url
+
+    @app.route("/assets/<path:filename>")
+    def asset(filename):
+        entry = pipeline.files.get(filename)
+        if entry is None:
+            abort(404)
+
+        path, mimetype, encoding = filename, entry["mimetype"], None
+        if entry.get("webp") and "image/webp" in request.headers.get("Accept", ""):
+            path, mimetype = f"{filename}.webp", "image/webp"
+        elif entry["encodings"]:
+            encoding = request.accept_encodings.best_match(entry["encodings"])
+            if encoding is not None:
+                path = f"{filename}.{ENCODINGS[encoding]}"
+
+        response = send_from_directory(
+            os.path.abspath(pipeline.output_dir), path, mimetype=mimetype, etag=path, conditional=True
+        )
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE}, immutable"
+        response.vary.add("Accept" if entry.get("webp") else "Accept-Encoding")
+        return response
+
+
+if __name__ == "__main__":
+    # Сборка без запуска сервиса: python assets.py [static] [выходной каталог]
+    static_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else ASSETS_DIR
+    pipeline = AssetPipeline(static_dir, output_dir)
+    for logical, built in pipeline.assets.items():
+        extras = pipeline.files[built]["encodings"] + (["webp"] if pipeline.files[built].get("webp") else [])
+        print(f"{logical} -> {built} {' '.join(extras)}")
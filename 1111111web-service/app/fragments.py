@@ -0,0 +1,69 @@
+"""
+Кэш отрендеренных фрагментов страниц.
+
+Страница поиска /dml отдается потоком: каркас (шапка, фильтры, скрипты)
+уходит клиенту сразу, а фрагмент с результатами дописывается, когда
+ответил поисковый сервис. Готовый фрагмент кэшируется по нормализованному
+запросу, фильтрам, режиму поиска и версии каталога: повторный запрос не
+ходит в поиск и не рендерит шаблон результатов. После синхронизации или
+переиндексации версия каталога меняется, и старые фрагменты перестают
+читаться.
+"""
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from time import monotonic
+
+from metrics import INDEX_SIZE, cache_event
+
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", 1024))
+FRAGMENT_CACHE_TTL = float(os.getenv("FRAGMENT_CACHE_TTL", 300))
+
+
+def normalize_query(query):
+    """Unicode NFKC, регистр и лишние пробелы: такие запросы дают одну и ту же выдачу в обоих режимах поиска"""
+    return " ".join(unicodedata.normalize("NFKC", query or "").casefold().split())
+
+
+def fragment_key(name, query, filters, version):
+    """Ключ фрагмента: пустые фильтры не различаются с отсутствующими"""
+    filters = sorted((key, value.strip()) for key, value in filters.items() if value and value.strip())
+    payload = json.dumps([name, normalize_query(query), filters, version], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class FragmentCache:
+    """LRU на size фрагментов, каждый живет не дольше ttl секунд"""
+
+    def __init__(self, size=FRAGMENT_CACHE_SIZE, ttl=FRAGMENT_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._items = OrderedDict()  # ключ -> (html, когда устареет)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            hit = item is not None and item[1] > monotonic()
+            if hit:
+                self._items.move_to_end(key)
+            elif item is not None:
+                del self._items[key]
+        cache_event("fragment", hit)
+        return item[0] if hit else None
+
+    def set(self, key, html):
+        with self._lock:
+            self._items[key] = (html, monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+            INDEX_SIZE.labels("fragment_cache", "items").set(len(self._items))
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            INDEX_SIZE.labels("fragment_cache", "items").set(0)
@@ -0,0 +1,402 @@
+"""
+Прокси постеров: уменьшенные копии в дисковом кэше.
+
+GET /poster?src=<ссылка>&w=<ширина> отдает постер, уменьшенный до ближайшей
+ширины из POSTER_WIDTHS, в WebP (если браузер прислал image/webp в Accept)
+или в JPEG. Исходная картинка скачивается один раз: из нее сразу строятся
+все варианты (ширины × форматы), и они ложатся на диск:
+
+    <POSTER_CACHE_DIR>/variants/ab/<sha256 картинки>/<ширина>.<webp|jpg>
+    <POSTER_CACHE_DIR>/sources.log   строки "<sha256 ссылки> <sha256 картинки>"
+
+Каталог варианта назван по хешу содержимого: одна и та же картинка по разным
+ссылкам хранится один раз. Адрес /poster задается ссылкой, а не содержимым:
+картинка по ссылке может смениться, поэтому ответ кэшируется браузером на
+POSTER_MAX_AGE секунд, а затем проверяется по ETag (хеш варианта) и обычно
+подтверждается ответом 304 без тела. Размер кэша ограничен
+POSTER_CACHE_MAX_BYTES: при превышении удаляются картинки, которые дольше
+всех не запрашивались (LRU, все варианты картинки сразу).
+
+Ссылки принимаются только на хосты из POSTER_ALLOWED_HOSTS, чтобы эндпоинт
+нельзя было использовать как открытый прокси. Перенаправления источника
+проходятся вручную (не больше POSTER_MAX_REDIRECTS), и каждый следующий адрес
+проверяется по тому же списку. Без Pillow эндпоинт
+перенаправляет на исходную ссылку.
+"""
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from time import perf_counter, time
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from flask import jsonify, make_response, redirect, request, url_for
+
+from metrics import INDEX_SIZE, cache_event, count_error, observe_stage, get_logger
+
+try:
+    from PIL import Image
+except ImportError:  # без Pillow постеры отдаются с исходного адреса
+    Image = None
+
+logger = get_logger("posters")
+
+POSTER_CACHE_DIR = os.getenv("POSTER_CACHE_DIR", "poster_cache")
+POSTER_CACHE_MAX_BYTES = int(os.getenv("POSTER_CACHE_MAX_BYTES", 1024 ** 3))
+POSTER_WIDTHS = tuple(sorted(int(width) for width in os.getenv("POSTER_WIDTHS", "160,342,500").split(",")))
+POSTER_ALLOWED_HOSTS = frozenset(
+    host.strip() for host in os.getenv(
+        "POSTER_ALLOWED_HOSTS", "image.openmoviedb.com,avatars.mds.yandex.net,st.kp.yandex.net,image.tmdb.org"
+    ).split(",") if host.strip()
+)
+POSTER_FETCH_TIMEOUT = float(os.getenv("POSTER_FETCH_TIMEOUT", 5))
+POSTER_MAX_REDIRECTS = int(os.getenv("POSTER_MAX_REDIRECTS", 3))
+# Недоступный источник не запрашивается повторно столько секунд
+POSTER_RETRY_AFTER = float(os.getenv("POSTER_RETRY_AFTER", 300))
+POSTER_PREFETCH_CONCURRENCY = int(os.getenv("POSTER_PREFETCH_CONCURRENCY", 8))
+# Исходники больше этого размера не обрабатываются
+POSTER_MAX_SOURCE_BYTES = 20 * 1024 * 1024
+# Сколько секунд браузер не перепроверяет постер
+POSTER_MAX_AGE = int(os.getenv("POSTER_MAX_AGE", 24 * 3600))
+# Время последнего запроса картинки сохраняется в mtime каталога (для LRU после
+# перезапуска) не чаще раза в час, чтобы хит не стоил лишнего системного вызова
+TOUCH_INTERVAL = 3600
+# Сколько недоступных ссылок помнить, прежде чем чистить истекшие
+MAX_FAILURES = 10000
+
+# Расширение -> (формат Pillow, MIME-тип, параметры сохранения); WebP method=2
+# кодирует в 2-3 раза быстрее стандартного 4 при файле больше на 2-3%
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 2}),
+    "jpg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class PosterCache:
+    """Варианты постеров на диске, адресованные хешем исходной картинки"""
+
+    def __init__(self, root=POSTER_CACHE_DIR, max_bytes=POSTER_CACHE_MAX_BYTES, widths=POSTER_WIDTHS,
+                 allowed_hosts=POSTER_ALLOWED_HOSTS, session=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.widths = tuple(sorted(widths))
+        self.allowed_hosts = frozenset(allowed_hosts)
+        self.session = session or requests.Session()
+        self.variants_dir = os.path.join(root, "variants")
+        self.sources_path = os.path.join(root, "sources.log")
+        self.fetches = 0  # сколько раз ходили за исходником
+
+        self._sources = {}  # sha256 ссылки -> sha256 картинки
+        self._entries = OrderedDict()  # sha256 картинки -> [байт на диске, время последнего touch]; порядок LRU
+        self._bytes = 0
+        self._inflight = {}  # sha256 ссылки -> Event скачивания, которое уже идет
+        self._failures = {}  # sha256 ссылки -> когда можно попробовать снова
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """Восстанавливает индекс по содержимому диска"""
+        os.makedirs(self.variants_dir, exist_ok=True)
+        groups = []
+        for shard in os.listdir(self.variants_dir):
+            shard_dir = os.path.join(self.variants_dir, shard)
+            for name in os.listdir(shard_dir):
+                path = os.path.join(shard_dir, name)
+                if ".tmp-" in name:
+                    # Недописанный каталог после падения процесса
+                    shutil.rmtree(path, ignore_errors=True)
+                    continue
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                groups.append((os.stat(path).st_mtime, name, size))
+
+        for mtime, digest, size in sorted(groups):
+            self._entries[digest] = [size, mtime]
+            self._bytes += size
+        # Лимит могли уменьшить с прошлого запуска
+        self._evict()
+
+        lines = 0
+        if os.path.exists(self.sources_path):
+            with open(self.sources_path, encoding="ascii") as f:
+                for line in f:
+                    lines += 1
+                    parts = line.split()
+                    if len(parts) == 2 and parts[1] in self._entries:
+                        self._sources[parts[0]] = parts[1]
+
+        # Журнал ссылок только дописывается; при старте из него убираются повторы и вытесненные картинки
+        if lines != len(self._sources):
+            temp_path = f"{self.sources_path}.tmp"
+            with open(temp_path, "w", encoding="ascii") as f:
+                f.writelines(f"{key} {digest}\n" for key, digest in self._sources.items())
+            os.replace(temp_path, self.sources_path)
+
+        self._update_gauges()
+        print(f"🖼 Кэш постеров: {len(self._entries)} картинок, {self._bytes / 1024 / 1024:.1f} МБ в {self.root}")
+
+    def allowed(self, url):
+        """Ссылка http(s) на разрешенный хост"""
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            return False
+        return parts.scheme in ("http", "https") and parts.hostname in self.allowed_hosts
+
+    def width_for(self, requested):
+        """Наименьшая ширина из списка, не меньше запрошенной (или наибольшая)"""
+        for width in self.widths:
+            if requested and width >= requested:
+                return width
+        return self.widths[-1]
+
+    def get(self, url, width, extension):
+        """
+        Вариант постера: (sha256 картинки, байты, был ли он в кэше) или None,
+        если исходник недоступен или не является картинкой.
+        """
+        digest = self._lookup(url)
+        hit = digest is not None
+        cache_event("poster", hit)
+        if not hit:
+            digest = self.ensure(url)
+            if digest is None:
+                return None
+        try:
+            with open(self._variant_path(digest, width, extension), "rb") as f:
+                return digest, f.read(), hit
+        except FileNotFoundError:
+            # Вытеснен между поиском и чтением
+            return None
+
+    def ensure(self, url):
+        """
+        Скачивает исходник и строит варианты, если их еще нет. Одновременные
+        запросы одной ссылки ждут одно скачивание. Возвращает sha256 картинки или None.
+        """
+        key = _sha256(url.encode())
+        with self._lock:
+            digest = self._sources.get(key)
+            if digest in self._entries:
+                return digest
+            if self._failures.get(key, 0) > time():
+                return None
+            event = self._inflight.get(key)
+            owner = event is None
+            if owner:
+                event = self._inflight[key] = threading.Event()
+
+        if not owner:
+            event.wait(POSTER_FETCH_TIMEOUT * 2)
+            with self._lock:
+                digest = self._sources.get(key)
+                return digest if digest in self._entries else None
+
+        try:
+            return self._build(url, key)
+        except Exception as e:
+            count_error("poster_fetch")
+            logger.warning("poster_fetch_failed", url=url, error=str(e))
+            with self._lock:
+                now = time()
+                if len(self._failures) >= MAX_FAILURES:
+                    self._failures = {url_key: retry_at for url_key, retry_at in self._failures.items() if retry_at > now}
+                self._failures[key] = now + POSTER_RETRY_AFTER
+            return None
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def prefetch(self, urls, progress=None, concurrency=POSTER_PREFETCH_CONCURRENCY):
+        """Строит варианты для списка ссылок; progress(done) вызывается по мере работы"""
+        counts = {"cached": 0, "fetched": 0, "failed": 0}
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for done, status in enumerate(pool.map(self._prefetch_one, urls), 1):
+                counts[status] += 1
+                if progress is not None:
+                    progress(done)
+        return counts
+
+    def _prefetch_one(self, url):
+        if self._lookup(url) is not None:
+            return "cached"
+        return "fetched" if self.ensure(url) is not None else "failed"
+
+    def stats(self):
+        with self._lock:
+            return {
+                "images": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "sources": len(self._sources),
+                "fetches": self.fetches,
+            }
+
+    def _lookup(self, url):
+        """sha256 картинки по ссылке, если ее варианты есть на диске; отмечает обращение для LRU"""
+        key = _sha256(url.encode())
+        with self._lock:
+            digest = self._sources.get(key)
+            entry = self._entries.get(digest) if digest else None
+            if entry is None:
+                return None
+            self._entries.move_to_end(digest)
+            now = time()
+            touch = now - entry[1] > TOUCH_INTERVAL
+            if touch:
+                entry[1] = now
+        if touch:
+            try:
+                os.utime(self._group_dir(digest))
+            except OSError:
+                pass
+        return digest
+
+    def _build(self, url, key):
+        """Скачивает исходник, строит все варианты и записывает их на диск"""
+        start = perf_counter()
+        data = self._fetch(url)
+        observe_stage("poster_fetch", perf_counter() - start)
+
+        digest = _sha256(data)
+        group_dir = self._group_dir(digest)
+        with self._lock:
+            known = digest in self._entries
+        if not known:
+            start = perf_counter()
+            variants = self._render(data)
+            observe_stage("poster_resize", perf_counter() - start)
+
+            # Каталог пишется под временным именем и переименовывается целиком,
+            # поэтому читатели не видят недописанных вариантов
+            os.makedirs(os.path.dirname(group_dir), exist_ok=True)
+            temp_dir = f"{group_dir}.tmp-{uuid.uuid4().hex[:8]}"
+            os.makedirs(temp_dir)
+            for name, body in variants.items():
+                with open(os.path.join(temp_dir, name), "wb") as f:
+                    f.write(body)
+            try:
+                os.rename(temp_dir, group_dir)
+            except OSError:
+                # Ту же картинку по другой ссылке только что записал другой поток
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            size = sum(len(body) for body in variants.values())
+
+        with self._lock:
+            if digest not in self._entries:
+                if known:
+                    # Вытеснена, пока скачивали: строим заново при следующем обращении
+                    return None
+                self._entries[digest] = [size, time()]
+                self._bytes += size
+            self._sources[key] = digest
+            with open(self.sources_path, "a", encoding="ascii") as f:
+                f.write(f"{key} {digest}\n")
+            self._evict()
+            self._update_gauges()
+        return digest
+
+    def _fetch(self, url):
+        with self._lock:
+            self.fetches += 1
+        # Перенаправления не проходятся автоматически: разрешенный хост мог бы
+        # перенаправить на внутренний адрес
+        for _ in range(POSTER_MAX_REDIRECTS + 1):
+            response = self.session.get(url, timeout=POSTER_FETCH_TIMEOUT, stream=True, allow_redirects=False)
+            if not response.is_redirect:
+                break
+            location = urljoin(url, response.headers["Location"])
+            response.close()
+            if not self.allowed(location):
+                raise ValueError(f"Перенаправление на недопустимый адрес: {location}")
+            url = location
+        else:
+            raise ValueError(f"Больше {POSTER_MAX_REDIRECTS} перенаправлений")
+
+        with response:
+            response.raise_for_status()
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > POSTER_MAX_SOURCE_BYTES:
+                    raise ValueError(f"Исходник больше {POSTER_MAX_SOURCE_BYTES} байт")
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+    def _render(self, data):
+        """Все варианты картинки: имя файла -> байты"""
+        if Image is None:
+            raise RuntimeError("Pillow не установлен")
+        image = Image.open(BytesIO(data))
+        # JPEG декодируется сразу в уменьшенном масштабе, если исходник намного больше нужного
+        image.draft("RGB", (self.widths[-1], 1))
+        image = image.convert("RGB")
+
+        variants = {}
+        # От большей ширины к меньшей: каждое уменьшение делается из предыдущего результата
+        for width in reversed(self.widths):
+            if image.width > width:
+                image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            for extension, (pillow_format, _, options) in FORMATS.items():
+                buffer = BytesIO()
+                image.save(buffer, format=pillow_format, **options)
+                variants[f"{width}.{extension}"] = buffer.getvalue()
+        return variants
+
+    def _evict(self):
+        """Удаляет давно не запрошенные картинки, пока кэш больше лимита (под self._lock)"""
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            digest, (size, _) = self._entries.popitem(last=False)
+            self._bytes -= size
+            shutil.rmtree(self._group_dir(digest), ignore_errors=True)
+            cache_event("poster_evict", False)
+
+    def _update_gauges(self):
+        INDEX_SIZE.labels("poster_cache", "items").set(len(self._entries))
+        INDEX_SIZE.labels("poster_cache", "bytes").set(self._bytes)
+
+    def _group_dir(self, digest):
+        return os.path.join(self.variants_dir, digest[:2], digest)
+
+    def _variant_path(self, digest, width, extension):
+        return os.path.join(self._group_dir(digest), f"{width}.{extension}")
+
+
+def register_posters(app, cache):
+    """Добавляет GET /poster"""
+
+    @app.route("/poster")
+    def poster():
+        src = request.args.get("src", "")
+        if not cache.allowed(src):
+            return jsonify({"error": "Недопустимый источник постера"}), 400
+        if Image is None:
+            return redirect(src)
+
+        width = cache.width_for(request.args.get("w", type=int))
+        # Браузеры, умеющие WebP, перечисляют его в Accept явно; */* не в счет
+        extension = "webp" if "image/webp" in request.headers.get("Accept", "") else "jpg"
+        result = cache.get(src, width, extension)
+        if result is None:
+            response = redirect(url_for("static", filename="default-poster.jpg"))
+            response.headers["Cache-Control"] = "public, max-age=300"
+            return response
+
+        digest, body, hit = result
+        response = make_response(body)
+        response.mimetype = FORMATS[extension][1]
+        response.set_etag(f"{digest[:32]}-{width}-{extension}")
+        response.headers["Cache-Control"] = f"public, max-age={POSTER_MAX_AGE}"
+        response.headers["X-Poster-Cache"] = "hit" if hit else "miss"
+        response.vary.add("Accept")
+        return response.make_conditional(request)
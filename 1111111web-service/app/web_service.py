@@ -1,80 +1,268 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, make_response, stream_template
 import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from time import time
 from dotenv import load_dotenv
 import requests
+from metrics import register_metrics, observe_stage, cache_event, count_error, get_logger, timed
+from admission import register_admission, call_timeout, budget_headers, BUDGET_HEADER
+from diagnostics import register_diagnostics, deep_sizeof
+from serialization import respond, decode, accept_header
+from jobs import JobRunner, job_response, register_jobs
+from posters import PosterCache, register_posters
+from assets import AssetPipeline, register_assets
+from fragments import FragmentCache, fragment_key
 
 load_dotenv()
 
 app = Flask(__name__)
+register_metrics(app)
+# Статика отдается с диска и не должна ждать в очереди за поисковыми запросами
+register_admission(app, exempt=("/health", "/metrics", "/debug/", "/assets/", "/static/"))
+register_diagnostics(app, components=lambda: {
+    "catalog_cache": deep_sizeof(catalog_cache),
+    "fragment_cache": deep_sizeof(fragment_cache._items),
+})
+logger = get_logger("web_service")
+
+# Статика с хешем содержимого в имени и заранее сжатыми копиями (собирается при старте)
+register_assets(app, AssetPipeline(app.static_folder))
+
+# Превью постеров на диске и задача их предварительной генерации (без Redis:
+# кэш постеров у каждой реплики свой, и задача тоже)
+poster_cache = PosterCache()
+job_runner = JobRunner()
+register_posters(app, poster_cache)
+register_jobs(app, job_runner)
 
 # Конфигурация сервисов
 SEARCH_SERVICE_URL = os.getenv("SEARCH_SERVICE_URL", "http://localhost:5002")
 DATABASE_SERVICE_URL = os.getenv("DATABASE_SERVICE_URL", "http://localhost:5001")
 
+# Кэш справочников каталога (жанры, страны, категории)
+CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", 300))
+CATALOG_VERSION_CHECK_INTERVAL = float(os.getenv("CATALOG_VERSION_CHECK_INTERVAL", 5))
+
+catalog_cache = {}  # resource -> {"body": ..., "etag": ..., "expires": ...}
+catalog_state = {"version": None, "checked_at": 0.0}
+# Защищает только словари выше; сетевые запросы выполняются без него
+catalog_lock = threading.Lock()
+# Один запрос в сервис БД на справочник: остальные ждут его результата
+catalog_fetch_locks = {resource: threading.Lock() for resource in ("genres", "countries", "categories")}
+
+# Отрендеренные фрагменты результатов /dml (ключ включает версию каталога)
+fragment_cache = FragmentCache()
+
+# Параллельные вызовы бэкендов при рендеринге страниц
+DML_DEADLINE = float(os.getenv("DML_DEADLINE", 3.0))
+backend_executor = ThreadPoolExecutor(max_workers=int(os.getenv("BACKEND_POOL_SIZE", 16)))
+
+def _check_catalog_version():
+    """Сбрасывает кэш справочников, если версия каталога в сервисе БД изменилась"""
+    with catalog_lock:
+        now = time()
+        if now - catalog_state["checked_at"] < CATALOG_VERSION_CHECK_INTERVAL:
+            return
+        # Проверку делает один поток, остальные до следующего интервала сразу идут дальше
+        catalog_state["checked_at"] = now
+    
+    try:
+        response = requests.get(f"{DATABASE_SERVICE_URL}/catalog/version", timeout=1)
+        if response.status_code != 200:
+            return
+        version = response.json().get("version")
+    except Exception as e:
+        count_error("catalog_version")
+        logger.warning("catalog_version_failed", error=str(e))
+        return
+    
+    with catalog_lock:
+        if version == catalog_state["version"]:
+            return
+        if catalog_state["version"] is not None:
+            logger.info("catalog_version_changed", old=catalog_state["version"], new=version)
+        catalog_state["version"] = version
+        catalog_cache.clear()
+    fragment_cache.clear()
+
+def _catalog_entry(resource):
+    """Свежая запись справочника из кэша или None"""
+    with catalog_lock:
+        entry = catalog_cache.get(resource)
+    return entry if entry is not None and entry["expires"] >= time() else None
+
+def _get_catalog_entry(resource, path):
+    """Возвращает справочник из кэша, при промахе или истечении TTL ходит в сервис БД"""
+    _check_catalog_version()
+    entry = _catalog_entry(resource)
+    cache_event("catalog", entry is not None)
+    if entry is not None:
+        return entry
+    
+    with catalog_fetch_locks[resource]:
+        # Пока ждали, справочник мог загрузить другой поток
+        entry = _catalog_entry(resource)
+        if entry is not None:
+            return entry
+        
+        version = catalog_state["version"]
+        response = requests.get(f"{DATABASE_SERVICE_URL}{path}", timeout=10)
+        if response.status_code != 200:
+            return None
+        
+        body = json.dumps(response.json(), ensure_ascii=False)
+        entry = {
+            "body": body,
+            "etag": hashlib.md5(f"{version}|{body}".encode()).hexdigest(),
+            "expires": time() + CATALOG_CACHE_TTL
+        }
+        with catalog_lock:
+            # Версия сменилась во время запроса: данные могли устареть, в кэш их не кладем
+            if catalog_state["version"] == version:
+                catalog_cache[resource] = entry
+        return entry
+
+def _cached_catalog_response(resource, path):
+    """Отдает справочник с ETag и Cache-Control"""
+    entry = _get_catalog_entry(resource, path)
+    if entry is None:
+        return jsonify([])
+    
+    result = make_response(entry["body"])
+    result.mimetype = "application/json"
+    result.set_etag(entry["etag"])
+    result.headers["Cache-Control"] = f"public, max-age={CATALOG_CACHE_TTL}"
+    # При совпадении If-None-Match вернется 304 без тела
+    return result.make_conditional(request)
+
+def _search_backend(search_params, timeout):
+    """Запрос к поисковому сервису с дедлайном, переданным дальше по цепочке"""
+    response = requests.get(
+        f"{SEARCH_SERVICE_URL}/search",
+        params=search_params,
+        timeout=timeout,
+        headers={BUDGET_HEADER: str(int(timeout * 1000)), **accept_header()}
+    )
+    if response.status_code == 200:
+        return decode(response)
+    return []
+
+def _timed_call(func, *args):
+    """Выполняет вызов и возвращает результат вместе со временем выполнения"""
+    start_time = time()
+    result = func(*args)
+    return result, time() - start_time
+
+def _start_parallel(calls):
+    """Запускает вызовы к бэкендам параллельно; результаты собирает _collect_parallel"""
+    start_time = time()
+    futures = {name: backend_executor.submit(_timed_call, func, *args) for name, (func, args) in calls.items()}
+    return futures, start_time
+
+def _collect_parallel(futures, start_time, deadline):
+    """
+    Ждет вызовы, запущенные _start_parallel, с общим дедлайном.
+    Возвращает результаты тех вызовов, что успели завершиться, и тайминги всех вызовов.
+    """
+    results = {}
+    timings = {}
+    for name, future in futures.items():
+        remaining = max(0.0, deadline - (time() - start_time))
+        try:
+            results[name], elapsed = future.result(timeout=remaining)
+            observe_stage(f"backend_{name}", elapsed)
+            timings[name] = round(elapsed * 1000, 1)
+        except FuturesTimeoutError:
+            count_error(f"backend_{name}_timeout")
+            timings[name] = "timeout"
+        except Exception as e:
+            count_error(f"backend_{name}")
+            timings[name] = f"error ({type(e).__name__})"
+            logger.error("backend_call_failed", call=name, error=str(e))
+    
+    return results, timings, time() - start_time
+
+def _poster_sources(job):
+    """Уникальные ссылки на постеры всего каталога (страницами из сервиса БД)"""
+    urls = {}
+    cursor = None
+    while cursor != 0:
+        response = requests.get(
+            f"{DATABASE_SERVICE_URL}/movies/posters",
+            params={"cursor": cursor or 0, "count": 1000},
+            timeout=10
+        )
+        response.raise_for_status()
+        page = response.json()
+        cursor = page["cursor"]
+        for _, url in page["items"]:
+            if poster_cache.allowed(url):
+                urls[url] = True
+        job.progress(done=len(urls))
+    return list(urls)
+
+def _poster_prefetch_job(job):
+    """Превью постеров для всего каталога: исходники, которых еще нет в кэше, скачиваются по одному разу"""
+    job.progress(stage="list")
+    urls = _poster_sources(job)
+    job.progress(stage="render", total=len(urls))
+    counts = poster_cache.prefetch(urls, progress=lambda done: job.progress(done=done))
+    print(f"🖼 Превью постеров: {counts}")
+    return dict(counts, posters=len(urls), cache=poster_cache.stats())
+
+@app.route("/posters/prefetch", methods=["POST"])
+def prefetch_posters():
+    """Запускает генерацию превью (202 и id задачи); ?wait=<секунды> дожидается результата"""
+    return job_response(job_runner, "poster_prefetch", _poster_prefetch_job)
+
 @app.route("/")
 def index():
     return render_template("home.html")
 
+def _results_fragment(query, filters, search_mode):
+    """
+    Фрагмент с результатами для потоковой страницы /dml. Поиск запускается
+    сразу, а шаблон вызывает возвращенную функцию, когда каркас страницы уже
+    отправлен. Готовый фрагмент берется из кэша, и тогда поиск не нужен вовсе.
+    """
+    if not query:
+        return lambda: render_template("dml_results.html", movies=[])
+    
+    _check_catalog_version()
+    key = fragment_key("dml_results", query, dict(filters, search_mode=search_mode), catalog_state["version"])
+    cached = fragment_cache.get(key)
+    if cached is not None:
+        logger.info("render_dml", query=query, fragment="hit")
+        return lambda: cached
+    
+    deadline = call_timeout(DML_DEADLINE)
+    search_params = {"query": query, **filters, "search_mode": search_mode}
+    futures, start_time = _start_parallel({"search": (_search_backend, (search_params, deadline))})
+    
+    def render():
+        results, timings, elapsed = _collect_parallel(futures, start_time, deadline)
+        with timed("render_results"):
+            html = render_template("dml_results.html", movies=results.get("search", []))
+        # Пустая выдача может означать ошибку поиска: кэшируются только найденные фильмы
+        if results.get("search"):
+            fragment_cache.set(key, html)
+        logger.info("render_dml", query=query, fragment="miss", took_ms=round(elapsed * 1000, 1), calls=timings)
+        return html
+    
+    return render
+
 @app.route("/dml")
 def search_page():
     query = request.args.get("query", "")
-    year_filter = request.args.get("year", "")
-    genre_filter = request.args.get("genre", "")
-    movie_type = request.args.get("type", "")
-    country_filter = request.args.get("country", "")
-    category_filter = request.args.get("category", "")
+    filters = {name: request.args.get(name, "") for name in ("year", "genre", "type", "country", "category")}
     search_mode = request.args.get("search_mode", "redis")  # По умолчанию используем Redis
     
-    if not query:
-        return render_template("dml.html", 
-                            movies=[], 
-                            query="",
-                            current_year=year_filter,
-                            current_genre=genre_filter,
-                            current_type=movie_type,
-                            current_country=country_filter,
-                            current_category=category_filter,
-                            current_mode=search_mode)
-    
-    try:
-        # Поиск фильмов через поисковой сервис
-        search_params = {
-            "query": query,
-            "year": year_filter,
-            "genre": genre_filter,
-            "type": movie_type,
-            "country": country_filter,
-            "category": category_filter,
-            "search_mode": search_mode
-        }
-        
-        response = requests.get(f"{SEARCH_SERVICE_URL}/search", params=search_params)
-        if response.status_code == 200:
-            movies = response.json()
-        else:
-            movies = []
-            
-        return render_template("dml.html", 
-                             movies=movies, 
-                             query=query,
-                             current_year=year_filter,
-                             current_genre=genre_filter,
-                             current_type=movie_type,
-                             current_country=country_filter,
-                             current_category=category_filter,
-                             current_mode=search_mode)
-    except Exception as e:
-        print(f"Ошибка поиска: {str(e)}")
-        return render_template("dml.html", 
-                             movies=[], 
-                             query=query,
-                             error="Произошла ошибка при поиске фильмов",
-                             current_year=year_filter,
-                             current_genre=genre_filter,
-                             current_type=movie_type,
-                             current_country=country_filter,
-                             current_category=category_filter,
-                             current_mode=search_mode)
+    # Каркас страницы с фильтрами уходит клиенту сразу, а результаты
+    # дописываются в поток, когда ответит поиск (или сразу из кэша фрагментов)
+    return stream_template("dml.html", results=_results_fragment(query, filters, search_mode))
 
 @app.route("/search_movies")
 def api_search():
@@ -85,6 +273,7 @@ def api_search():
     country_filter = request.args.get("country", "")
     category_filter = request.args.get("category", "")
     search_mode = request.args.get("search_mode", "redis")  # По умолчанию используем Redis
+    user_id = request.args.get("user_id", "")
     
     if not query:
         return jsonify([])
@@ -98,61 +287,177 @@ def api_search():
             "type": movie_type,
             "country": country_filter,
             "category": category_filter,
-            "search_mode": search_mode
+            "search_mode": search_mode,
+            "user_id": user_id
         }
         
-        response = requests.get(f"{SEARCH_SERVICE_URL}/search", params=search_params)
+        response = requests.get(
+            f"{SEARCH_SERVICE_URL}/search",
+            params=search_params,
+            timeout=call_timeout(10),
+            headers={**budget_headers(), **accept_header()}
+        )
         if response.status_code == 200:
-            return jsonify(response.json())
+            return respond(decode(response))
+        elif response.status_code in (429, 503):
+            # Перегрузку поискового сервиса отдаем клиенту как есть, чтобы он повторил позже
+            result = jsonify([])
+            if "Retry-After" in response.headers:
+                result.headers["Retry-After"] = response.headers["Retry-After"]
+            return result, response.status_code
         else:
             return jsonify([])
     except Exception as e:
-        print(f"Ошибка поиска: {str(e)}")
+        count_error("search")
+        logger.error("search_failed", error=str(e))
         return jsonify([])
 
-@app.route("/get_genres")
-def get_genres():
+@app.route("/suggest")
+def suggest():
+    # Подсказки идут напрямую в сервис БД, минуя семантический поиск
+    prefix = request.args.get("prefix", request.args.get("query", ""))
+    limit = request.args.get("limit", 10, type=int)
+    
+    if not prefix.strip():
+        return jsonify([])
+    
     try:
-        response = requests.get(f"{DATABASE_SERVICE_URL}/genres")
+        response = requests.get(
+            f"{DATABASE_SERVICE_URL}/suggest",
+            params={"prefix": prefix, "limit": limit, "fuzzy": request.args.get("fuzzy", "0")},
+            timeout=call_timeout(1),
+            headers=budget_headers()
+        )
         if response.status_code == 200:
             return jsonify(response.json())
         return jsonify([])
     except Exception as e:
-        print(f"Ошибка получения жанров: {str(e)}")
+        count_error("suggest")
+        logger.error("suggest_failed", error=str(e))
+        return jsonify([])
+
+@app.route("/get_genres")
+def get_genres():
+    try:
+        return _cached_catalog_response("genres", "/genres")
+    except Exception as e:
+        count_error("genres")
+        logger.error("genres_failed", error=str(e))
         return jsonify([])
 
 @app.route("/get_countries")
 def get_countries():
     try:
-        response = requests.get(f"{DATABASE_SERVICE_URL}/countries")
-        if response.status_code == 200:
-            return jsonify(response.json())
-        return jsonify([])
+        return _cached_catalog_response("countries", "/countries")
     except Exception as e:
-        print(f"Ошибка получения стран: {str(e)}")
+        count_error("countries")
+        logger.error("countries_failed", error=str(e))
         return jsonify([])
 
 @app.route("/get_categories")
 def get_categories():
     try:
-        response = requests.get(f"{DATABASE_SERVICE_URL}/categories")
-        if response.status_code == 200:
-            return jsonify(response.json())
-        return jsonify([])
+        return _cached_catalog_response("categories", "/categories")
     except Exception as e:
-        print(f"Ошибка получения категорий: {str(e)}")
+        count_error("categories")
+        logger.error("categories_failed", error=str(e))
         return jsonify([])
 
 @app.route("/get_movie/<movie_id>")
 def get_movie(movie_id):
     try:
-        response = requests.get(f"{DATABASE_SERVICE_URL}/movies/{movie_id}")
+        response = requests.get(
+            f"{DATABASE_SERVICE_URL}/movies/{movie_id}",
+            timeout=call_timeout(5),
+            headers={**budget_headers(), **accept_header()}
+        )
         if response.status_code == 200:
-            return jsonify(response.json())
+            return respond(decode(response))
         return jsonify({"error": "Movie not found"}), 404
     except Exception as e:
-        print(f"Ошибка получения фильма: {str(e)}")
+        count_error("get_movie")
+        logger.error("get_movie_failed", error=str(e))
         return jsonify({"error": "Internal server error"}), 500
 
+@app.route("/top/<metric>")
+def get_top(metric):
+    # Топы отдает сервис БД из готовых лидербордов, поисковый сервис не участвует
+    try:
+        response = requests.get(
+            f"{DATABASE_SERVICE_URL}/leaderboards/{metric}",
+            params={key: request.args[key] for key in ("facet", "value", "limit", "offset") if key in request.args},
+            timeout=call_timeout(2),
+            headers=budget_headers()
+        )
+        result = make_response(response.content, response.status_code)
+        result.mimetype = "application/json"
+        result.headers["Cache-Control"] = "public, max-age=60"
+        return result
+    except Exception as e:
+        count_error("top")
+        logger.error("top_failed", metric=metric, error=str(e))
+        return jsonify([])
+
+@app.route("/get_similar_movies/<int:movie_id>")
+def get_similar_movies(movie_id):
+    try:
+        response = requests.get(
+            f"{SEARCH_SERVICE_URL}/similar/{movie_id}",
+            params={"top_k": request.args.get("top_k", 10)},
+            timeout=call_timeout(2),
+            headers=budget_headers()
+        )
+        if response.status_code == 200:
+            return jsonify(response.json())
+        return jsonify([])
+    except Exception as e:
+        count_error("similar")
+        logger.error("similar_failed", movie_id=movie_id, error=str(e))
+        return jsonify([])
+
+def _proxy_like(path):
+    """Пересылает лайк в поисковый сервис (он сохраняет лайк в БД и обновляет профиль)"""
+    data = request.get_json(silent=True)
+    if not data or "movie_id" not in data:
+        return jsonify({"error": "Не указан ID фильма"}), 400
+    
+    try:
+        response = requests.post(
+            f"{SEARCH_SERVICE_URL}{path}",
+            json=data,
+            timeout=call_timeout(5),
+            headers=budget_headers()
+        )
+        return jsonify(response.json()), response.status_code
+    except Exception as e:
+        count_error("like")
+        logger.error("like_failed", path=path, error=str(e))
+        return jsonify({"error": "Ошибка при обработке лайка"}), 500
+
+@app.route("/like_movie", methods=["POST"])
+def like_movie():
+    return _proxy_like("/like_movie")
+
+@app.route("/unlike_movie", methods=["POST"])
+def unlike_movie():
+    return _proxy_like("/unlike_movie")
+
+@app.route("/is_movie_liked/<user_id>/<movie_id>")
+def is_movie_liked(user_id, movie_id):
+    try:
+        response = requests.get(
+            f"{DATABASE_SERVICE_URL}/movies/{movie_id}/likes",
+            params={"user_id": user_id},
+            timeout=call_timeout(2),
+            headers=budget_headers()
+        )
+        if response.status_code == 200:
+            return jsonify(response.json())
+        return jsonify({"is_liked": False})
+    except Exception as e:
+        count_error("is_movie_liked")
+        logger.error("is_movie_liked_failed", error=str(e))
+        return jsonify({"is_liked": False})
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000) 
\ No newline at end of file
@@ -0,0 +1,209 @@
+"""
+Прокси постеров веб-сервиса (posters.py) против локального сервера картинок.
+
+Вместо хоста постеров поднимается Flask-приложение, которое отдает
+сгенерированные JPEG размером с настоящие постеры (--origin-delay имитирует
+задержку источника) и считает обращения к каждой картинке. Замеряются:
+  - первый запрос постера (скачивание и построение вариантов) и повторные;
+  - число обращений к источнику: каждый исходник должен скачиваться один раз,
+    в том числе при одновременных запросах одного постера;
+  - размер вариантов по сравнению с исходником;
+  - 304 на повторный запрос с If-None-Match;
+  - предварительная генерация (prefetch) и вытеснение при маленьком лимите,
+    а также восстановление индекса после перезапуска.
+
+Пример:
+    python benchmarks/poster_cache.py --posters 200 --origin-delay 0.05
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from time import perf_counter, sleep
+
+import requests
+from flask import Flask, Response
+
+from run_benchmarks import COMMON_DIR, ROOT_DIR, measure, quiet, start_server
+
+sys.path[:0] = [os.path.join(ROOT_DIR, "1111111web-service", "app"), COMMON_DIR]
+from PIL import Image, ImageDraw  # noqa: E402
+import posters  # noqa: E402
+from posters import PosterCache, register_posters  # noqa: E402
+
+WEBP_ACCEPT = {"Accept": "image/avif,image/webp,*/*"}
+
+
+def make_poster(seed, width=1000, height=1500):
+    """JPEG размером с исходный постер: градиент, фигуры и шум, чтобы сжатие было реалистичным"""
+    rng = random.Random(seed)
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        size = rng.randint(20, 300)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x, y, x + size, y + size), fill=color)
+    noise = Image.effect_noise((width, height), 40).convert("RGB")
+    image = Image.blend(image, noise, 0.2)
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def origin_app(images, delay):
+    """Сервер-заглушка хоста постеров; hits — сколько раз запросили каждую картинку"""
+    app = Flask("poster_origin")
+    hits = Counter()
+    lock = threading.Lock()
+
+    @app.route("/images/<int:index>/orig")
+    def image(index):
+        with lock:
+            hits[index] += 1
+        if delay:
+            sleep(delay)
+        if index >= len(images):
+            return Response(status=404)
+        return Response(images[index], mimetype="image/jpeg")
+
+    return app, hits
+
+
+def web_app(cache):
+    app = Flask("web_posters", static_folder=None)
+    app.add_url_rule("/static/<path:filename>", "static", lambda filename: Response(status=404))
+    register_posters(app, cache)
+    return app
+
+
+def run(args):
+    images = [make_poster(seed) for seed in range(args.posters)]
+    origin, hits = origin_app(images, args.origin_delay)
+    origin_server, origin_url = start_server(origin)
+    root = tempfile.mkdtemp(prefix="poster_cache_")
+    urls = [f"{origin_url}/images/{i}/orig" for i in range(args.posters)]
+
+    try:
+        cache = PosterCache(root=root, max_bytes=10 ** 12, allowed_hosts={"127.0.0.1"})
+        web_server, web_url = start_server(web_app(cache))
+        session = requests.Session()
+
+        def get(url, width, headers=None):
+            return session.get(f"{web_url}/poster", params={"src": url, "w": width}, headers=headers,
+                               allow_redirects=False)
+
+        results = {"params": vars(args)}
+
+        # Первый запрос каждого постера: скачивание и построение всех вариантов
+        results["cold"] = measure(lambda url: get(url, 342, WEBP_ACCEPT), urls)
+
+        # Повторные запросы: все ширины и оба формата без обращений к источнику
+        variants = [(url, width, accept) for url in urls for width in posters.POSTER_WIDTHS
+                    for accept in (WEBP_ACCEPT, None)]
+        random.Random(1).shuffle(variants)
+        results["warm"] = measure(lambda item: get(*item), variants)
+
+        sample = get(urls[0], 500, WEBP_ACCEPT)
+        results["headers"] = {key: sample.headers.get(key) for key in ("Content-Type", "Cache-Control", "ETag", "Vary")}
+        results["not_modified_status"] = get(urls[0], 500, {**WEBP_ACCEPT, "If-None-Match": sample.headers["ETag"]}).status_code
+
+        sizes = {}
+        for width in posters.POSTER_WIDTHS:
+            for name, headers in (("webp", WEBP_ACCEPT), ("jpg", None)):
+                sizes[f"{width}.{name}"] = round(sum(len(get(url, width, headers).content) for url in urls[:20]) / 20)
+        results["bytes"] = {"original": round(sum(len(image) for image in images[:20]) / 20), "variants": sizes}
+
+        # Одновременные запросы нового постера: одно скачивание на всех
+        extra_url = f"{origin_url}/images/{args.posters - 1}/orig?copy=1"
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            statuses = Counter(pool.map(lambda _: get(extra_url, 160).status_code, range(args.concurrency)))
+        results["single_flight"] = {"requests": args.concurrency, "statuses": dict(statuses),
+                                    "origin_fetches": hits[args.posters - 1] - 1}
+
+        results["origin"] = {
+            "sources": args.posters,
+            "max_fetches_per_source": max(hits[i] for i in range(args.posters - 1)),
+            "total_fetches": sum(hits.values()),
+        }
+        # Одинаковая картинка по второй ссылке не заняла места повторно
+        results["dedup"] = {"images": cache.stats()["images"], "sources": cache.stats()["sources"]}
+
+        # Недоступный источник: редирект на заглушку и одна попытка до POSTER_RETRY_AFTER
+        missing = f"{origin_url}/images/{args.posters + 5}/orig"
+        results["missing"] = {
+            "status": [get(missing, 342).status_code for _ in range(3)],
+            "origin_fetches": hits[args.posters + 5],
+        }
+        results["rejected_host_status"] = get("http://example.com/poster.jpg", 342).status_code
+        web_server.shutdown()
+
+        # Перезапуск: индекс восстанавливается с диска, источник не нужен
+        restarted = PosterCache(root=root, max_bytes=10 ** 12, allowed_hosts={"127.0.0.1"})
+        before = sum(hits.values())
+        start = perf_counter()
+        counts = restarted.prefetch(urls)
+        results["restart_prefetch"] = {"counts": counts, "seconds": round(perf_counter() - start, 3),
+                                       "origin_fetches": sum(hits.values()) - before}
+
+        # Вытеснение: лимит на треть каталога, prefetch всего каталога дважды
+        per_image = cache.stats()["bytes"] / cache.stats()["images"]
+        limit = int(per_image * args.posters / 3)
+        small_root = tempfile.mkdtemp(prefix="poster_cache_small_")
+        try:
+            small = PosterCache(root=small_root, max_bytes=limit, allowed_hosts={"127.0.0.1"})
+            before = sum(hits.values())
+            start = perf_counter()
+            first = small.prefetch(urls)
+            prefetch_time = perf_counter() - start
+            second = small.prefetch(urls[-args.posters // 4:])
+            disk = sum(os.path.getsize(os.path.join(path, name))
+                       for path, _, names in os.walk(os.path.join(small_root, "variants")) for name in names)
+            results["eviction"] = {
+                "max_bytes": limit,
+                "disk_bytes": disk,
+                "images": small.stats()["images"],
+                "prefetch": first,
+                "prefetch_per_s": round(args.posters / prefetch_time, 1),
+                # Последняя четверть каталога только что построена и не вытеснена
+                "recent_again": second,
+                "origin_fetches": sum(hits.values()) - before,
+            }
+        finally:
+            shutil.rmtree(small_root, ignore_errors=True)
+    finally:
+        origin_server.shutdown()
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк прокси постеров на локальном сервере картинок")
+    parser.add_argument("--posters", type=int, default=100, help="Сколько разных постеров")
+    parser.add_argument("--origin-delay", type=float, default=0.02, help="Задержка ответа источника, с")
+    parser.add_argument("--concurrency", type=int, default=16, help="Одновременных запросов одного постера")
+    parser.add_argument("--output", help="Файл для JSON-отчета (по умолчанию stdout)")
+    parser.add_argument("--verbose", action="store_true", help="Не глушить вывод сервисов")
+    args = parser.parse_args()
+
+    with quiet(args.verbose):
+        results = run(args)
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"✅ Результаты сохранены в {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
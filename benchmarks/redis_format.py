@@ -0,0 +1,139 @@
+"""
+Сравнение форматов хранения фильмов в Redis: full и compact.
+
+Для каждого формата каталог загружается через save_movies_bulk, после чего
+замеряются:
+  - память: прирост used_memory, MEMORY USAGE и OBJECT ENCODING по выборке
+    ключей (только на настоящем Redis, fakeredis этих команд не знает);
+  - объем данных, которые уходят клиенту на один фильм в списке (HGETALL
+    хеша — столько же отдают FT.SEARCH и лидерборды) и в карточке фильма;
+  - задержки и пропускная способность этих двух чтений.
+
+Пример:
+    python benchmarks/redis_format.py --redis-url redis://localhost:6379/15 --movies 20000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from argparse import Namespace
+
+from run_benchmarks import generate_catalog, measure, patch_backends, quiet
+
+
+def memory_report(client, movie_ids, sample):
+    """Память по выборке ключей; None, если сервер не поддерживает MEMORY/OBJECT"""
+    usage = 0
+    encodings = {}
+    try:
+        for movie_id in sample:
+            for key in (f"movie:{movie_id}", f"desc:{movie_id}"):
+                size = client.memory_usage(key)
+                if size is None:
+                    continue
+                usage += size
+                if key.startswith("movie:"):
+                    encoding = client.object("encoding", key)
+                    encodings[encoding] = encodings.get(encoding, 0) + 1
+    except Exception:
+        return None
+    return {
+        "memory_usage_per_movie_bytes": round(usage / len(sample), 1),
+        "hash_encodings": encodings,
+    }
+
+
+def used_memory(client):
+    try:
+        return int(client.info("memory")["used_memory"])
+    except Exception:
+        return None
+
+
+def run_format(movie_format, catalog, args):
+    from redis_client import RedisMovieClient
+
+    with quiet(args.verbose):
+        client = RedisMovieClient(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", 6379)),
+            db=int(os.getenv("REDIS_DB", 0)),
+            movie_format=movie_format,
+        )
+        client.clear_movies()
+        before = used_memory(client.redis_client)
+        client.save_movies_bulk(catalog)
+        after = used_memory(client.redis_client)
+
+    rng = random.Random(args.seed)
+    movie_ids = [movie["_id"] for movie in catalog]
+    sample = rng.sample(movie_ids, min(args.sample, len(movie_ids)))
+    reads = [rng.choice(movie_ids) for _ in range(args.reads)]
+
+    raw = client.binary_client
+    list_bytes = sum(
+        sum(len(field) + len(value) for field, value in raw.hgetall(f"movie:{movie_id}").items())
+        for movie_id in sample
+    )
+    detail_bytes = list_bytes + sum(len(raw.get(f"desc:{movie_id}") or b"") for movie_id in sample)
+
+    report = {
+        "used_memory_delta_bytes": after - before if before is not None and after is not None else None,
+        "list_response_bytes_per_movie": round(list_bytes / len(sample), 1),
+        "detail_response_bytes_per_movie": round(detail_bytes / len(sample), 1),
+        "memory": memory_report(client.redis_client, movie_ids, sample),
+        # Список: только хеш; карточка: хеш и (в compact) сжатые описания
+        "list_get": measure(lambda movie_id: client.redis_client.hgetall(f"movie:{movie_id}"), reads),
+        "detail_get": measure(client._read_movie, reads),
+    }
+
+    with quiet(args.verbose):
+        client.clear_movies()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память и скорость чтения форматов full и compact")
+    parser.add_argument("--movies", type=int, default=5000)
+    parser.add_argument("--reads", type=int, default=5000, help="Сколько чтений замерять")
+    parser.add_argument("--sample", type=int, default=500, help="Выборка ключей для замеров памяти и объема")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--redis-url", help="Настоящий Redis (redis://host:port/db) вместо fakeredis")
+    parser.add_argument("--output", help="Файл для JSON-отчета (по умолчанию stdout)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    os.environ.setdefault("NEAR_CACHE_TRACKING", "0")
+    backends = patch_backends(Namespace(mongo_uri=None, redis_url=args.redis_url, mongo_db="bench", verbose=args.verbose))
+    catalog = generate_catalog(args.movies, args.seed)
+
+    results = {
+        "params": {"movies": args.movies, "reads": args.reads, "sample": args.sample},
+        "redis": backends["redis"],
+        "formats": {movie_format: run_format(movie_format, catalog, args) for movie_format in ("full", "compact")},
+    }
+
+    full, compact = results["formats"]["full"], results["formats"]["compact"]
+    summary = {
+        "list_bytes_ratio": round(compact["list_response_bytes_per_movie"] / full["list_response_bytes_per_movie"], 3),
+        "list_qps_ratio": round(compact["list_get"]["qps"] / full["list_get"]["qps"], 3),
+        "detail_qps_ratio": round(compact["detail_get"]["qps"] / full["detail_get"]["qps"], 3),
+    }
+    if full["memory"] and compact["memory"]:
+        summary["memory_ratio"] = round(
+            compact["memory"]["memory_usage_per_movie_bytes"] / full["memory"]["memory_usage_per_movie_bytes"], 3
+        )
+    results["compact_vs_full"] = summary
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"✅ Результаты сохранены в {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Нагрузочный прогон по журналу запросов поискового сервиса (query_log.py).
+
+Запросы из журнала (вместе с ротированными файлами) отправляются на /search
+целевого сервиса в записанном темпе, ускоренном в --speed раз, или с
+постоянной частотой --rate. Отчет: перцентили задержки по режимам, коды
+ответов, доля деградированных ответов (X-Degraded), отставание от
+расписания и задержки, записанные в самом журнале, для сравнения.
+
+Пример:
+    python benchmarks/replay_queries.py query_logs/queries.log --target http://localhost:5002 --speed 4
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, sleep
+
+import numpy as np
+import requests
+
+from run_benchmarks import COMMON_DIR, SEARCH_APP_DIR, latency_stats
+
+sys.path[:0] = [SEARCH_APP_DIR, COMMON_DIR]
+from query_log import read_entries  # noqa: E402
+
+
+def load_entries(path, mode=None, limit=None):
+    """Записи журнала по времени; mode оставляет только один режим поиска"""
+    entries = [entry for entry in read_entries(path) if entry.get("q") and (mode is None or entry.get("m") == mode)]
+    entries.sort(key=lambda entry: entry.get("t", 0))
+    return entries[:limit] if limit else entries
+
+
+def schedule(entries, speed=1.0, rate=None):
+    """Смещения отправки от начала прогона в секундах"""
+    if rate:
+        return [i / rate for i in range(len(entries))]
+    start = entries[0].get("t", 0)
+    return [(entry.get("t", start) - start) / speed for entry in entries]
+
+
+def to_params(entry):
+    params = {
+        "query": entry["q"],
+        "year": entry.get("y", ""),
+        "genre": entry.get("g", ""),
+        "top_k": entry.get("k", 10),
+        "search_mode": entry.get("m", "semantic"),
+    }
+    params.update(entry.get("f", {}))
+    return params
+
+
+def replay(entries, offsets, args):
+    """Отправляет запросы по расписанию из пула потоков и собирает результаты"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=args.concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    latencies = defaultdict(list)
+    statuses = Counter()
+    degraded = Counter()
+    lags = []
+    lock = threading.Lock()
+
+    def send(entry, lag):
+        params = to_params(entry)
+        call_start = perf_counter()
+        try:
+            response = session.get(f"{args.target}/search", params=params, timeout=args.timeout)
+            status = str(response.status_code)
+            source = response.headers.get("X-Degraded")
+        except requests.exceptions.RequestException as e:
+            status, source = type(e).__name__, None
+        elapsed = perf_counter() - call_start
+        with lock:
+            latencies[params["search_mode"]].append(elapsed)
+            statuses[status] += 1
+            lags.append(lag)
+            if source:
+                degraded[source] += 1
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for entry, offset in zip(entries, offsets):
+            delay = offset - (perf_counter() - start)
+            if delay > 0:
+                sleep(delay)
+            pool.submit(send, entry, max(-delay, 0.0))
+    total_time = perf_counter() - start
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "sent": len(entries),
+        "duration_s": round(total_time, 2),
+        "latency": latency_stats(all_latencies, total_time),
+        "by_mode": {mode: latency_stats(values, total_time) for mode, values in latencies.items()},
+        "statuses": dict(statuses),
+        "degraded": dict(degraded),
+        # Насколько позже расписания запрос уходил в пул: рост — клиент не успевает за темпом
+        "schedule_lag_p99_ms": round(float(np.percentile(np.array(lags) * 1000, 99)), 3),
+    }
+
+
+def key_reuse(entries, field):
+    """Доля запросов, ключ которых уже встречался раньше: потолок попаданий в бесконечный кэш"""
+    seen = set()
+    repeats = 0
+    for entry in entries:
+        key = (entry.get(field) or entry["q"], entry.get("y", ""), entry.get("g", ""), entry.get("k", 10))
+        repeats += key in seen
+        seen.add(key)
+    return round(repeats / len(entries), 4)
+
+
+def recorded_stats(entries):
+    """Задержки и попадания в кэш по данным самого журнала"""
+    values = np.array([entry["ms"] for entry in entries if "ms" in entry])
+    span = entries[-1].get("t", 0) - entries[0].get("t", 0)
+    cache = Counter(entry.get("c") or "none" for entry in entries)
+    return {
+        "count": len(entries),
+        "rate_qps": round(len(entries) / span, 2) if span > 0 else None,
+        "p50_ms": round(float(np.percentile(values, 50)), 3) if values.size else None,
+        "p99_ms": round(float(np.percentile(values, 99)), 3) if values.size else None,
+        "cache": dict(cache),
+        # Сколько дает нормализация запросов: повторы по исходному и по переписанному тексту
+        "key_reuse": {"raw": key_reuse(entries, "q"), "rewritten": key_reuse(entries, "n")},
+        "rewritten_share": round(sum("n" in entry for entry in entries) / len(entries), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Прогон записанных поисковых запросов против сервиса")
+    parser.add_argument("log", help="Файл журнала запросов (ротированные .1, .2 ... читаются тоже)")
+    parser.add_argument("--target", default=os.getenv("SEARCH_SERVICE_URL", "http://localhost:5002"))
+    parser.add_argument("--speed", type=float, default=1.0, help="Во сколько раз быстрее записанного темпа")
+    parser.add_argument("--rate", type=float, help="Постоянная частота запросов в секунду вместо записанного темпа")
+    parser.add_argument("--mode", choices=["semantic", "redis"], help="Только один режим поиска")
+    parser.add_argument("--limit", type=int, help="Сколько запросов отправить")
+    parser.add_argument("--concurrency", type=int, default=32, help="Максимум одновременных запросов")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--output", help="Файл для JSON-отчета (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    entries = load_entries(args.log, args.mode, args.limit)
+    if not entries:
+        print(f"❌ В журнале {args.log} нет запросов")
+        return 1
+
+    offsets = schedule(entries, args.speed, args.rate)
+    print(f"🚀 {len(entries)} запросов на {args.target} за ~{offsets[-1]:.1f} с", file=sys.stderr)
+
+    results = {
+        "params": {"target": args.target, "speed": args.speed, "rate": args.rate, "concurrency": args.concurrency},
+        "recorded": recorded_stats(entries),
+        "replay": replay(entries, offsets, args),
+    }
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"✅ Результаты сохранены в {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
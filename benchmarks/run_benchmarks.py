@@ -0,0 +1,406 @@
+"""
+Бенчмарк поисковой системы на синтетическом каталоге.
+
+Поднимает сервисы поиска и БД в одном процессе поверх mongomock/fakeredis
+(или настоящих MongoDB/Redis, если переданы --mongo-uri/--redis-url),
+генерирует каталог в формате clear_and_load_movies и случайные эмбеддинги,
+после чего замеряет:
+  - время загрузки в MongoDB и скорость save_movies_bulk;
+  - время старта поисковой системы (TurboMovieSearch);
+  - задержки TurboMovieSearch.search без кэша и с кэшем (перцентили и QPS),
+    а также доля попаданий в кэш для тех же запросов, набранных иначе;
+  - задержки /search через HTTP в режимах semantic и redis.
+
+Результаты выводятся в JSON.
+
+Пример:
+    python benchmarks/run_benchmarks.py --movies 20000 --queries 300 --fake-encoder --output bench.json
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+from time import perf_counter, time
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEARCH_APP_DIR = os.path.join(ROOT_DIR, "search-service", "app")
+DATABASE_APP_DIR = os.path.join(ROOT_DIR, "database-service", "app")
+# Общие модули сервисов (в образах копируются в app/)
+COMMON_DIR = os.path.join(ROOT_DIR, "common")
+
+GENRES = [
+    "драма", "комедия", "боевик", "триллер", "ужасы", "фантастика", "фэнтези",
+    "мелодрама", "криминал", "детектив", "приключения", "аниме", "мультфильм",
+    "семейный", "биография", "история", "военный", "документальный", "спорт", "мюзикл",
+]
+COUNTRIES = ["Россия", "СССР", "США", "Япония", "Франция", "Великобритания", "Германия", "Корея Южная", "Италия", "Индия"]
+CATEGORIES = ["Фильмы", "Сериалы", "Мультфильмы", "Аниме", "Документальные"]
+TYPES = ["movie", "tv-series", "cartoon", "anime", "animated-series"]
+WORDS = [
+    "тайна", "город", "ночь", "любовь", "война", "путешествие", "остров", "звезда", "последний",
+    "дом", "дорога", "море", "тень", "сердце", "король", "зима", "лето", "охота", "время", "мир",
+    "корабль", "планета", "друг", "семья", "побег", "игра", "огонь", "лес", "небо", "память",
+]
+QUERY_TEMPLATES = [
+    "{genre} про {word}",
+    "{word} и {word2}",
+    "{genre} {year}",
+    "фильм про {word} {year}",
+    "{name}",
+    "смешной {genre} про {word}",
+]
+
+
+class FakeEncoder:
+    """Детерминированный кодировщик запросов: случайный вектор, зависящий от текста."""
+
+    def __init__(self, dim):
+        self.dim = dim
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def encode(self, text, convert_to_numpy=True, normalize_embeddings=True):
+        seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        if normalize_embeddings:
+            vector /= np.linalg.norm(vector)
+        return vector
+
+
+def generate_catalog(size, seed):
+    """Генерирует фильмы в нормализованной схеме MongoMovieClient.clear_and_load_movies"""
+    rng = random.Random(seed)
+    movies = []
+    for movie_id in range(1, size + 1):
+        name = " ".join(rng.sample(WORDS, rng.randint(1, 3))).capitalize()
+        year = rng.randint(1950, 2024)
+        category = rng.choice(CATEGORIES)
+        description = " ".join(rng.choices(WORDS, k=rng.randint(30, 120))).capitalize() + "."
+        movies.append({
+            "_id": movie_id,
+            "name": name,
+            "type": rng.choice(TYPES),
+            "year": year,
+            "description": description,
+            "shortDescription": description[:120],
+            "status": "",
+            "rating": round(rng.uniform(0, 10), 3),
+            "ageRating": rng.choice([None, 0, 6, 12, 16, 18]),
+            "poster": f"https://image.example.org/posters/{movie_id}/orig",
+            "genres": rng.sample(GENRES, rng.randint(1, 3)),
+            "countries": rng.sample(COUNTRIES, rng.randint(1, 2)),
+            "releaseYear": year,
+            "isSeries": category == "Сериалы",
+            "category": category,
+        })
+    return movies
+
+
+def generate_queries(count, catalog, seed):
+    """Генерирует уникальные поисковые запросы по шаблонам"""
+    rng = random.Random(seed + 1)
+    queries = []
+    seen = set()
+    while len(queries) < count:
+        query = rng.choice(QUERY_TEMPLATES).format(
+            genre=rng.choice(GENRES),
+            word=rng.choice(WORDS),
+            word2=rng.choice(WORDS),
+            year=rng.randint(1960, 2024),
+            name=rng.choice(catalog)["name"],
+        )
+        if query not in seen:
+            seen.add(query)
+            queries.append(query)
+    return queries
+
+
+def query_variant(query, rng):
+    """Тот же запрос, набранный иначе: регистр, пробелы, ё, стоп-слово или опечатка"""
+    words = query.split()
+    kind = rng.choice(["upper", "spaces", "yo", "stopword", "typo"])
+    if kind == "upper":
+        return query.upper()
+    if kind == "spaces":
+        return "  " + "   ".join(words) + " "
+    if kind == "yo" and "е" in query:
+        return query.replace("е", "ё", 1)
+    if kind == "stopword":
+        return "фильм " + query
+    longest = max(range(len(words)), key=lambda i: len(words[i]))
+    word = words[longest]
+    if len(word) > 5:
+        position = rng.randrange(1, len(word) - 1)
+        words[longest] = word[:position] + word[position + 1:]
+    return " ".join(words)
+
+
+def latency_stats(samples, total_time):
+    """Перцентили задержки в миллисекундах и пропускная способность"""
+    values = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p90_ms": round(float(np.percentile(values, 90)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3),
+        "mean_ms": round(float(values.mean()), 3),
+        "qps": round(len(samples) / total_time, 1) if total_time > 0 else None,
+    }
+
+
+def measure(func, items):
+    """Вызывает func для каждого элемента и собирает задержки"""
+    samples = []
+    start = perf_counter()
+    for item in items:
+        call_start = perf_counter()
+        func(item)
+        samples.append(perf_counter() - call_start)
+    return latency_stats(samples, perf_counter() - start)
+
+
+def start_server(app):
+    """Запускает Flask-приложение на свободном порту в фоновом потоке"""
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def quiet(verbose):
+    """Глушит логи сервисов, чтобы они не смешивались с результатами"""
+    return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+
+def patch_backends(args):
+    """Подменяет MongoDB/Redis локальными заменами, если не заданы настоящие адреса"""
+    sys.path[:0] = [SEARCH_APP_DIR, DATABASE_APP_DIR, COMMON_DIR]
+    # Структурированные логи сервисов пишутся в stdout из отдельного потока
+    os.environ.setdefault("LOG_LEVEL", "DEBUG" if args.verbose else "CRITICAL")
+    # Синтетические запросы не должны попадать в журнал и прогревать кэш
+    os.environ.setdefault("QUERY_LOG_PATH", "")
+    backends = {}
+
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+        backends["mongo"] = args.mongo_uri
+    else:
+        import mongomock
+        import mongo_client
+        import turbo_search
+
+        shared_mongo = mongomock.MongoClient()
+        mongo_client.MongoClient = lambda *a, **k: shared_mongo
+        turbo_search.MongoClient = lambda *a, **k: shared_mongo
+        backends["mongo"] = "mongomock"
+
+    if args.redis_url:
+        from urllib.parse import urlparse
+
+        url = urlparse(args.redis_url)
+        os.environ["REDIS_HOST"] = url.hostname or "localhost"
+        os.environ["REDIS_PORT"] = str(url.port or 6379)
+        os.environ["REDIS_DB"] = (url.path or "/0").lstrip("/") or "0"
+        backends["redis"] = args.redis_url
+    else:
+        import fakeredis
+        import redis_client
+
+        class BenchFakeRedis(fakeredis.FakeRedis):
+            # fakeredis не реализует INFO, а save_movies_bulk проверяет по нему флаг loading
+            def info(self, *args, **kwargs):
+                return {"loading": 0}
+
+        import profiles
+        import redis
+
+        fake_server = fakeredis.FakeServer()
+        # redis.Redis подменяется для search_service, который импортируется позже
+        redis_client.Redis = profiles.Redis = redis.Redis = lambda *a, **k: BenchFakeRedis(
+            server=fake_server, decode_responses=k.get("decode_responses", False)
+        )
+        backends["redis"] = "fakeredis"
+
+    os.environ["MONGO_DB"] = args.mongo_db
+    return backends
+
+
+def run(args):
+    results = {
+        "timestamp": int(time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "movies": args.movies,
+            "queries": args.queries,
+            "dim": args.dim,
+            "top_k": args.top_k,
+            "seed": args.seed,
+            "fake_encoder": args.fake_encoder,
+        },
+    }
+    results["backends"] = patch_backends(args)
+
+    workdir = tempfile.mkdtemp(prefix="movie-bench-")
+    os.chdir(workdir)
+
+    catalog = generate_catalog(args.movies, args.seed)
+    queries = generate_queries(args.queries, catalog, args.seed)
+    embeddings = np.random.default_rng(args.seed).standard_normal((args.movies, args.dim)).astype(np.float32)
+    np.save(os.path.join(workdir, "movies_embeddings.npy"), embeddings)
+
+    # Загрузка данных: MongoDB и save_movies_bulk
+    with quiet(args.verbose):
+        from mongo_client import MongoMovieClient
+        from redis_client import RedisMovieClient
+
+        mongo = MongoMovieClient(host=args.mongo_uri or "mongodb://localhost:27017", db_name=args.mongo_db)
+        mongo.collection.delete_many({})
+        start = perf_counter()
+        mongo.collection.insert_many([dict(movie) for movie in catalog])
+        mongo_time = perf_counter() - start
+
+        redis = RedisMovieClient(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", 6379)),
+            db=int(os.getenv("REDIS_DB", 0)),
+        )
+        redis.flush_db()
+        start = perf_counter()
+        saved = redis.save_movies_bulk(catalog)
+        redis_time = perf_counter() - start
+
+    results["ingest"] = {
+        "mongo_insert_s": round(mongo_time, 3),
+        "mongo_movies_per_s": round(args.movies / mongo_time, 1),
+        "save_movies_bulk_s": round(redis_time, 3),
+        "save_movies_bulk_movies_per_s": round((saved or 0) / redis_time, 1) if redis_time > 0 else None,
+        "saved": saved,
+        # Без RediSearch словарь подсказок не ведется, а поиск в режиме redis пуст
+        "redisearch": redis.search_available,
+    }
+
+    # Старт поисковой системы: импорт сервиса создает TurboMovieSearch
+    if args.fake_encoder:
+        import turbo_search
+
+        turbo_search.SentenceTransformer = FakeEncoder(args.dim)
+
+    with quiet(args.verbose):
+        start = perf_counter()
+        import search_service
+        results["startup_s"] = round(perf_counter() - start, 3)
+
+        engine = search_service.search_engine
+
+        def reset_cache():
+            # Новое поколение индекса делает недоступными и L1, и L2
+            engine.catalog.generation = engine.search_cache.bump_generation()
+
+        reset_cache()
+
+        def engine_search(query):
+            engine.search(query, top_k=args.top_k)
+
+        # Первый проход — все запросы уникальны и идут мимо кэша,
+        # второй — те же запросы отдаются из кэша
+        uncached = measure(engine_search, queries)
+        cached = measure(engine_search, queries)
+
+        # Третий проход — те же запросы, набранные иначе: попадают в кэш благодаря нормализации
+        rng = random.Random(args.seed + 2)
+        variants = [query_variant(query, rng) for query in queries]
+        outcomes = []
+
+        def variant_search(query):
+            stats = {}
+            engine.search(query, top_k=args.top_k, stats=stats)
+            outcomes.append(stats.get("cache"))
+
+        variant = measure(variant_search, variants)
+        variant["hit_rate"] = round(sum(outcome in ("hit", "title") for outcome in outcomes) / len(outcomes), 3)
+
+    results["search"] = {"uncached": uncached, "cached": cached, "variants": variant}
+
+    # Сквозной /search через HTTP: поисковый сервис → сервис БД
+    with quiet(args.verbose):
+        import requests
+        import database_service
+
+        db_server, db_url = start_server(database_service.app)
+        os.environ["DATABASE_SERVICE_URL"] = db_url
+        search_server, search_url = start_server(search_service.app)
+        session = requests.Session()
+
+        endpoint = {}
+        # Режим redis ищет через FT.SEARCH: без RediSearch (fakeredis) замер показал бы только пустой ответ
+        modes = ("semantic", "redis") if redis.search_available else ("semantic",)
+        if not redis.search_available:
+            endpoint["redis"] = {"skipped": "RediSearch недоступен"}
+        for mode in modes:
+            reset_cache()
+
+            def http_search(query):
+                session.get(
+                    f"{search_url}/search",
+                    params={"query": query, "top_k": args.top_k, "search_mode": mode},
+                    timeout=30,
+                ).raise_for_status()
+
+            endpoint[mode] = {
+                "uncached": measure(http_search, queries),
+                "cached": measure(http_search, queries),
+            }
+
+        search_server.shutdown()
+        db_server.shutdown()
+
+    results["endpoint_search"] = endpoint
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска фильмов на синтетическом каталоге")
+    parser.add_argument("--movies", type=int, default=5000, help="Размер синтетического каталога")
+    parser.add_argument("--queries", type=int, default=200, help="Количество уникальных запросов")
+    parser.add_argument("--dim", type=int, default=384, help="Размерность эмбеддингов")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--fake-encoder", action="store_true",
+                        help="Не загружать SentenceTransformer, кодировать запросы случайными векторами")
+    parser.add_argument("--mongo-uri", help="Настоящая MongoDB вместо mongomock")
+    parser.add_argument("--mongo-db", default="movies_bench")
+    parser.add_argument("--redis-url", help="Настоящий Redis (redis://host:port/db) вместо fakeredis")
+    parser.add_argument("--output", help="Файл для JSON-результатов (по умолчанию stdout)")
+    parser.add_argument("--verbose", action="store_true", help="Не скрывать логи сервисов")
+    args = parser.parse_args()
+    # run() меняет рабочую директорию, поэтому путь фиксируем заранее
+    output = os.path.abspath(args.output) if args.output else None
+
+    results = run(args)
+    report = json.dumps(results, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(report)
+        print(f"✅ Результаты сохранены в {args.output}")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Сколько байт и запросов стоит загрузка страниц веб-сервиса: статика через
+стандартный /static против собранной (assets.py: хеш в имени, WOFF2, .br/.gz,
+WebP, Cache-Control: immutable).
+
+Оба варианта рендерят одни и те же шаблоны (home.html и dml.html без
+результатов) в отдельных Flask-приложениях. "Браузер" загружает страницу,
+все файлы из HTML и из url(...) в CSS с заголовками обычного браузера и
+считает переданные байты и запросы. Повторная загрузка учитывает HTTP-кэш:
+файл с max-age не запрашивается, остальные перепроверяются условным
+запросом (304 — тоже запрос к воркеру Flask).
+
+Пример:
+    python benchmarks/static_assets.py
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import tempfile
+from urllib.parse import urljoin
+
+from flask import Flask, render_template, url_for
+
+from run_benchmarks import COMMON_DIR, ROOT_DIR, quiet
+
+WEB_APP_DIR = os.path.join(ROOT_DIR, "1111111web-service", "app")
+sys.path[:0] = [WEB_APP_DIR, COMMON_DIR]
+from assets import AssetPipeline, register_assets  # noqa: E402
+
+BROWSER_HEADERS = {"Accept-Encoding": "gzip, deflate, br"}
+IMAGE_ACCEPT = "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8"
+PAGES = {"home": "/", "dml": "/dml"}
+
+_HTML_REFERENCE = re.compile(r"""(?:href|src)=["']((?:/static|/assets)/[^"']+)["']""")
+_CSS_REFERENCE = re.compile(r"""url\(\s*['"]?([^'")]+)['"]?\s*\)""")
+
+
+def make_app(pipeline=None):
+    """Приложение с шаблонами веб-сервиса; без pipeline asset_url ведет на /static, как раньше"""
+    app = Flask(
+        "static_bench",
+        template_folder=os.path.join(WEB_APP_DIR, "templates"),
+        static_folder=os.path.join(WEB_APP_DIR, "static"),
+    )
+    if pipeline is None:
+        app.jinja_env.globals["asset_url"] = lambda filename: url_for("static", filename=filename)
+    else:
+        register_assets(app, pipeline)
+
+    app.add_url_rule("/", "home", lambda: render_template("home.html"))
+    app.add_url_rule("/dml", "dml", lambda: render_template("dml.html", results=lambda: ""))
+    return app
+
+
+def load_page(client, path, cache):
+    """Загрузка страницы и ее статики; cache — HTTP-кэш браузера (url -> (etag, можно ли не спрашивать))"""
+    stats = {"requests": 0, "bytes": 0, "not_modified": 0}
+
+    def fetch(url, accept=None):
+        cached = cache.get(url)
+        if cached is not None and cached["fresh"]:
+            return cached["body"]
+        headers = dict(BROWSER_HEADERS)
+        if accept:
+            headers["Accept"] = accept
+        if cached is not None and cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+
+        response = client.get(url, headers=headers)
+        stats["requests"] += 1
+        if response.status_code == 304:
+            stats["not_modified"] += 1
+            return cached["body"]
+        # Тело приходит сжатым, если сервер выбрал Content-Encoding: это и есть переданные байты
+        stats["bytes"] += len(response.data)
+        cache_control = response.headers.get("Cache-Control", "")
+        max_age = re.search(r"max-age=(\d+)", cache_control)
+        cache[url] = {
+            "etag": response.headers.get("ETag"),
+            "fresh": bool(max_age and int(max_age.group(1)) > 0 and "no-cache" not in cache_control),
+            "body": _decoded(response),
+        }
+        return cache[url]["body"]
+
+    html = fetch(path).decode("utf-8")
+    for reference in dict.fromkeys(_HTML_REFERENCE.findall(html)):
+        body = fetch(reference, None if reference.endswith(".css") else IMAGE_ACCEPT)
+        if reference.endswith(".css"):
+            for nested in dict.fromkeys(_CSS_REFERENCE.findall(body.decode("utf-8"))):
+                if not nested.startswith(("http:", "https:", "data:")):
+                    fetch(urljoin(reference, nested), IMAGE_ACCEPT)
+    return stats
+
+
+def _decoded(response):
+    encoding = response.headers.get("Content-Encoding")
+    if encoding == "gzip":
+        return gzip.decompress(response.data)
+    if encoding == "br":
+        # Сервер отдает .br, только если brotli был при сборке
+        import brotli
+        return brotli.decompress(response.data)
+    return response.data
+
+
+def run(args):
+    with tempfile.TemporaryDirectory(prefix="assets_") as output_dir:
+        variants = {
+            "static": make_app(),
+            "assets": make_app(AssetPipeline(os.path.join(WEB_APP_DIR, "static"), output_dir)),
+        }
+        results = {}
+        for name, app in variants.items():
+            client = app.test_client()
+            for page, path in PAGES.items():
+                cache = {}
+                first = load_page(client, path, cache)
+                repeat = load_page(client, path, cache)
+                results.setdefault(page, {})[name] = {"first": first, "repeat": repeat}
+
+        for page in PAGES:
+            before, after = results[page]["static"], results[page]["assets"]
+            results[page]["first_bytes_ratio"] = round(after["first"]["bytes"] / before["first"]["bytes"], 3)
+            results[page]["repeat_requests"] = {
+                "static": before["repeat"]["requests"], "assets": after["repeat"]["requests"],
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Байты и запросы при загрузке страниц: /static против собранной статики")
+    parser.add_argument("--output", help="Файл для JSON-отчета (по умолчанию stdout)")
+    parser.add_argument("--verbose", action="store_true", help="Не глушить вывод сервисов")
+    args = parser.parse_args()
+
+    with quiet(args.verbose):
+        results = run(args)
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"✅ Результаты сохранены в {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Сравнение форматов ответов между сервисами: jsonify, orjson и MessagePack.
+
+Полезная нагрузка — то, что реально ходит между сервисами: список из top_k
+фильмов с описаниями и relevance_score (ответ /search и /movies/search) и
+одна карточка фильма со строковыми полями из Redis (ответ /movies/<id>).
+Для каждого формата замеряются:
+  - размер тела;
+  - процессорное время сериализации на сервере и разбора на клиенте;
+  - задержка запроса через HTTP (Flask-приложение с serialization.respond
+    и requests с соответствующим Accept).
+
+Пример:
+    python benchmarks/wire_formats.py --top-k 10 50 100 --iterations 2000
+"""
+import argparse
+import json
+import random
+import sys
+from time import process_time
+
+from run_benchmarks import COMMON_DIR, SEARCH_APP_DIR, generate_catalog, measure, start_server
+
+sys.path[:0] = [SEARCH_APP_DIR, COMMON_DIR]
+import serialization  # noqa: E402
+from serialization import JSON_MIMETYPE, MSGPACK_MIMETYPE  # noqa: E402
+
+# Формат -> заголовок Accept; jsonify — прежнее поведение (Flask jsonify и response.json())
+FORMATS = {
+    "jsonify": JSON_MIMETYPE,
+    "orjson": JSON_MIMETYPE,
+    "msgpack": MSGPACK_MIMETYPE,
+}
+
+
+def search_payload(catalog, top_k, rng):
+    """Ответ поиска: фильмы из метаданных поиска с ID и оценкой"""
+    results = []
+    for movie in rng.sample(catalog, top_k):
+        movie = {key: value for key, value in movie.items() if key != "_id"}
+        movie["id"] = rng.randint(1, 10 ** 6)
+        movie["relevance_score"] = rng.random()
+        results.append(movie)
+    return results
+
+
+def movie_payload(catalog, rng):
+    """Карточка фильма из Redis: все значения — строки"""
+    movie = rng.choice(catalog)
+    return {key: str(value) for key, value in movie.items()}
+
+
+def cpu_per_op(func, iterations):
+    """Процессорное время одного вызова в микросекундах"""
+    start = process_time()
+    for _ in range(iterations):
+        func()
+    return round((process_time() - start) / iterations * 1e6, 2)
+
+
+def make_app(payloads):
+    from flask import Flask, jsonify, request
+
+    app = Flask("serialization-bench")
+
+    @app.route("/payload/<name>")
+    def payload(name):
+        data = payloads[name]
+        if request.args.get("format") == "jsonify":
+            return jsonify(data)
+        return serialization.respond(data)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU и задержка форматов jsonify / orjson / MessagePack")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--iterations", type=int, default=2000, help="Повторов для замера CPU")
+    parser.add_argument("--requests", type=int, default=500, help="HTTP-запросов на формат и нагрузку")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Файл для JSON-отчета (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    catalog = generate_catalog(max(args.top_k) * 10, args.seed)
+    payloads = {f"search_top{top_k}": search_payload(catalog, top_k, rng) for top_k in args.top_k}
+    payloads["movie"] = movie_payload(catalog, rng)
+
+    formats = {"jsonify": FORMATS["jsonify"]}
+    if serialization.orjson is not None:
+        formats["orjson"] = FORMATS["orjson"]
+    if serialization.msgpack is not None:
+        formats["msgpack"] = FORMATS["msgpack"]
+
+    import requests
+    from flask import jsonify
+
+    app = make_app(payloads)
+    server, url = start_server(app)
+    session = requests.Session()
+
+    results = {"params": vars(args), "available": list(formats), "payloads": {}}
+    for name, data in payloads.items():
+        report = {}
+        for fmt, accept in formats.items():
+            if fmt == "jsonify":
+                with app.app_context():
+                    body = jsonify(data).get_data()
+                    encode = cpu_per_op(lambda: jsonify(data).get_data(), args.iterations)
+                decode = cpu_per_op(lambda: json.loads(body), args.iterations)
+            else:
+                mimetype = MSGPACK_MIMETYPE if fmt == "msgpack" else JSON_MIMETYPE
+                body = serialization.dumps(data, mimetype)
+                encode = cpu_per_op(lambda: serialization.dumps(data, mimetype), args.iterations)
+                decode = cpu_per_op(lambda: serialization.loads(body, mimetype), args.iterations)
+
+            params = {"format": "jsonify"} if fmt == "jsonify" else {}
+
+            def fetch(_):
+                response = session.get(f"{url}/payload/{name}", params=params, headers={"Accept": accept}, timeout=10)
+                response.raise_for_status()
+                return response.json() if fmt == "jsonify" else serialization.decode(response)
+
+            assert fetch(None) == json.loads(json.dumps(data)), f"{fmt} искажает {name}"
+            report[fmt] = {
+                "bytes": len(body),
+                "encode_us": encode,
+                "decode_us": decode,
+                "http": measure(fetch, range(args.requests)),
+            }
+
+        baseline = report["jsonify"]
+        for fmt in report:
+            if fmt != "jsonify":
+                report[fmt]["vs_jsonify"] = {
+                    "bytes_ratio": round(report[fmt]["bytes"] / baseline["bytes"], 3),
+                    "cpu_ratio": round(
+                        (report[fmt]["encode_us"] + report[fmt]["decode_us"])
+                        / (baseline["encode_us"] + baseline["decode_us"]), 3
+                    ),
+                    "p50_ratio": round(report[fmt]["http"]["p50_ms"] / baseline["http"]["p50_ms"], 3),
+                }
+        results["payloads"][name] = report
+
+    server.shutdown()
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"✅ Результаты сохранены в {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
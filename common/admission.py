@@ -0,0 +1,144 @@
+"""
+Дедлайны запросов и ограничение нагрузки.
+
+Оставшийся бюджет времени передается по цепочке web → search → database
+в заголовке X-Request-Budget-Ms. Каждый сервис считает от него свой
+дедлайн, держит ограниченное число запросов в работе и в очереди и сразу
+отвечает 429 (очередь полна) или 503 (бюджета не хватит), вместо того
+чтобы копить запросы, которые клиент все равно не дождется.
+"""
+import os
+import threading
+from time import monotonic
+
+from flask import g, has_request_context, jsonify, request
+
+from metrics import IN_FLIGHT, count_shed
+
+BUDGET_HEADER = "X-Request-Budget-Ms"
+
+_admission = None
+
+
+class Admission:
+    """Ограничение числа одновременных запросов с ограниченной очередью ожидания"""
+
+    def __init__(self, max_concurrent=32, max_queue=64, queue_timeout=1.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+
+    def acquire(self, deadline):
+        """Занимает слот. Возвращает None или причину отказа: queue_full / queue_timeout"""
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                return "queue_full"
+            self.waiting += 1
+            IN_FLIGHT.labels("queued").set(self.waiting)
+
+        try:
+            timeout = min(self.queue_timeout, deadline - monotonic())
+            if timeout <= 0 or not self._slots.acquire(timeout=timeout):
+                return "queue_timeout"
+        finally:
+            with self._lock:
+                self.waiting -= 1
+                IN_FLIGHT.labels("queued").set(self.waiting)
+
+        with self._lock:
+            self.active += 1
+            IN_FLIGHT.labels("active").set(self.active)
+        return None
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+            IN_FLIGHT.labels("active").set(self.active)
+        self._slots.release()
+
+    @property
+    def saturated(self):
+        """Все слоты заняты или кто-то уже ждет в очереди"""
+        return self.waiting > 0 or self.active >= self.max_concurrent
+
+
+def _parse_budget(value):
+    try:
+        return max(0.0, float(value) / 1000)
+    except (TypeError, ValueError):
+        return None
+
+
+def register_admission(app, default_budget=None, exempt=("/health", "/metrics", "/debug/")):
+    """Добавляет в Flask-приложение дедлайны и ограничение нагрузки (параметры из окружения)"""
+    global _admission
+    _admission = Admission(
+        max_concurrent=int(os.getenv("MAX_CONCURRENT_REQUESTS", 32)),
+        max_queue=int(os.getenv("MAX_QUEUED_REQUESTS", 64)),
+        queue_timeout=float(os.getenv("QUEUE_TIMEOUT", 1.0)),
+    )
+    default_budget = float(os.getenv("REQUEST_BUDGET", default_budget or 10.0))
+    min_budget = float(os.getenv("MIN_REQUEST_BUDGET_MS", 20)) / 1000
+
+    @app.before_request
+    def _admit():
+        # Служебные эндпоинты (и диагностика под нагрузкой) идут мимо ограничений
+        if request.path.startswith(exempt):
+            return None
+
+        budget = _parse_budget(request.headers.get(BUDGET_HEADER))
+        if budget is None:
+            budget = default_budget
+        g.deadline = monotonic() + budget
+
+        if budget < min_budget:
+            count_shed("deadline")
+            return jsonify({"error": "Недостаточно времени на обработку запроса"}), 503
+
+        reason = _admission.acquire(g.deadline)
+        if reason == "queue_full":
+            count_shed(reason)
+            response = jsonify({"error": "Сервис перегружен, повторите запрос позже"})
+            response.headers["Retry-After"] = "1"
+            return response, 429
+        if reason is not None:
+            count_shed(reason)
+            return jsonify({"error": "Сервис перегружен, запрос не дождался очереди"}), 503
+
+        g.admitted = True
+        return None
+
+    @app.teardown_request
+    def _release(exc=None):
+        if g.pop("admitted", False):
+            _admission.release()
+
+    return _admission
+
+
+def remaining():
+    """Сколько секунд осталось до дедлайна текущего запроса (None — дедлайна нет)"""
+    if not has_request_context() or "deadline" not in g:
+        return None
+    return max(0.0, g.deadline - monotonic())
+
+
+def call_timeout(limit):
+    """Таймаут исходящего вызова: не больше limit и не больше остатка бюджета"""
+    left = remaining()
+    return limit if left is None else max(0.001, min(limit, left))
+
+
+def budget_headers():
+    """Заголовки для исходящего вызова, передающие остаток бюджета дальше по цепочке"""
+    left = remaining()
+    return {} if left is None else {BUDGET_HEADER: str(int(left * 1000))}
+
+
+def saturated():
+    """Сервис работает на пределе: стоит выбирать дешевый путь обработки"""
+    return _admission is not None and _admission.saturated
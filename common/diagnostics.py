@@ -0,0 +1,137 @@
+"""
+Диагностика живого процесса: профиль CPU и разбивка памяти.
+
+Эндпоинты доступны только с заголовком X-Admin-Token, равным
+ADMIN_TOKEN; без переменной окружения они выключены (404).
+
+    GET /debug/profile?seconds=10&interval_ms=5 — сэмплирующий профиль всех
+        потоков в формате collapsed stacks (flamegraph.pl, speedscope)
+    GET /debug/memory?top=20 — размеры компонентов сервиса, RSS и top
+        аллокаций tracemalloc (?tracemalloc=start / stop включает и
+        выключает трассировку)
+"""
+import hmac
+import os
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from time import monotonic, sleep
+
+from flask import Response, abort, jsonify, request
+
+ADMIN_HEADER = "X-Admin-Token"
+MAX_PROFILE_SECONDS = 60
+
+
+def _check_admin():
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get(ADMIN_HEADER, ""), token):
+        abort(403)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds, interval):
+    """Снимает стеки всех потоков раз в interval секунд; возвращает Counter collapsed-строк"""
+    own = threading.get_ident()
+    names = {}
+    stacks = Counter()
+    deadline = monotonic() + seconds
+
+    while monotonic() < deadline:
+        frames = sys._current_frames()
+        if len(names) != len(frames):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in frames.items():
+            if ident == own:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(labels))] += 1
+        sleep(interval)
+    return stacks
+
+
+def deep_sizeof(obj, seen=None):
+    """Приблизительный размер объекта вместе с вложенными словарями, списками и массивами"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+def _rss_bytes():
+    """Текущий RSS процесса (Linux), иначе None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def register_diagnostics(app, components=None):
+    """
+    Добавляет /debug/profile и /debug/memory.
+    components — функция без аргументов, возвращающая {компонент: байты}.
+    """
+    if os.getenv("TRACEMALLOC") == "1":
+        tracemalloc.start(int(os.getenv("TRACEMALLOC_FRAMES", 1)))
+
+    @app.route("/debug/profile")
+    def debug_profile():
+        _check_admin()
+        seconds = min(request.args.get("seconds", 10, type=float), MAX_PROFILE_SECONDS)
+        interval = max(request.args.get("interval_ms", 5, type=float), 1) / 1000
+
+        stacks = sample_stacks(seconds, interval)
+        body = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        return Response(body, mimetype="text/plain")
+
+    @app.route("/debug/memory")
+    def debug_memory():
+        _check_admin()
+        action = request.args.get("tracemalloc")
+        if action == "start" and not tracemalloc.is_tracing():
+            tracemalloc.start(int(os.getenv("TRACEMALLOC_FRAMES", 1)))
+        elif action == "stop" and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        report = {
+            "rss_bytes": _rss_bytes(),
+            "components": components() if components else {},
+            "tracemalloc": None,
+        }
+
+        if tracemalloc.is_tracing():
+            top = request.args.get("top", 20, type=int)
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            report["tracemalloc"] = {
+                "current_bytes": current,
+                "peak_bytes": peak,
+                "top": [
+                    {"where": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:top]
+                ],
+            }
+        return jsonify(report)
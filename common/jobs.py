@@ -0,0 +1,299 @@
+"""
+Фоновые задачи (синхронизация, переиндексация) с прогрессом.
+
+POST на эндпоинт задачи сразу возвращает 202 и job_id, а работа идет в
+фоновом потоке. Одновременно может выполняться только одна задача с
+данным именем: блокировка job:lock:<name> в Redis, значение — id задачи,
+продлевается, пока задача работает. Повторный запуск, пока задача идет
+(в этой или другой реплике), не создает новую, а возвращает id уже
+идущей.
+
+Состояние задачи хранится в Redis (job:<id>, JSON, JOB_TTL секунд), поэтому
+GET /jobs/<id> отвечает из любой реплики:
+
+    {"id": "...", "name": "sync", "status": "running", "stage": "write",
+     "done": 12000, "total": 50000, "percent": 24.0, "rate_per_s": 8100.5,
+     "elapsed_s": 1.48, "triggers": 2, ...}
+
+status: queued → running → success / error.
+
+Без Redis (JobRunner() в веб-сервисе: кэш постеров у каждой реплики свой)
+блокировка и состояние задач есть только в памяти своей реплики. Задачи,
+которые меняют состояние самой реплики (переиндексация в поисковом
+сервисе), запускаются с shared_lock=False: блокировка только в памяти
+процесса, чтобы запуск в одной реплике не поглощался задачей другой, а
+состояние по-прежнему пишется в Redis.
+"""
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from time import monotonic, sleep, time
+
+from flask import jsonify, request
+from redis.exceptions import RedisError, WatchError
+
+from metrics import count_error, observe_stage, get_logger
+
+logger = get_logger("jobs")
+
+JOB_PREFIX = "job:"
+JOB_TTL = int(os.getenv("JOB_TTL", 24 * 3600))
+# Блокировка живет lock_ttl секунд и продлевается каждую треть этого времени
+JOB_LOCK_TTL = float(os.getenv("JOB_LOCK_TTL", 60))
+# Как часто (секунды) прогресс записывается в Redis
+PROGRESS_INTERVAL = 0.5
+# Сколько последних задач реплика помнит в памяти (остальные — только в Redis)
+MAX_LOCAL_JOBS = 100
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class Job:
+    """Состояние одной задачи; передается в функцию задачи для отчета о прогрессе"""
+
+    def __init__(self, runner, name, job_id=None):
+        self.runner = runner
+        self.id = job_id or uuid.uuid4().hex[:16]
+        self.name = name
+        self.status = "queued"
+        self.stage = None
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.triggers = 1
+        self.created_at = time()
+        self.started_at = None
+        self.finished_at = None
+        self._stage_start = None
+        self._stage_end = None
+        self._saved_at = 0.0
+
+    def progress(self, done=None, total=None, stage=None):
+        """Обновляет прогресс; stage начинает новый этап (счетчики сбрасываются)"""
+        if stage is not None and stage != self.stage:
+            self._finish_stage()
+            self.stage = stage
+            self.done = 0
+            self.total = None
+            self._stage_start = monotonic()
+            self._stage_end = None
+        if done is not None:
+            self.done = done
+        if total is not None:
+            self.total = total
+        if monotonic() - self._saved_at >= PROGRESS_INTERVAL:
+            self.runner.save(self)
+
+    def _finish_stage(self):
+        if self.stage is not None and self._stage_start is not None and self._stage_end is None:
+            self._stage_end = monotonic()
+            observe_stage(f"job_{self.name}_{self.stage}", self._stage_end - self._stage_start)
+
+    def to_dict(self):
+        end = self.finished_at or time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        stage_elapsed = (self._stage_end or monotonic()) - self._stage_start if self._stage_start else 0.0
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "stage": self.stage,
+            "done": self.done,
+            "total": self.total,
+            "percent": round(100.0 * self.done / self.total, 1) if self.total else None,
+            # Скорость текущего этапа (единиц в секунду)
+            "rate_per_s": round(self.done / stage_elapsed, 1) if stage_elapsed > 0 and self.done else None,
+            "elapsed_s": round(elapsed, 3),
+            "created_at": round(self.created_at, 3),
+            "started_at": round(self.started_at, 3) if self.started_at else None,
+            "finished_at": round(self.finished_at, 3) if self.finished_at else None,
+            "triggers": self.triggers,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobRunner:
+    """Запускает задачи в фоновых потоках под блокировкой в Redis (shared_lock) или в памяти процесса"""
+
+    def __init__(self, redis_client=None, lock_ttl=JOB_LOCK_TTL, ttl=JOB_TTL, shared_lock=True):
+        self.redis_client = redis_client
+        self.shared_lock = shared_lock and redis_client is not None
+        self.lock_ttl = lock_ttl
+        self.ttl = ttl
+        self._jobs = OrderedDict()  # id -> Job (задачи этой реплики)
+        self._running = {}  # name -> Job
+        self._lock = threading.Lock()
+
+    def submit(self, name, func):
+        """
+        Запускает func(job) в фоне. Возвращает (состояние задачи, coalesced):
+        coalesced=True, если задача с таким именем уже шла и новая не создана.
+        """
+        with self._lock:
+            job = self._running.get(name)
+            if job is not None:
+                job.triggers += 1
+                self.save(job)
+                return job.to_dict(), True
+
+            job = Job(self, name)
+            owner = self._acquire(name, job.id)
+            if owner is not None:
+                # Задачу уже выполняет другая реплика
+                return self._coalesce_remote(owner, name), True
+
+            self._running[name] = job
+            self._jobs[job.id] = job
+            while len(self._jobs) > MAX_LOCAL_JOBS:
+                self._jobs.popitem(last=False)
+
+        self.save(job)
+        threading.Thread(target=self._run, args=(job, func), name=f"job-{name}", daemon=True).start()
+        logger.warning("job_submitted", job_id=job.id, name=name)
+        return job.to_dict(), False
+
+    def get(self, job_id):
+        """Состояние задачи: своей — из памяти, чужой — из Redis"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.redis_client is None:
+            return None
+        try:
+            payload = self.redis_client.get(f"{JOB_PREFIX}{job_id}")
+        except RedisError as e:
+            logger.warning("job_state_failed", job_id=job_id, error=str(e))
+            return None
+        return json.loads(payload) if payload else None
+
+    def wait(self, job_id, timeout):
+        """Ждет завершения задачи не дольше timeout секунд и возвращает ее состояние"""
+        deadline = monotonic() + timeout
+        state = self.get(job_id)
+        while state is not None and state["status"] in ("queued", "running") and monotonic() < deadline:
+            sleep(0.2)
+            state = self.get(job_id)
+        return state
+
+    def save(self, job):
+        """Записывает состояние задачи в Redis"""
+        job._saved_at = monotonic()
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.set(
+                f"{JOB_PREFIX}{job.id}", json.dumps(job.to_dict(), ensure_ascii=False, default=str), ex=self.ttl
+            )
+        except RedisError as e:
+            logger.warning("job_state_failed", job_id=job.id, error=str(e))
+
+    def _run(self, job, func):
+        job.status = "running"
+        job.started_at = time()
+        self.save(job)
+        print(f"🛠 Задача {job.name} ({job.id}) запущена")
+
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(job, stop_heartbeat), name=f"job-{job.name}-lock", daemon=True
+        )
+        heartbeat.start()
+        try:
+            job.result = func(job)
+            job.status = "success"
+            print(f"✅ Задача {job.name} ({job.id}) завершена")
+        except Exception as e:
+            job.status = "error"
+            job.error = str(e)
+            count_error(f"job_{job.name}")
+            logger.error("job_failed", job_id=job.id, name=job.name, error=str(e), exc_info=True)
+            print(f"❌ Задача {job.name} ({job.id}) завершилась ошибкой: {e}")
+        finally:
+            job._finish_stage()
+            job.finished_at = time()
+            stop_heartbeat.set()
+            with self._lock:
+                self._running.pop(job.name, None)
+                self._release(job.name, job.id)
+            self.save(job)
+            logger.warning("job_finished", job_id=job.id, name=job.name, status=job.status,
+                           elapsed_s=round(job.finished_at - job.started_at, 3))
+
+    def _acquire(self, name, job_id):
+        """Берет блокировку; возвращает None или id задачи, которая ее держит"""
+        if not self.shared_lock:
+            return None
+        key = f"{JOB_PREFIX}lock:{name}"
+        try:
+            if self.redis_client.set(key, job_id, nx=True, px=int(self.lock_ttl * 1000)):
+                return None
+            return _decode(self.redis_client.get(key))
+        except RedisError as e:
+            # Без Redis защищаемся только от параллельных запусков в этой реплике
+            logger.warning("job_lock_failed", name=name, error=str(e))
+            return None
+
+    def _heartbeat(self, job, stop):
+        """Продлевает блокировку, пока задача работает"""
+        key = f"{JOB_PREFIX}lock:{job.name}"
+        while self.shared_lock and not stop.wait(self.lock_ttl / 3):
+            try:
+                if _decode(self.redis_client.get(key)) == job.id:
+                    self.redis_client.pexpire(key, int(self.lock_ttl * 1000))
+                else:
+                    logger.error("job_lock_lost", job_id=job.id, name=job.name)
+            except RedisError as e:
+                logger.warning("job_lock_failed", name=job.name, error=str(e))
+
+    def _release(self, name, job_id):
+        """Снимает блокировку, только если она все еще принадлежит этой задаче"""
+        if not self.shared_lock:
+            return
+        key = f"{JOB_PREFIX}lock:{name}"
+        try:
+            with self.redis_client.pipeline() as pipeline:
+                pipeline.watch(key)
+                if _decode(pipeline.get(key)) == job_id:
+                    pipeline.multi()
+                    pipeline.delete(key)
+                    pipeline.execute()
+        except (WatchError, RedisError) as e:
+            logger.warning("job_lock_release_failed", name=name, error=str(e))
+
+    def _coalesce_remote(self, job_id, name):
+        """Состояние задачи, которую выполняет другая реплика"""
+        state = self.get(job_id) if job_id else None
+        if state is None:
+            # Блокировка есть, а состояния еще нет: задача только что создана
+            return {"id": job_id, "name": name, "status": "running"}
+        return state
+
+
+def job_response(runner, name, func):
+    """Ответ POST-эндпоинта задачи: 202 с состоянием; ?wait=<секунды> дожидается окончания"""
+    state, coalesced = runner.submit(name, func)
+    wait = request.args.get("wait", type=float)
+    if wait:
+        state = runner.wait(state["id"], wait) or state
+
+    body = dict(state, job_id=state["id"], coalesced=coalesced, url=f"/jobs/{state['id']}")
+    done = state["status"] in ("success", "error")
+    code = (500 if state["status"] == "error" else 200) if done else 202
+    return jsonify(body), code
+
+
+def register_jobs(app, runner):
+    """Добавляет GET /jobs/<id>"""
+
+    @app.route("/jobs/<job_id>")
+    def get_job(job_id):
+        state = runner.get(job_id)
+        if state is None:
+            return jsonify({"error": "Задача не найдена"}), 404
+        return jsonify(state)
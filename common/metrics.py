@@ -0,0 +1,188 @@
+"""
+Метрики Prometheus и структурированные логи.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from time import perf_counter
+
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Бакеты от 0.1 мс до 10 с: покрывают и кэш-хиты, и кодирование запроса моделью
+LATENCY_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+REQUEST_LATENCY = Histogram(
+    "movie_request_seconds", "Время обработки HTTP-запроса",
+    ["endpoint", "status"], buckets=LATENCY_BUCKETS
+)
+STAGE_LATENCY = Histogram(
+    "movie_stage_seconds", "Время этапов обработки (parse, encode, score, topk, hydrate, redis_query...)",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+CACHE_EVENTS = Counter(
+    "movie_cache_total", "Обращения к кэшам", ["cache", "result"]
+)
+ERRORS = Counter(
+    "movie_errors_total", "Ошибки по месту возникновения", ["where"]
+)
+INDEX_SIZE = Gauge(
+    "movie_index_size", "Размер индексов и справочников", ["index", "unit"]
+)
+INDEX_GENERATION = Gauge(
+    "movie_index_generation", "Поколение индекса (растет при каждой переиндексации)", ["index"]
+)
+IN_FLIGHT = Gauge(
+    "movie_in_flight_requests", "Запросы в обработке и в очереди на обработку", ["state"]
+)
+SHED = Counter(
+    "movie_shed_total", "Запросы, отклоненные или обслуженные в деградированном режиме", ["reason"]
+)
+
+
+@contextmanager
+def timed(stage):
+    """Замеряет время блока и пишет его в гистограмму этапов"""
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage).observe(perf_counter() - start)
+
+
+def observe_stage(stage, seconds):
+    """Записывает уже измеренное время этапа"""
+    STAGE_LATENCY.labels(stage).observe(seconds)
+
+
+def cache_event(cache, hit):
+    """Учитывает хит или промах кэша"""
+    CACHE_EVENTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def count_error(where):
+    """Учитывает ошибку"""
+    ERRORS.labels(where).inc()
+
+
+def count_shed(reason):
+    """Учитывает отклоненный или деградированный запрос"""
+    SHED.labels(reason).inc()
+
+
+def register_metrics(app):
+    """Добавляет в Flask-приложение эндпоинт /metrics и замер времени всех запросов"""
+
+    @app.before_request
+    def _start_timer():
+        g.request_start = perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start = g.pop("request_start", None)
+        if start is not None and request.url_rule is not None and request.url_rule.rule != "/metrics":
+            REQUEST_LATENCY.labels(request.url_rule.rule, str(response.status_code)).observe(perf_counter() - start)
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+
+# --- Структурированные логи ---
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Доля сообщений уровня INFO и ниже, которые попадают в лог; WARNING и выше пишутся всегда
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.1))
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись в одну строку JSON"""
+
+    def format(self, record):
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        payload.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только часть сообщений ниже WARNING"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class StructLogger:
+    """Логгер с полями в виде именованных аргументов: logger.info("search", query=..., took_ms=...)"""
+
+    def __init__(self, logger):
+        self._logger = logger
+
+    def _log(self, level, event, fields, exc_info=False):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, event, extra={"fields": fields}, exc_info=exc_info)
+
+    def debug(self, event, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, exc_info=False, **fields):
+        self._log(logging.ERROR, event, fields, exc_info=exc_info)
+
+
+_log_queue = queue.SimpleQueue()
+_root_logger = logging.getLogger("movie")
+_listener = None
+
+
+def _setup_logging():
+    """Логи пишутся в очередь, а в stdout их выводит отдельный поток, не блокируя запросы"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    queue_handler = QueueHandler(_log_queue)
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+
+    _root_logger.setLevel(LOG_LEVEL)
+    _root_logger.addHandler(queue_handler)
+    _root_logger.propagate = False
+
+    _listener = QueueListener(_log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(name):
+    """Возвращает структурированный логгер"""
+    _setup_logging()
+    return StructLogger(_root_logger.getChild(name))
+
@@ -0,0 +1,85 @@
+"""
+Сериализация ответов между сервисами.
+
+Эндпоинты, через которые сервисы передают списки фильмов (/search,
+/movies/search, /movies/<id>), выбирают формат по заголовку Accept:
+
+    application/msgpack — MessagePack (если установлен msgpack);
+    application/json    — JSON через orjson (если установлен), иначе jsonify.
+
+Клиенты внутри системы отправляют accept_header() и разбирают ответ через
+decode(), который смотрит на Content-Type, поэтому сервисы разных версий
+и браузеры (Accept: */*) продолжают получать JSON.
+"""
+import json
+
+from flask import Response, jsonify, request
+
+try:
+    import orjson
+except ImportError:  # без orjson JSON собирается стандартным jsonify
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # без msgpack доступен только JSON
+    msgpack = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+
+# JSON первым: при равном качестве (например, */*) выбирается он
+_OFFERS = [JSON_MIMETYPE] + ([MSGPACK_MIMETYPE] if msgpack is not None else [])
+
+
+def _default(value):
+    """Типы, которые не сериализуются напрямую: скаляры numpy, ObjectId, даты"""
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def accept_header():
+    """Заголовок Accept для запросов к другим сервисам: MessagePack, если он доступен, затем JSON"""
+    if msgpack is not None:
+        return {"Accept": f"{MSGPACK_MIMETYPE}, {JSON_MIMETYPE};q=0.9"}
+    return {"Accept": JSON_MIMETYPE}
+
+
+def dumps(data, mimetype=JSON_MIMETYPE):
+    """Сериализует данные в байты указанного формата"""
+    if mimetype == MSGPACK_MIMETYPE:
+        return msgpack.packb(data, default=_default, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return None
+
+
+def loads(body, mimetype=JSON_MIMETYPE):
+    """Обратное к dumps"""
+    if mimetype == MSGPACK_MIMETYPE:
+        return msgpack.unpackb(body, raw=False, strict_map_key=False)
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def respond(data, status=200):
+    """Ответ в формате, который предпочитает клиент"""
+    mimetype = request.accept_mimetypes.best_match(_OFFERS, default=JSON_MIMETYPE)
+    body = dumps(data, mimetype)
+    if body is None:
+        response = jsonify(data)
+        response.status_code = status
+    else:
+        response = Response(body, status=status, mimetype=mimetype)
+    response.vary.add("Accept")
+    return response
+
+
+def decode(response):
+    """Тело ответа requests по его Content-Type"""
+    content_type = response.headers.get("Content-Type", "")
+    if content_type.startswith(MSGPACK_MIMETYPE):
+        return loads(response.content, MSGPACK_MIMETYPE)
+    return loads(response.content)
@@ -1,12 +1,20 @@
 from flask import Flask, jsonify, request
-from redis_client import RedisMovieClient
+from redis_client import RedisMovieClient, LEADERBOARD_METRICS, LEADERBOARD_FACETS
 from mongo_client import MongoMovieClient
+from like_flusher import LikeFlusher
+from metrics import register_metrics, INDEX_SIZE, INDEX_GENERATION
+from admission import register_admission
+from diagnostics import register_diagnostics
+from jobs import JobRunner, job_response, register_jobs
+from serialization import respond
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 app = Flask(__name__)
+register_metrics(app)
+register_admission(app)
 
 # Инициализация клиентов баз данных
 redis_client = RedisMovieClient(
@@ -21,6 +29,31 @@ mongo_client = MongoMovieClient(
     collection_name=os.getenv("MONGO_COLLECTION", "movies")
 )
 
+# Фоновая запись лайков из Redis в MongoDB
+like_flusher = LikeFlusher(
+    redis_client,
+    mongo_client,
+    interval=float(os.getenv("LIKES_FLUSH_INTERVAL", 5)),
+    batch_size=int(os.getenv("LIKES_FLUSH_BATCH", 1000))
+)
+like_flusher.start()
+
+def _memory_components():
+    """Память сервиса БД: в процессе только ближний кэш, остальные данные живут в Redis"""
+    components = {"near_cache": redis_client.near_cache.size_bytes()}
+    if redis_client.redis_client is not None:
+        try:
+            components["redis_used_memory"] = redis_client.redis_client.info("memory").get("used_memory")
+        except Exception as e:
+            components["redis_used_memory"] = f"error: {e}"
+    return components
+
+register_diagnostics(app, components=_memory_components)
+
+# Синхронизация идет в фоне под блокировкой в Redis, прогресс — в /jobs/<id>
+job_runner = JobRunner(redis_client.redis_client)
+register_jobs(app, job_runner)
+
 @app.route("/health")
 def health_check():
     return jsonify({"status": "healthy"})
@@ -29,9 +62,83 @@ def health_check():
 def get_movie(movie_id):
     movie = redis_client.get_movie_by_id(movie_id)
     if movie:
-        return jsonify(movie)
+        return respond(movie)
     return jsonify({"error": "Movie not found"}), 404
 
+def _parse_like_request():
+    """Достает пользователя и фильм из тела запроса на лайк"""
+    data = request.get_json(silent=True) or {}
+    user_id = data.get("user_id") or data.get("session_id")
+    try:
+        movie_id = int(data.get("movie_id"))
+    except (TypeError, ValueError):
+        movie_id = None
+    return user_id, movie_id
+
+@app.route("/movies/like", methods=["POST"])
+def like_movie():
+    user_id, movie_id = _parse_like_request()
+    if not user_id or movie_id is None:
+        return jsonify({"error": "user_id and movie_id are required"}), 400
+
+    result = redis_client.like_movie(user_id, movie_id, liked=True)
+    if result is None:
+        return jsonify({"error": "Failed to like movie"}), 500
+
+    changed, likes = result
+    return jsonify({"status": "success", "movie_id": movie_id, "likes": likes, "already_liked": not changed})
+
+@app.route("/movies/unlike", methods=["POST"])
+def unlike_movie():
+    user_id, movie_id = _parse_like_request()
+    if not user_id or movie_id is None:
+        return jsonify({"error": "user_id and movie_id are required"}), 400
+
+    result = redis_client.like_movie(user_id, movie_id, liked=False)
+    if result is None:
+        return jsonify({"error": "Failed to unlike movie"}), 500
+
+    changed, likes = result
+    return jsonify({"status": "success", "movie_id": movie_id, "likes": likes, "was_liked": changed})
+
+@app.route("/movies/<int:movie_id>/likes")
+def get_movie_likes(movie_id):
+    response = {"movie_id": movie_id, "likes": redis_client.get_likes_count(movie_id) or 0}
+    user_id = request.args.get("user_id")
+    if user_id:
+        response["is_liked"] = bool(redis_client.is_movie_liked(user_id, movie_id))
+    return jsonify(response)
+
+@app.route("/movies/most_liked")
+def get_most_liked():
+    limit = min(max(request.args.get("limit", 10, type=int), 1), 100)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    return jsonify(redis_client.get_most_liked(limit=limit, offset=offset) or [])
+
+@app.route("/movies/posters")
+def list_posters():
+    """Ссылки на постеры страницами (для предварительной генерации превью в веб-сервисе)"""
+    cursor = max(request.args.get("cursor", 0, type=int), 0)
+    count = min(max(request.args.get("count", 500, type=int), 1), 5000)
+    next_cursor, items = redis_client.get_posters(cursor, count) or (0, [])
+    return jsonify({"cursor": next_cursor, "items": items})
+
+@app.route("/leaderboards/<metric>")
+def get_leaderboard(metric):
+    """Топы по рейтингу, лайкам и популярности, общие или по жанру/стране/категории"""
+    if metric not in LEADERBOARD_METRICS:
+        return jsonify({"error": f"Unknown metric, expected one of {list(LEADERBOARD_METRICS)}"}), 400
+
+    facet = request.args.get("facet")
+    value = request.args.get("value", "")
+    if facet and (facet not in LEADERBOARD_FACETS or not value.strip()):
+        return jsonify({"error": f"facet must be one of {list(LEADERBOARD_FACETS)} with a value"}), 400
+
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    movies = redis_client.get_leaderboard(metric, facet=facet, value=value, limit=limit, offset=offset)
+    return jsonify(movies or [])
+
 @app.route("/movies/search")
 def search_movies():
     query = request.args.get("query", "")
@@ -49,7 +156,16 @@ def search_movies():
         country=country,
         category=category
     )
-    return jsonify(results)
+    return respond(results)
+
+@app.route("/suggest")
+def suggest():
+    prefix = request.args.get("prefix", "")
+    limit = request.args.get("limit", 10, type=int)
+    fuzzy = request.args.get("fuzzy", "0") == "1"
+
+    suggestions = redis_client.suggest(prefix, limit=limit, fuzzy=fuzzy)
+    return jsonify(suggestions or [])
 
 @app.route("/genres")
 def get_genres():
@@ -66,33 +182,48 @@ def get_categories():
     categories = redis_client.get_all_categories()
     return jsonify(categories)
 
+@app.route("/catalog/version")
+def get_catalog_version():
+    return jsonify({"version": redis_client.get_catalog_version() or 0})
+
+@app.route("/catalog/version", methods=["POST"])
+def bump_catalog_version():
+    version = redis_client.bump_catalog_version()
+    return jsonify({"version": version or 0})
+
+def _sync_job(job):
+    """Полная перезаливка фильмов из MongoDB в Redis"""
+    print("🔄 Начинаем синхронизацию MongoDB → Redis...")
+    # Проверяем подключение к MongoDB
+    mongo_count = mongo_client.collection.count_documents({})
+    print(f"📊 Количество документов в MongoDB: {mongo_count}")
+    
+    # Проверяем подключение к Redis
+    redis_count = len(redis_client.redis_client.keys("movie:*"))
+    print(f"📊 Количество фильмов в Redis до синхронизации: {redis_count}")
+    
+    # Дописываем накопленные лайки в MongoDB, чтобы лидерборды лайков собрались актуальными
+    job.progress(stage="flush_likes")
+    like_flusher.flush()
+    
+    # Выполняем синхронизацию
+    if not redis_client.load_from_mongodb(mongo_client, progress=job.progress):
+        raise RuntimeError("Failed to sync data")
+    
+    job.progress(stage="catalog_version")
+    version = redis_client.bump_catalog_version()
+    new_redis_count = len(redis_client.redis_client.keys("movie:*"))
+    INDEX_SIZE.labels("redis_movies", "items").set(new_redis_count)
+    INDEX_GENERATION.labels("catalog").set(version or 0)
+    print(f"📊 Количество фильмов в Redis после синхронизации: {new_redis_count}")
+    return {"movies_count": new_redis_count, "catalog_version": version}
+
 @app.route("/sync/mongodb-to-redis", methods=["POST"])
 def sync_mongodb_to_redis():
-    try:
-        print("🔄 Начинаем синхронизацию MongoDB → Redis...")
-        # Проверяем подключение к MongoDB
-        mongo_count = mongo_client.collection.count_documents({})
-        print(f"📊 Количество документов в MongoDB: {mongo_count}")
-        
-        # Проверяем подключение к Redis
-        redis_count = len(redis_client.redis_client.keys("movie:*"))
-        print(f"📊 Количество фильмов в Redis до синхронизации: {redis_count}")
-        
-        # Выполняем синхронизацию
-        success = redis_client.load_from_mongodb(mongo_client)
-        
-        if success:
-            new_redis_count = len(redis_client.redis_client.keys("movie:*"))
-            print(f"✅ Синхронизация завершена успешно!")
-            print(f"📊 Количество фильмов в Redis после синхронизации: {new_redis_count}")
-            return jsonify({"status": "success", "movies_count": new_redis_count})
-        else:
-            print("❌ Ошибка при синхронизации")
-            return jsonify({"status": "error", "message": "Failed to sync data"}), 500
-    except Exception as e:
-        error_msg = f"❌ Ошибка синхронизации: {str(e)}"
-        print(error_msg)
-        return jsonify({"status": "error", "message": error_msg}), 500
+    """Запускает синхронизацию (202 и id задачи); ?wait=<секунды> дожидается результата"""
+    if redis_client.redis_client is None:
+        return jsonify({"status": "error", "message": "Redis недоступен"}), 503
+    return job_response(job_runner, "sync", _sync_job)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5001) 
\ No newline at end of file
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from metrics import count_error, observe_stage, get_logger
+
+logger = get_logger("like_flusher")
+
+
+class LikeFlusher:
+    """
+    Фоновая запись лайков в MongoDB (write-behind).
+
+    Лайки принимаются в Redis, а поток раз в interval секунд забирает
+    фильмы с изменившимися счетчиками и записывает их в MongoDB одним
+    bulk-запросом. Пишется итоговое значение счетчика, поэтому повторная
+    запись после сбоя ничего не ломает.
+    """
+
+    def __init__(self, redis_client, mongo_client, interval=5.0, batch_size=1000):
+        self.redis_client = redis_client
+        self.mongo_client = mongo_client
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Запускает фоновый поток"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="like-flusher", daemon=True)
+            self._thread.start()
+            print(f"👍 Запись лайков в MongoDB каждые {self.interval}s")
+
+    def stop(self):
+        """Останавливает поток, предварительно сбросив накопленные лайки"""
+        self._stop.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """Записывает все накопленные изменения. Возвращает количество записанных фильмов."""
+        with self._lock:
+            flushed = 0
+            while True:
+                counts = self.redis_client.pop_dirty_likes(self.batch_size)
+                if not counts:
+                    return flushed
+
+                start = time.perf_counter()
+                try:
+                    self.mongo_client.save_like_counts(counts)
+                except Exception as e:
+                    # Возвращаем фильмы в очередь, запишем их в следующий раз
+                    self.redis_client.mark_likes_dirty(list(counts))
+                    count_error("like_flush")
+                    logger.error("like_flush_failed", movies=len(counts), error=str(e))
+                    return flushed
+
+                observe_stage("like_flush", time.perf_counter() - start)
+                flushed += len(counts)
+                logger.info("like_flush", movies=len(counts))
@@ -1,12 +1,47 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, IndexModel, ASCENDING
+from pymongo.errors import PyMongoError
 import json
+import os
+
+# Поля, которые нужны для синхронизации в Redis (_prepare_movie_for_redis, лидерборды, лайки)
+REDIS_SYNC_FIELDS = [
+    "name", "type", "year", "description", "shortDescription", "status", "rating",
+    "ageRating", "poster", "genres", "countries", "releaseYear", "isSeries", "category", "likes",
+]
+
+# Вторичные индексы под фильтры и фасеты (genres и countries — multikey)
+MOVIE_INDEXES = [
+    IndexModel([("genres", ASCENDING)], name="genres"),
+    IndexModel([("year", ASCENDING)], name="year"),
+    IndexModel([("category", ASCENDING)], name="category"),
+    IndexModel([("countries", ASCENDING)], name="countries"),
+]
+
+# Размер пачки курсора: меньше round trip'ов при полной выгрузке каталога
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", 2000))
 
 class MongoMovieClient:
     def __init__(self, host="mongodb://mongodb:27017", db_name="movies_db", collection_name="movies"):
         """Подключаемся к MongoDB"""
-        self.client = MongoClient(host)
+        self.client = MongoClient(
+            host,
+            maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", 50)),
+            minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", 0)),
+            maxIdleTimeMS=int(os.getenv("MONGO_MAX_IDLE_MS", 60000)),
+            serverSelectionTimeoutMS=int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000)),
+            appname="database-service"
+        )
         self.db = self.client[db_name]
         self.collection = self.db[collection_name]
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """Создает вторичные индексы, если их еще нет (повторный вызов ничего не меняет)"""
+        try:
+            names = self.collection.create_indexes(MOVIE_INDEXES)
+            print(f"✅ Индексы MongoDB: {', '.join(names)}")
+        except PyMongoError as e:
+            print(f"⚠️ Не удалось создать индексы MongoDB: {e}")
 
     def clear_and_load_movies(self, json_path):
         """Очищает базу и загружает фильмы из JSON-файла с нормализацией данных"""
@@ -75,26 +110,35 @@ class MongoMovieClient:
         """Возвращает фильм по ID"""
         return self.collection.find_one({"_id": movie_id}, {"_id": 0})
 
-    def get_movies(self):
-        """Возвращает все фильмы (с ID)"""
-        return list(self.collection.find({}))
+    def get_movies(self, fields=None):
+        """
+        Возвращает все фильмы (с ID). fields — список нужных полей,
+        по умолчанию только те, что нужны для синхронизации в Redis.
+        """
+        projection = {field: 1 for field in (fields or REDIS_SYNC_FIELDS)}
+        return list(self.collection.find({}, projection).batch_size(MONGO_BATCH_SIZE))
 
     def get_all_genres(self):
         """Возвращает список всех уникальных жанров из базы данных"""
         try:
-            # Используем агрегацию MongoDB для получения уникальных жанров
-            pipeline = [
-                {"$unwind": "$genres"},  # Разворачиваем массив жанров
-                {"$group": {"_id": "$genres"}},  # Группируем по жанрам
-                {"$sort": {"_id": 1}}  # Сортируем по алфавиту
-            ]
-            
-            genres = [doc["_id"].capitalize() for doc in self.collection.aggregate(pipeline)]
-            return genres
+            # distinct по multikey-индексу genres читает только индекс, а не документы
+            genres = sorted(genre for genre in self.collection.distinct("genres") if genre)
+            return [genre.capitalize() for genre in genres]
         except Exception as e:
             print(f"Ошибка при получении жанров из MongoDB: {e}")
             return []
 
+    def save_like_counts(self, counts):
+        """Записывает счетчики лайков одним bulk-запросом ({movie_id: likes})"""
+        if not counts:
+            return 0
+        operations = [
+            UpdateOne({"_id": int(movie_id)}, {"$set": {"likes": likes}})
+            for movie_id, likes in counts.items()
+        ]
+        result = self.collection.bulk_write(operations, ordered=False)
+        return result.modified_count
+
     def clear_db(self):
         """Полностью очищает базу данных"""
         self.collection.delete_many({})
@@ -0,0 +1,171 @@
+"""
+Ближний кэш фильмов в памяти процесса.
+
+Карточки популярных фильмов читаются намного чаще, чем меняются, поэтому
+HGETALL movie:<id> кэшируется в LRU с TTL. Чтобы не отдавать устаревшие
+данные до истечения TTL, кэш подписывается на инвалидации Redis 6+
+(CLIENT TRACKING ... REDIRECT ... BCAST PREFIX movie:): при любом изменении
+ключа сервер присылает его имя в канал __redis__:invalidate. Если Redis
+трекинг не поддерживает, кэш работает только по TTL.
+"""
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from redis import Connection
+from redis.exceptions import ConnectionError, ResponseError, TimeoutError
+
+from metrics import cache_event, INDEX_SIZE, get_logger
+from diagnostics import deep_sizeof
+
+logger = get_logger("near_cache")
+
+INVALIDATE_CHANNEL = "__redis__:invalidate"
+
+
+class NearCache:
+    """LRU с TTL; запись после чтения из Redis не проходит, если между ними пришла инвалидация"""
+
+    def __init__(self, max_size=10000, ttl=30.0, name="movie_near_cache"):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._epoch = 0
+
+    def get(self, key):
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                value = entry[0]
+            else:
+                value = None
+        cache_event(self.name, value is not None)
+        return value
+
+    def epoch(self):
+        """Метка, которую нужно взять до чтения из Redis и передать в set"""
+        return self._epoch
+
+    def set(self, key, value, epoch):
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._entries[key] = (value, monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            size = len(self._entries)
+        INDEX_SIZE.labels(self.name, "items").set(size)
+
+    def invalidate(self, keys):
+        with self._lock:
+            self._epoch += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+        INDEX_SIZE.labels(self.name, "items").set(0)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def size_bytes(self):
+        """Приблизительный объем кэша в памяти"""
+        with self._lock:
+            return deep_sizeof(dict(self._entries))
+
+
+class InvalidationListener:
+    """
+    Фоновый поток: отдельное соединение подписано на __redis__:invalidate,
+    второе включает для него CLIENT TRACKING в режиме BCAST по префиксу.
+    При обрыве любого из них кэш очищается и подписка восстанавливается.
+    """
+
+    def __init__(self, cache, connection_kwargs, prefix="movie:", ping_interval=10.0):
+        self.cache = cache
+        self.connection_kwargs = {
+            key: value for key, value in connection_kwargs.items()
+            if key in ("host", "port", "db", "username", "password", "socket_connect_timeout")
+        }
+        self.prefix = prefix
+        self.ping_interval = ping_interval
+        self.tracking = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._backoff = 1.0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="near-cache-invalidation", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except ResponseError as e:
+                # Redis без CLIENT TRACKING (< 6.0): остаемся на TTL
+                logger.warning("near_cache_tracking_unsupported", error=str(e))
+                print(f"⚠️ CLIENT TRACKING недоступен, ближний кэш работает только по TTL: {e}")
+                return
+            except (ConnectionError, TimeoutError, OSError) as e:
+                logger.warning("near_cache_tracking_lost", error=str(e))
+            finally:
+                self.tracking = False
+                self.cache.clear()
+            self._stop.wait(self._backoff)
+            self._backoff = min(self._backoff * 2, 30.0)
+
+    def _listen(self):
+        listener = Connection(**self.connection_kwargs)
+        tracker = Connection(**self.connection_kwargs)
+        try:
+            listener.connect()
+            listener.send_command("CLIENT", "ID")
+            client_id = listener.read_response()
+            listener.send_command("SUBSCRIBE", INVALIDATE_CHANNEL)
+            listener.read_response()
+
+            tracker.connect()
+            tracker.send_command("CLIENT", "TRACKING", "ON", "REDIRECT", client_id, "BCAST", "PREFIX", self.prefix)
+            tracker.read_response()
+
+            # Все, что закэшировано до подписки, могло устареть
+            self.cache.clear()
+            self.tracking = True
+            self._backoff = 1.0
+            print(f"✅ Ближний кэш подписан на инвалидации ключей {self.prefix}*")
+
+            last_ping = monotonic()
+            while not self._stop.is_set():
+                if listener.can_read(timeout=1.0):
+                    self._handle(listener.read_response())
+                if monotonic() - last_ping > self.ping_interval:
+                    # Трекинг живет, пока живо соединение tracker
+                    tracker.send_command("PING")
+                    tracker.read_response()
+                    last_ping = monotonic()
+        finally:
+            listener.disconnect()
+            tracker.disconnect()
+
+    def _handle(self, message):
+        if not isinstance(message, list) or len(message) < 3 or message[0] not in (b"message", "message"):
+            return
+        keys = message[2]
+        if keys is None:
+            # FLUSHDB / FLUSHALL
+            self.cache.clear()
+        else:
+            self.cache.invalidate(key.decode() if isinstance(key, bytes) else key for key in keys)
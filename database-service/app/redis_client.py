@@ -1,7 +1,137 @@
-from redis import Redis
+from redis import Redis, BlockingConnectionPool
+from redis.utils import HIREDIS_AVAILABLE
+import os
 import time
 import json
+import zlib
 from functools import wraps
+from metrics import timed, count_error, get_logger
+from near_cache import NearCache, InvalidationListener
+
+try:
+    import zstandard
+except ImportError:  # без zstandard холодные поля сжимаются zlib
+    zstandard = None
+
+logger = get_logger("redis_client")
+
+# Словарь автодополнения RediSearch (FT.SUGADD / FT.SUGGET)
+SUGGEST_KEY = "movie_suggest"
+
+# Версия каталога: увеличивается при каждой синхронизации или переиндексации
+CATALOG_VERSION_KEY = "catalog:version"
+
+# Лайки: счетчики в sorted set (он же рейтинг популярности),
+# множество лайкнутых фильмов на каждого пользователя и очередь на запись в MongoDB
+LIKES_RANKING_KEY = "likes:ranking"
+LIKES_DIRTY_KEY = "likes:dirty"
+LIKES_USER_PREFIX = "likes:user:"
+
+# Лидерборды: top:<метрика>:all и top:<метрика>:<фасет>:<значение>
+LEADERBOARD_PREFIX = "top:"
+LEADERBOARD_METRICS = ("rating", "likes", "popular")
+LEADERBOARD_FACETS = ("genre", "country", "category")
+# Популярность с затуханием: лайк весит 2^((t - epoch) / half_life), поэтому
+# старые лайки теряют вес относительно новых без пересчета всего множества.
+# Эпоха хранится в Redis; когда показатель степени доходит до
+# POPULARITY_REBASE_EXPONENT, все оценки делятся на 2^k, а эпоха сдвигается
+# на k периодов полураспада, чтобы веса не росли до бесконечности
+POPULARITY_EPOCH = 1704067200  # 2024-01-01: эпоха лидербордов, созданных до хранения эпохи в Redis
+POPULARITY_EPOCH_KEY = "popularity:epoch"
+POPULARITY_HALF_LIFE = float(os.getenv("POPULARITY_HALF_LIFE_DAYS", 7)) * 86400
+POPULARITY_REBASE_EXPONENT = 64
+
+# Формат хранения фильма (REDIS_MOVIE_FORMAT):
+#   full    — все поля строками в хеше movie:<id>;
+#   compact — в хеше только короткие поля списков (хеш остается listpack),
+#             а описания лежат сжатыми в desc:<id> и читаются только для карточки фильма
+MOVIE_FORMATS = ("full", "compact")
+COLD_FIELDS = ("description", "shortDescription")
+DESCRIPTION_PREFIX = "desc:"
+# Порог длины значения для listpack: ссылки на постеры длиннее стандартных 64 байт
+LISTPACK_VALUE_LIMIT = int(os.getenv("REDIS_LISTPACK_VALUE", 256))
+
+_ZSTD_TAG = b"Z"
+_ZLIB_TAG = b"D"
+
+
+def pack_cold_fields(fields):
+    """Сжимает холодные поля фильма; первый байт — метка алгоритма"""
+    data = json.dumps(fields, ensure_ascii=False).encode("utf-8")
+    if zstandard is not None:
+        return _ZSTD_TAG + zstandard.ZstdCompressor(level=3).compress(data)
+    return _ZLIB_TAG + zlib.compress(data, 6)
+
+
+def unpack_cold_fields(blob):
+    """Обратное к pack_cold_fields"""
+    if not blob:
+        return {}
+    tag, payload = blob[:1], blob[1:]
+    if tag == _ZSTD_TAG:
+        if zstandard is None:
+            # Смешанное развертывание: другой процесс писал с zstandard, а здесь его нет
+            raise RuntimeError("Описание сжато zstd, но модуль zstandard не установлен")
+        data = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        data = zlib.decompress(payload)
+    return json.loads(data)
+
+# Атомарно меняет лайк пользователя: счетчик двигается только если состояние изменилось,
+# поэтому повторная отправка того же лайка ничего не добавляет
+LIKE_SCRIPT = """
+local changed
+if tonumber(ARGV[2]) > 0 then
+    changed = redis.call('SADD', KEYS[1], ARGV[1])
+else
+    changed = redis.call('SREM', KEYS[1], ARGV[1])
+end
+if changed == 1 then
+    local score = redis.call('ZINCRBY', KEYS[2], ARGV[2], ARGV[1])
+    redis.call('SADD', KEYS[3], ARGV[1])
+    return {1, score}
+end
+return {0, redis.call('ZSCORE', KEYS[2], ARGV[1]) or '0'}
+"""
+
+# Добавляет вес нового лайка в лидерборды популярности. Вес считается от эпохи
+# из Redis в том же скрипте, поэтому не смешивается со сдвигом эпохи (эпохи
+# еще нет — берется POPULARITY_EPOCH, от которой считались старые оценки). Если
+# показатель степени слишком велик, скрипт ничего не меняет и возвращает 0 —
+# сначала нужно сдвинуть эпоху (POPULARITY_REBASE_SCRIPT)
+POPULARITY_INCR_SCRIPT = """
+local epoch = tonumber(redis.call('GET', KEYS[1]) or '')
+if not epoch then
+    epoch = tonumber(ARGV[4])
+    redis.call('SET', KEYS[1], ARGV[4])
+end
+local exponent = (tonumber(ARGV[2]) - epoch) / tonumber(ARGV[3])
+if exponent >= tonumber(ARGV[5]) then
+    return 0
+end
+local weight = 2 ^ exponent
+for i = 2, #KEYS do
+    redis.call('ZINCRBY', KEYS[i], weight, ARGV[1])
+end
+return 1
+"""
+
+# Сдвигает эпоху на ARGV[2] периодов полураспада и делит все оценки в KEYS[2..]
+# на 2^ARGV[2]. Если эпоху уже сдвинул другой процесс, ничего не делает
+POPULARITY_REBASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+local factor = 2 ^ -tonumber(ARGV[2])
+for i = 2, #KEYS do
+    local entries = redis.call('ZRANGE', KEYS[i], 0, -1, 'WITHSCORES')
+    for j = 1, #entries, 2 do
+        redis.call('ZADD', KEYS[i], tonumber(entries[j + 1]) * factor, entries[j])
+    end
+end
+redis.call('SET', KEYS[1], ARGV[3])
+return 1
+"""
 
 def redis_error_handler(func):
     """Декоратор для обработки ошибок Redis"""
@@ -10,6 +140,7 @@ def redis_error_handler(func):
         try:
             return func(*args, **kwargs)
         except Exception as e:
+            count_error(f"redis.{func.__name__}")
             print(f"❌ Ошибка Redis в {func.__name__}: {str(e)}")
             import traceback
             print(f"🔍 Детали ошибки:\n{traceback.format_exc()}")
@@ -17,11 +148,49 @@ def redis_error_handler(func):
     return wrapper
 
 class RedisMovieClient:
-    def __init__(self, host="localhost", port=6379, db=0, auto_load_from_mongo=False):
+    def __init__(self, host="localhost", port=6379, db=0, auto_load_from_mongo=False, movie_format=None):
         """Инициализация клиента Redis."""
+        self.movie_format = movie_format or os.getenv("REDIS_MOVIE_FORMAT", "full")
+        if self.movie_format not in MOVIE_FORMATS:
+            raise ValueError(f"Неизвестный формат хранения фильмов: {self.movie_format}")
         try:
             print(f"🔄 Подключение к Redis на {host}:{port}...")
-            self.redis_client = Redis(host=host, port=port, db=db, decode_responses=True)
+            # Явный размер пула: при исчерпании запрос ждет соединение до REDIS_POOL_TIMEOUT,
+            # а не открывает новые без ограничений. hiredis подхватывается автоматически.
+            # RESP3 (REDIS_PROTOCOL=3) по умолчанию выключен: redis-py 5.0 разбирает
+            # ответы FT.SEARCH в RESP3 в другом формате, чем ожидает search_movies.
+            self.pool = BlockingConnectionPool(
+                host=host,
+                port=port,
+                db=db,
+                decode_responses=True,
+                max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 50)),
+                timeout=float(os.getenv("REDIS_POOL_TIMEOUT", 1.0)),
+                socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", 2.0)),
+                socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", 2.0)),
+                socket_keepalive=True,
+                health_check_interval=30,
+                protocol=int(os.getenv("REDIS_PROTOCOL", 2)),
+            )
+            self.redis_client = Redis(connection_pool=self.pool, decode_responses=True)
+            # Сжатые описания читаются без декодирования ответов, через отдельный небольшой пул
+            binary_kwargs = dict(self.pool.connection_kwargs, decode_responses=False)
+            self.binary_client = Redis(
+                connection_pool=BlockingConnectionPool(
+                    max_connections=int(os.getenv("REDIS_BINARY_MAX_CONNECTIONS", 10)),
+                    timeout=self.pool.timeout,
+                    **binary_kwargs
+                ),
+                decode_responses=False
+            )
+            print(f"🔌 Пул Redis: до {self.pool.max_connections} соединений, парсер {'hiredis' if HIREDIS_AVAILABLE else 'python'}")
+            
+            # Ближний кэш карточек фильмов с инвалидацией через CLIENT TRACKING
+            self.near_cache = NearCache(
+                max_size=int(os.getenv("NEAR_CACHE_SIZE", 10000)),
+                ttl=float(os.getenv("NEAR_CACHE_TTL", 30))
+            )
+            self.invalidation_listener = None
             
             # Ждем, пока Redis будет готов
             max_retries = 30
@@ -40,11 +209,20 @@ class RedisMovieClient:
             else:
                 raise Exception("Redis не ответил после всех попыток подключения")
         
+            if os.getenv("NEAR_CACHE_TRACKING", "1") == "1":
+                self.invalidation_listener = InvalidationListener(self.near_cache, self.pool.connection_kwargs)
+                self.invalidation_listener.start()
+        
+            if self.movie_format == "compact":
+                self._ensure_listpack_limit()
+        
             # Проверяем количество фильмов в базе
             movie_count = len(self.redis_client.keys("movie:*") or [])
             print(f"📊 В базе данных {movie_count} фильмов")
 
             # Проверяем наличие индекса RediSearch
+            # (без модуля RediSearch словарь автодополнения не ведется)
+            self.search_available = False
             self._ensure_search_index()
 
             # Автоматическая загрузка данных из MongoDB при инициализации
@@ -58,6 +236,61 @@ class RedisMovieClient:
             print(f"🔍 Детали ошибки:\n{traceback.format_exc()}")
             self.redis_client = None
 
+    def _ensure_listpack_limit(self):
+        """Поднимает порог длины значения listpack, чтобы компактный хеш не превращался в hashtable"""
+        for option in ("hash-max-listpack-value", "hash-max-ziplist-value"):
+            try:
+                current = self.redis_client.config_get(option).get(option)
+            except Exception:
+                continue
+            if current is None:
+                continue
+            if int(current) < LISTPACK_VALUE_LIMIT:
+                try:
+                    self.redis_client.config_set(option, LISTPACK_VALUE_LIMIT)
+                    print(f"✅ {option} = {LISTPACK_VALUE_LIMIT}")
+                except Exception as e:
+                    # Управляемый Redis может запрещать CONFIG SET
+                    print(f"⚠️ Не удалось изменить {option}: {e}")
+            return
+
+    def _write_movie(self, client, movie_id, redis_movie):
+        """Записывает фильм в выбранном формате (client — соединение или pipeline)"""
+        redis_id = f"movie:{movie_id}"
+        if self.movie_format == "full":
+            client.hset(redis_id, mapping=redis_movie)
+            return
+
+        hot = {key: value for key, value in redis_movie.items() if key not in COLD_FIELDS}
+        cold = {key: redis_movie[key] for key in COLD_FIELDS if redis_movie.get(key)}
+        client.hset(redis_id, mapping=hot)
+        client.hdel(redis_id, *COLD_FIELDS)
+        if cold:
+            client.set(f"{DESCRIPTION_PREFIX}{movie_id}", pack_cold_fields(cold))
+        else:
+            client.delete(f"{DESCRIPTION_PREFIX}{movie_id}")
+
+    def _read_movie(self, movie_id):
+        """Читает фильм целиком (с описаниями) одним round trip'ом"""
+        redis_id = f"movie:{movie_id}"
+        if self.movie_format == "full":
+            return self.redis_client.hgetall(redis_id)
+
+        pipeline = self.binary_client.pipeline(transaction=False)
+        pipeline.hgetall(redis_id)
+        pipeline.get(f"{DESCRIPTION_PREFIX}{movie_id}")
+        raw_movie, cold = pipeline.execute()
+        if not raw_movie:
+            return {}
+        movie = {key.decode(): value.decode() for key, value in raw_movie.items()}
+        try:
+            movie.update(unpack_cold_fields(cold))
+        except Exception as e:
+            # Карточка без описания лучше, чем 404 на весь фильм
+            count_error("cold_fields")
+            logger.error("cold_fields_failed", movie_id=movie_id, error=str(e))
+        return movie
+
     @redis_error_handler
     def _ensure_search_index(self):
         """Проверяет наличие индекса RediSearch и создает его при необходимости."""
@@ -94,6 +327,7 @@ class RedisMovieClient:
                 ]
                 self.redis_client.execute_command(*create_index_cmd)
                 print("✅ Создан новый индекс RediSearch для фильмов")
+            self.search_available = True
         except Exception as e:
             print(f"❌ Ошибка при создании индекса RediSearch: {str(e)}")
             raise
@@ -122,15 +356,25 @@ class RedisMovieClient:
         # Создаем копию фильма для Redis
         redis_movie = self._prepare_movie_for_redis(movie)
         
-        # Сохраняем фильм в Redis
-        self.redis_client.hset(redis_id, mapping=redis_movie)
+        # Сохраняем фильм в Redis (хеш и, в компактном формате, описания) одним pipeline
+        pipeline = self.redis_client.pipeline(transaction=False)
+        self._write_movie(pipeline, movie_id, redis_movie)
+        pipeline.execute()
+        self.near_cache.invalidate([redis_id])
+        
+        # Обновляем словарь автодополнения и лидерборды
+        self._add_suggestion(self.redis_client, movie_id, redis_movie)
+        self._add_to_leaderboards(self.redis_client, movie_id, redis_movie, movie.get("likes"))
         
         print(f"📝 Сохранен фильм в Redis: {redis_id} -> {redis_movie.get('name', 'Без названия')}")
         return True
 
     @redis_error_handler
-    def save_movies_bulk(self, movies_list):
-        """Сохраняет список фильмов в Redis."""
+    def save_movies_bulk(self, movies_list, progress=None):
+        """
+        Сохраняет список фильмов в Redis.
+        progress — необязательный progress(done=, total=) для отчета о ходе записи.
+        """
         if not self.redis_client:
             print("❌ Соединение с Redis не установлено")
             return 0
@@ -170,14 +414,15 @@ class RedisMovieClient:
                     print(f"⚠️ Пропущен фильм без ID: {movie}")
                     continue
 
-                # Преобразуем ID в строку и добавляем префикс "movie:"
-                redis_id = f"movie:{movie_id}"
-                
                 # Создаем копию фильма для Redis
                 redis_movie = self._prepare_movie_for_redis(movie)
                 
-                # Сохраняем фильм в Redis
-                pipeline.hset(redis_id, mapping=redis_movie)
+                # Сохраняем фильм в Redis (ключ movie:<id>, в компактном формате еще desc:<id>)
+                self._write_movie(pipeline, movie_id, redis_movie)
+                
+                # Обновляем словарь автодополнения и лидерборды в том же pipeline
+                self._add_suggestion(pipeline, movie_id, redis_movie)
+                self._add_to_leaderboards(pipeline, movie_id, redis_movie, movie.get("likes"))
                 
                 saved_count += 1
                 if i % 1000 == 0:  # Логируем каждую 1000 фильмов
@@ -185,11 +430,16 @@ class RedisMovieClient:
                     # Выполняем промежуточное сохранение
                     pipeline.execute()
                     pipeline = self.redis_client.pipeline(transaction=False)
+                    if progress:
+                        progress(done=i, total=len(movies_list))
                 
             # Выполняем оставшиеся команды в pipeline
             if saved_count % 1000 != 0:
                 print("💾 Применяем финальные изменения в Redis...")
                 pipeline.execute()
+            if progress:
+                progress(done=len(movies_list), total=len(movies_list))
+            self.near_cache.clear()
             
             # Проверяем фактическое количество фильмов в Redis
             actual_count = len(self.redis_client.keys("movie:*"))
@@ -203,6 +453,152 @@ class RedisMovieClient:
             print(f"🔍 Детали ошибки:\n{traceback.format_exc()}")
             return 0
 
+    def _add_suggestion(self, client, movie_id, redis_movie):
+        """Добавляет название фильма в словарь автодополнения с весом по рейтингу."""
+        if not self.search_available:
+            return
+        name = redis_movie.get("name")
+        if not name or name == "Без названия":
+            return
+        try:
+            score = float(redis_movie.get("rating", 0))
+        except (ValueError, TypeError):
+            score = 0
+        # FT.SUGADD требует положительный вес, фильмы без рейтинга идут в конец
+        score = max(score, 0.1)
+        client.execute_command("FT.SUGADD", SUGGEST_KEY, name, score, "PAYLOAD", str(movie_id))
+
+    def _leaderboard_key(self, metric, facet=None, value=None):
+        """Ключ лидерборда по метрике и (необязательно) фасету"""
+        if not facet:
+            return f"{LEADERBOARD_PREFIX}{metric}:all"
+        return f"{LEADERBOARD_PREFIX}{metric}:{facet}:{str(value).strip().lower()}"
+
+    def _movie_leaderboard_keys(self, metric, redis_movie):
+        """Все лидерборды метрики, в которые попадает фильм"""
+        keys = [self._leaderboard_key(metric)]
+        for genre in filter(None, redis_movie.get("genres", "").split("|")):
+            keys.append(self._leaderboard_key(metric, "genre", genre))
+        for country in filter(None, redis_movie.get("countries", "").split("|")):
+            keys.append(self._leaderboard_key(metric, "country", country))
+        if redis_movie.get("category"):
+            keys.append(self._leaderboard_key(metric, "category", redis_movie["category"]))
+        return keys
+
+    def _add_to_leaderboards(self, client, movie_id, redis_movie, likes=None):
+        """Добавляет фильм в лидерборды по рейтингу и лайкам (при синхронизации)"""
+        try:
+            rating = float(redis_movie.get("rating", 0))
+        except (ValueError, TypeError):
+            rating = 0
+        if rating > 0:
+            for key in self._movie_leaderboard_keys("rating", redis_movie):
+                client.zadd(key, {str(movie_id): rating})
+        if likes:
+            for key in self._movie_leaderboard_keys("likes", redis_movie):
+                client.zadd(key, {str(movie_id): likes})
+
+    def _popularity_epoch(self):
+        """Эпоха популярности из Redis (для старых лидербордов — POPULARITY_EPOCH)"""
+        epoch = self.redis_client.get(POPULARITY_EPOCH_KEY)
+        return float(epoch) if epoch is not None else POPULARITY_EPOCH
+
+    def _add_popularity(self, movie_id, redis_movie):
+        """Добавляет вес нового лайка; при необходимости сначала сдвигает эпоху"""
+        keys = [POPULARITY_EPOCH_KEY] + self._movie_leaderboard_keys("popular", redis_movie)
+        for _ in range(2):
+            added = self.redis_client.eval(
+                POPULARITY_INCR_SCRIPT, len(keys), *keys,
+                str(movie_id), time.time(), POPULARITY_HALF_LIFE, POPULARITY_EPOCH, POPULARITY_REBASE_EXPONENT
+            )
+            if added:
+                return
+            self._rebase_popularity()
+
+    def _rebase_popularity(self):
+        """Делит оценки популярности на 2^k и сдвигает эпоху на k периодов полураспада"""
+        stored = self.redis_client.get(POPULARITY_EPOCH_KEY)
+        if stored is None:
+            return
+        periods = int((time.time() - float(stored)) // POPULARITY_HALF_LIFE)
+        if periods <= 0:
+            return
+        # Пока эпоха не сдвинута, скрипт прибавления ничего не пишет, поэтому новых ключей не появится
+        keys = list(self.redis_client.scan_iter(match=f"{LEADERBOARD_PREFIX}popular:*", count=1000))
+        new_epoch = float(stored) + periods * POPULARITY_HALF_LIFE
+        if self.redis_client.eval(
+            POPULARITY_REBASE_SCRIPT, len(keys) + 1, POPULARITY_EPOCH_KEY, *keys,
+            stored, periods, repr(new_epoch)
+        ):
+            print(f"⚖️ Эпоха популярности сдвинута на {periods} периодов, лидербордов: {len(keys)}")
+
+    def _update_like_leaderboards(self, movie_id, delta):
+        """Обновляет лидерборды лайков и популярности после лайка или его отмены"""
+        redis_movie = self.redis_client.hgetall(f"movie:{movie_id}")
+        if not redis_movie:
+            return
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for key in self._movie_leaderboard_keys("likes", redis_movie):
+            pipeline.zincrby(key, delta, str(movie_id))
+        pipeline.execute()
+        # Популярность растет только от новых лайков: отмена не стирает уже проявленный интерес
+        if delta > 0:
+            self._add_popularity(movie_id, redis_movie)
+
+    @redis_error_handler
+    def get_leaderboard(self, metric, facet=None, value=None, limit=20, offset=0):
+        """Страница лидерборда: фильмы с их значением метрики."""
+        if not self.redis_client:
+            return []
+
+        key = self._leaderboard_key(metric, facet, value)
+        entries = self.redis_client.zrevrange(key, offset, offset + limit - 1, withscores=True)
+        if not entries:
+            return []
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for movie_id, _ in entries:
+            pipeline.hgetall(f"movie:{movie_id}")
+        movies_data = pipeline.execute()
+
+        # Популярность храним в растущих весах, а отдаем приведенной к текущему моменту
+        # (отрицательная степень не переполняется, сколько бы времени ни прошло)
+        scale = 1
+        if metric == "popular":
+            scale = 2 ** -((time.time() - self._popularity_epoch()) / POPULARITY_HALF_LIFE)
+
+        movies = []
+        for (movie_id, score), movie_data in zip(entries, movies_data):
+            if not movie_data or score <= 0:
+                continue
+            movie_data["id"] = movie_id
+            movie_data["score"] = round(score * scale, 4)
+            movies.append(movie_data)
+        return movies
+
+    @redis_error_handler
+    def suggest(self, prefix, limit=10, fuzzy=False):
+        """Возвращает подсказки по префиксу названия из словаря автодополнения."""
+        if not self.redis_client:
+            return []
+
+        prefix = (prefix or "").strip()
+        if not prefix:
+            return []
+
+        command = ["FT.SUGGET", SUGGEST_KEY, prefix]
+        if fuzzy:
+            command.append("FUZZY")
+        command += ["MAX", int(limit), "WITHPAYLOADS"]
+        raw = self.redis_client.execute_command(*command) or []
+
+        # Ответ приходит плоским списком: название, payload, название, payload...
+        suggestions = []
+        for name, payload in zip(raw[::2], raw[1::2]):
+            suggestions.append({"id": payload, "name": name})
+        return suggestions
+
     def _prepare_movie_for_redis(self, movie):
         """Подготавливает фильм для сохранения в Redis."""
         # Создаем копию фильма для Redis
@@ -301,14 +697,6 @@ class RedisMovieClient:
     def search_movies(self, query="", genre=None, year=None, movie_type=None, country=None, category=None):
         """Поиск фильмов в Redis"""
         try:
-            print(f"🔍 Поиск фильмов в Redis:")
-            print(f"  Запрос: {query}")
-            print(f"  Жанр: {genre}")
-            print(f"  Год: {year}")
-            print(f"  Тип: {movie_type}")
-            print(f"  Страна: {country}")
-            print(f"  Категория: {category}")
-
             # Формируем базовый поисковый запрос
             search_query = []
             
@@ -336,17 +724,17 @@ class RedisMovieClient:
 
             # Если нет ни одного условия поиска, возвращаем пустой результат
             if not search_query:
-                print("❌ Пустой поисковый запрос")
+                logger.debug("redis_search_empty_query")
                 return []
 
             # Объединяем все условия через AND
             final_query = " & ".join(search_query)
-            print(f"📝 Итоговый запрос к Redis: {final_query}")
 
             # Выполняем поиск
             try:
-                results = self.redis_client.ft("movies_idx").search(final_query)
-                print(f"✅ Найдено результатов: {results.total}")
+                with timed("redis_query"):
+                    results = self.redis_client.ft("movies_idx").search(final_query)
+                logger.info("redis_search", query=final_query, total=results.total)
                 
                 # Преобразуем результаты в список словарей
                 movies = []
@@ -359,11 +747,13 @@ class RedisMovieClient:
                 
                 return movies
             except Exception as e:
-                print(f"❌ Ошибка при выполнении поиска: {str(e)}")
+                count_error("redis.search_movies")
+                logger.error("redis_search_failed", query=final_query, error=str(e))
                 return []
 
         except Exception as e:
-            print(f"❌ Ошибка в search_movies: {str(e)}")
+            count_error("redis.search_movies")
+            logger.error("redis_search_failed", query=query, error=str(e))
             return []
 
     @redis_error_handler
@@ -373,12 +763,32 @@ class RedisMovieClient:
             return None
             
         redis_id = f"movie:{movie_id}"
-        movie_data = self.redis_client.hgetall(redis_id)
+        cached = self.near_cache.get(redis_id)
+        if cached is not None:
+            return dict(cached)
+        
+        epoch = self.near_cache.epoch()
+        with timed("redis_get"):
+            movie_data = self._read_movie(movie_id)
         
         if not movie_data:
             return None
             
-        return movie_data
+        self.near_cache.set(redis_id, movie_data, epoch)
+        return dict(movie_data)
+
+    @redis_error_handler
+    def get_posters(self, cursor=0, count=500):
+        """Страница ссылок на постеры по SCAN: (следующий курсор, [[id, ссылка], ...]); курсор 0 — конец"""
+        if not self.redis_client:
+            return 0, []
+
+        cursor, keys = self.redis_client.scan(cursor, match="movie:*", count=count)
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.hget(key, "poster")
+        posters = pipeline.execute()
+        return cursor, [[key.split(":", 1)[1], poster] for key, poster in zip(keys, posters) if poster]
 
     @redis_error_handler
     def get_all_genres(self):
@@ -428,25 +838,147 @@ class RedisMovieClient:
                 
         return sorted(list(categories_set))
 
+    @redis_error_handler
+    def get_catalog_version(self):
+        """Возвращает текущую версию каталога."""
+        if not self.redis_client:
+            return 0
+        return int(self.redis_client.get(CATALOG_VERSION_KEY) or 0)
+
+    @redis_error_handler
+    def bump_catalog_version(self):
+        """Увеличивает версию каталога, чтобы клиенты сбросили свои кэши."""
+        if not self.redis_client:
+            return 0
+        version = self.redis_client.incr(CATALOG_VERSION_KEY)
+        print(f"🔖 Версия каталога: {version}")
+        return version
+
+    @redis_error_handler
+    def like_movie(self, user_id, movie_id, liked=True):
+        """Ставит или снимает лайк пользователя. Возвращает (изменилось ли состояние, число лайков)."""
+        if not self.redis_client:
+            return None
+
+        changed, likes = self.redis_client.eval(
+            LIKE_SCRIPT, 3,
+            f"{LIKES_USER_PREFIX}{user_id}", LIKES_RANKING_KEY, LIKES_DIRTY_KEY,
+            str(movie_id), 1 if liked else -1
+        )
+        if changed:
+            self._update_like_leaderboards(movie_id, 1 if liked else -1)
+        return bool(changed), max(int(float(likes)), 0)
+
+    @redis_error_handler
+    def is_movie_liked(self, user_id, movie_id):
+        """Проверяет, лайкнул ли пользователь фильм."""
+        if not self.redis_client:
+            return False
+        return bool(self.redis_client.sismember(f"{LIKES_USER_PREFIX}{user_id}", str(movie_id)))
+
+    @redis_error_handler
+    def get_likes_count(self, movie_id):
+        """Возвращает количество лайков фильма."""
+        if not self.redis_client:
+            return 0
+        return int(self.redis_client.zscore(LIKES_RANKING_KEY, str(movie_id)) or 0)
+
+    @redis_error_handler
+    def get_most_liked(self, limit=10, offset=0):
+        """Возвращает самые лайкаемые фильмы за O(log N + limit)."""
+        if not self.redis_client:
+            return []
+        ranking = self.redis_client.zrevrange(LIKES_RANKING_KEY, offset, offset + limit - 1, withscores=True)
+        return [{"id": movie_id, "likes": int(score)} for movie_id, score in ranking if score > 0]
+
+    @redis_error_handler
+    def pop_dirty_likes(self, batch_size=1000):
+        """Забирает из очереди фильмы с изменившимися лайками и возвращает их текущие счетчики."""
+        if not self.redis_client:
+            return {}
+        movie_ids = self.redis_client.spop(LIKES_DIRTY_KEY, batch_size)
+        if not movie_ids:
+            return {}
+        scores = self.redis_client.zmscore(LIKES_RANKING_KEY, movie_ids)
+        return {movie_id: int(score or 0) for movie_id, score in zip(movie_ids, scores)}
+
+    @redis_error_handler
+    def mark_likes_dirty(self, movie_ids):
+        """Возвращает фильмы в очередь на запись (если запись в MongoDB не удалась)."""
+        if self.redis_client and movie_ids:
+            self.redis_client.sadd(LIKES_DIRTY_KEY, *movie_ids)
+
+    @redis_error_handler
+    def restore_likes(self, movies):
+        """Восстанавливает счетчики лайков из MongoDB, если в Redis их нет."""
+        if not self.redis_client or self.redis_client.exists(LIKES_RANKING_KEY):
+            return 0
+        counts = {}
+        for movie in movies:
+            likes = movie.get("likes") or 0
+            movie_id = movie.get("id", movie.get("_id"))
+            if likes > 0 and movie_id is not None:
+                counts[str(movie_id)] = likes
+        if counts:
+            self.redis_client.zadd(LIKES_RANKING_KEY, counts)
+            print(f"👍 Восстановлены лайки для {len(counts)} фильмов")
+        return len(counts)
+
+    @redis_error_handler
+    def clear_movies(self):
+        """
+        Удаляет фильмы, словарь подсказок и лидерборды по рейтингу и лайкам
+        (они пересобираются при загрузке), не трогая лайки пользователей,
+        популярность и версию каталога.
+        """
+        if not self.redis_client:
+            return False
+
+        deleted = 0
+        patterns = ["movie:*", f"{DESCRIPTION_PREFIX}*", f"{LEADERBOARD_PREFIX}rating:*", f"{LEADERBOARD_PREFIX}likes:*"]
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for pattern in patterns:
+            for key in self.redis_client.scan_iter(pattern, count=1000):
+                pipeline.unlink(key)
+                deleted += 1
+                if deleted % 1000 == 0:
+                    pipeline.execute()
+        pipeline.delete(SUGGEST_KEY)
+        pipeline.execute()
+        self.near_cache.clear()
+        print(f"🗑️ Удалено {deleted} ключей фильмов и лидербордов из Redis")
+        return True
+
     @redis_error_handler
     def flush_db(self):
         """Полностью очищает базу данных Redis."""
         if not self.redis_client:
             return False
             
+        # Версию каталога сохраняем, иначе после очистки она начнется заново
+        # и клиенты примут новый каталог за уже закэшированный
+        catalog_version = self.redis_client.get(CATALOG_VERSION_KEY)
         self.redis_client.flushdb()
+        self.near_cache.clear()
+        if catalog_version is not None:
+            self.redis_client.set(CATALOG_VERSION_KEY, catalog_version)
         print("🗑️ База данных Redis очищена")
         return True
 
     @redis_error_handler
-    def load_from_mongodb(self, mongo_client):
-        """Загружает фильмы из MongoDB в Redis."""
+    def load_from_mongodb(self, mongo_client, progress=None):
+        """
+        Загружает фильмы из MongoDB в Redis.
+        progress — необязательный progress(done=, total=, stage=) (см. jobs.Job.progress).
+        """
+        progress = progress or (lambda **kwargs: None)
         if not self.redis_client:
             print("❌ Соединение с Redis не установлено")
             return False
             
         try:
             print("📥 Получаем фильмы из MongoDB...")
+            progress(stage="read_mongo")
             # Получаем все фильмы из MongoDB
             movies = mongo_client.get_movies()
             
@@ -455,18 +987,23 @@ class RedisMovieClient:
                 return False
                 
             print(f"📊 Найдено {len(movies)} фильмов в MongoDB")
+            progress(done=len(movies), total=len(movies))
             
             # Проверяем подключение к Redis перед очисткой
             if not self.redis_client.ping():
                 print("❌ Redis не отвечает на ping")
                 return False
             
-            # Очищаем существующие данные в Redis
+            # Очищаем существующие фильмы в Redis (лайки пользователей сохраняются)
             print("🗑️ Очищаем существующие данные в Redis...")
-            self.flush_db()
+            progress(stage="clear")
+            self.clear_movies()
             
             # Сохраняем фильмы в Redis
-            saved_count = self.save_movies_bulk(movies)
+            progress(stage="write", total=len(movies))
+            saved_count = self.save_movies_bulk(movies, progress=progress)
+            progress(stage="restore_likes")
+            self.restore_likes(movies)
             
             if saved_count > 0:
                 print(f"✅ Загружено {saved_count} фильмов из MongoDB в Redis")
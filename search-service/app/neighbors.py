@@ -0,0 +1,97 @@
+"""
+Граф ближайших соседей для рекомендаций «похожие фильмы».
+
+Для каждого фильма заранее считаются top-K похожих по косинусному сходству
+эмбеддингов. Граф хранится компактно: номера строк в int32 и сходство в
+float16, так что на 100 тысяч фильмов и K=50 уходит около 30 МБ.
+
+Офлайн-сборка:
+    python neighbors.py --embeddings movies_embeddings.npy --output movies_neighbors.npz --k 50
+"""
+import argparse
+import os
+from time import time
+
+import faiss
+import numpy as np
+
+DEFAULT_NEIGHBORS = 50
+
+
+def build_neighbor_graph(embeddings, k=DEFAULT_NEIGHBORS, batch_size=4096, threads=None):
+    """
+    Строит граф top-k соседей пакетным поиском FAISS по всем ядрам.
+    Эмбеддинги должны быть нормализованы (скалярное произведение = косинус).
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    rows = len(embeddings)
+    k = min(k, rows - 1)
+
+    faiss.omp_set_num_threads(threads or os.cpu_count() or 1)
+    index = faiss.IndexFlatIP(embeddings.shape[1])
+    index.add(embeddings)
+
+    neighbor_ids = np.empty((rows, k), dtype=np.int32)
+    neighbor_scores = np.empty((rows, k), dtype=np.float16)
+
+    for start in range(0, rows, batch_size):
+        batch = embeddings[start:start + batch_size]
+        # Ищем k+1, потому что первым обычно находится сам фильм
+        scores, ids = index.search(batch, k + 1)
+
+        for offset in range(len(batch)):
+            row = start + offset
+            keep = ids[offset] != row
+            row_ids = ids[offset][keep][:k]
+            row_scores = scores[offset][keep][:k]
+            neighbor_ids[row] = row_ids
+            neighbor_scores[row] = row_scores
+
+    return neighbor_ids, neighbor_scores
+
+
+def save_neighbor_graph(path, neighbor_ids, neighbor_scores):
+    """Сохраняет граф в .npz"""
+    np.savez(path, ids=neighbor_ids, scores=neighbor_scores)
+
+
+def load_neighbor_graph(path, expected_rows):
+    """Загружает граф, если он есть и построен для того же количества фильмов"""
+    try:
+        graph = np.load(path)
+        neighbor_ids, neighbor_scores = graph["ids"], graph["scores"]
+    except (FileNotFoundError, PermissionError, KeyError, ValueError):
+        return None
+
+    if len(neighbor_ids) != expected_rows:
+        print(f"⚠️ Граф соседей {path} построен для {len(neighbor_ids)} фильмов, а в базе {expected_rows}")
+        return None
+
+    print(f"✅ Граф соседей загружен из {path}: {neighbor_ids.shape}")
+    return neighbor_ids, neighbor_scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-сборка графа похожих фильмов")
+    parser.add_argument("--embeddings", default="movies_embeddings.npy")
+    parser.add_argument("--output", default="movies_neighbors.npz")
+    parser.add_argument("--k", type=int, default=DEFAULT_NEIGHBORS)
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    embeddings = np.load(args.embeddings).astype(np.float32)
+    faiss.normalize_L2(embeddings)
+    print(f"📊 Эмбеддинги: {embeddings.shape}, строим top-{args.k} соседей...")
+
+    start_time = time()
+    neighbor_ids, neighbor_scores = build_neighbor_graph(
+        embeddings, k=args.k, batch_size=args.batch_size, threads=args.threads
+    )
+    save_neighbor_graph(args.output, neighbor_ids, neighbor_scores)
+    size_mb = (neighbor_ids.nbytes + neighbor_scores.nbytes) / 1024 / 1024
+    print(f"✅ Граф сохранен в {args.output} за {time() - start_time:.1f}s ({size_mb:.1f} МБ)")
+
+
+if __name__ == "__main__":
+    main()
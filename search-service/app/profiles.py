@@ -0,0 +1,77 @@
+import numpy as np
+from redis import Redis, WatchError
+from redis.exceptions import RedisError
+
+from metrics import timed, count_error, get_logger
+
+logger = get_logger("profiles")
+
+PROFILE_PREFIX = "profile:"
+
+
+class ProfileStore:
+    """
+    Профили пользователей для персонализации поиска.
+
+    Профиль — среднее эмбеддингов лайкнутых фильмов. Он хранится в Redis
+    хешем profile:<user_id> с полями vec (float32 в байтах) и n (количество
+    лайков) и пересчитывается инкрементально при каждом лайке или его отмене.
+    """
+
+    def __init__(self, host="localhost", port=6379, db=0, timeout=0.05):
+        # Короткий таймаут: персонализация не должна задерживать поиск
+        self.redis_client = Redis(host=host, port=port, db=db, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+    def get(self, user_id):
+        """Возвращает нормализованный вектор профиля или None (одним запросом к Redis)"""
+        try:
+            with timed("profile_fetch"):
+                vector = self.redis_client.hget(f"{PROFILE_PREFIX}{user_id}", "vec")
+        except RedisError as e:
+            count_error("profile_fetch")
+            logger.warning("profile_fetch_failed", user_id=user_id, error=str(e))
+            return None
+
+        if not vector:
+            return None
+        profile = np.frombuffer(vector, dtype=np.float32)
+        norm = np.linalg.norm(profile)
+        return profile / norm if norm > 0 else None
+
+    def update(self, user_id, embedding, liked=True, retries=5):
+        """Добавляет эмбеддинг фильма в среднее профиля или убирает его оттуда"""
+        key = f"{PROFILE_PREFIX}{user_id}"
+        embedding = np.asarray(embedding, dtype=np.float32)
+
+        for _ in range(retries):
+            try:
+                with self.redis_client.pipeline() as pipeline:
+                    pipeline.watch(key)
+                    stored = pipeline.hgetall(key)
+                    count = int(stored.get(b"n", 0))
+                    mean = np.frombuffer(stored[b"vec"], dtype=np.float32) if count else np.zeros_like(embedding)
+
+                    if liked:
+                        count += 1
+                        mean = mean + (embedding - mean) / count
+                    elif count > 1:
+                        mean = (mean * count - embedding) / (count - 1)
+                        count -= 1
+                    else:
+                        count = 0
+
+                    pipeline.multi()
+                    if count:
+                        pipeline.hset(key, mapping={"vec": mean.astype(np.float32).tobytes(), "n": count})
+                    else:
+                        pipeline.delete(key)
+                    pipeline.execute()
+                    return count
+            except WatchError:
+                # Профиль изменился параллельно — пересчитываем заново
+                continue
+            except RedisError as e:
+                count_error("profile_update")
+                logger.error("profile_update_failed", user_id=user_id, error=str(e))
+                return None
+        return None
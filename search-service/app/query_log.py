@@ -0,0 +1,126 @@
+"""
+Журнал поисковых запросов.
+
+Доля запросов (QUERY_LOG_SAMPLE) пишется в файл QUERY_LOG_PATH по одной
+компактной JSON-строке:
+
+    {"t": 1700000000.123, "q": "комедия про лето", "y": "2010", "g": "", "k": 10,
+     "m": "semantic", "ms": 12.4, "c": "hit"}
+
+t — время запроса, q — нормализованный текст, y/g/k — фильтры года, жанра
+и top_k, m — режим поиска, ms — задержка, c — результат кэша (hit, miss,
+bypass, title, degraded или null для поиска по названию), f — остальные
+непустые фильтры (type, country, category), если они заданы, n — запрос
+после свертки и исправления опечаток (query_rewrite.py), если он
+отличается от q.
+
+Файл ротируется по размеру, как обычные логи. Запись идет через очередь
+в отдельном потоке и не задерживает запрос.
+
+Журнал используется для прогрева кэша после деплоя (top_queries) и для
+нагрузочного прогона benchmarks/replay_queries.py.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import random
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from time import time
+
+from metrics import get_logger
+
+logger = get_logger("query_log")
+
+
+def normalize_query(query):
+    """Нормализованный текст запроса: нижний регистр и одиночные пробелы"""
+    return " ".join((query or "").lower().split())
+
+
+class QueryLog:
+    """Сэмплирующая запись запросов в ротируемый файл"""
+
+    def __init__(self, path, sample_rate=1.0, max_bytes=10 * 1024 * 1024, backups=5):
+        self.path = path
+        self.sample_rate = sample_rate
+        self._logger = None
+        self._listener = None
+        if not path or sample_rate <= 0:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        except OSError as e:
+            logger.warning("query_log_disabled", path=path, error=str(e))
+            print(f"⚠️ Журнал запросов {path} недоступен: {e}")
+            return
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+
+        log_queue = queue.SimpleQueue()
+        self._logger = logging.getLogger("movie_queries")
+        self._logger.setLevel(logging.INFO)
+        self._logger.addHandler(QueueHandler(log_queue))
+        self._logger.propagate = False
+
+        self._listener = QueueListener(log_queue, file_handler)
+        self._listener.start()
+        atexit.register(self._listener.stop)
+        print(f"✅ Журнал запросов: {path} (доля {sample_rate})")
+
+    @property
+    def enabled(self):
+        return self._logger is not None
+
+    def record(self, query, year, genre, top_k, mode, seconds, cache=None, filters=None, rewritten=None):
+        """Записывает запрос с вероятностью sample_rate"""
+        if self._logger is None or random.random() >= self.sample_rate:
+            return
+        entry = {
+            "t": round(time(), 3),
+            "q": normalize_query(query),
+            "y": year or "",
+            "g": genre or "",
+            "k": top_k,
+            "m": mode,
+            "ms": round(seconds * 1000, 2),
+            "c": cache,
+        }
+        filters = {name: value for name, value in (filters or {}).items() if value}
+        if filters:
+            entry["f"] = filters
+        if rewritten and rewritten != entry["q"]:
+            entry["n"] = rewritten
+        self._logger.info(json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+
+
+def read_entries(path):
+    """Записи журнала вместе с ротированными файлами, от старых к новым"""
+    rotated = [name for name in glob.glob(f"{glob.escape(path)}.*") if name.rsplit(".", 1)[1].isdigit()]
+    files = sorted(rotated, key=lambda name: int(name.rsplit(".", 1)[1]), reverse=True)
+    files.append(path)
+
+    for name in files:
+        try:
+            with open(name, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue  # Оборванная при ротации или сбое строка
+        except OSError:
+            continue
+
+
+def top_queries(path, limit=100, mode="semantic"):
+    """Самые частые запросы режима mode (после переписывания): список (запрос, год, жанр, top_k)"""
+    counts = Counter(
+        (entry.get("n") or entry["q"], entry.get("y", ""), entry.get("g", ""), entry.get("k", 10))
+        for entry in read_entries(path)
+        if entry.get("m") == mode and entry.get("q")
+    )
+    return [key for key, _ in counts.most_common(limit)]
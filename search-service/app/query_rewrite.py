@@ -0,0 +1,216 @@
+"""
+Нормализация и исправление запросов перед кэшем и моделью.
+
+1. Свертка: Unicode NFKC, регистр, ё → е, пунктуация и лишние пробелы.
+2. Опечатки исправляются по словарю из слов названий фильмов и жанров
+   (SymSpell: индекс удалений символов из префикса слова, поэтому поиск
+   кандидата — несколько обращений к словарю, а не перебор словаря).
+   Исправляются только незнакомые слова: знакомыми считаются слова
+   названий, жанров, описаний фильмов и словаря QUERY_WORDLIST. Исправление
+   принимается, только если исправленный запрос без стоп-слов ("фильм",
+   "про", "the" ...) целиком — название фильма.
+3. Если свернутый запрос совпадает с названием фильма, он отмечается как
+   точное попадание: такой запрос отдается без модели.
+
+Переписанный текст (text) — это и ключ кэша, и запрос для модели: стоп-слова
+в нем остаются, чтобы под одним ключом не оказались запросы, которые модель
+и разбор фильтров понимают по-разному.
+
+Словарь строится при загрузке каталога и пересобирается при переиндексации.
+"""
+import os
+import re
+import unicodedata
+from collections import Counter, namedtuple
+
+# Максимальное число правок при исправлении опечатки и длина индексируемого префикса
+TYPO_MAX_DISTANCE = int(os.getenv("QUERY_TYPO_DISTANCE", 2))
+TYPO_PREFIX_LENGTH = int(os.getenv("QUERY_TYPO_PREFIX", 6))
+# Слова короче не исправляются, а в словах до TYPO_SHORT_LENGTH допускается одна правка:
+# в коротком слове слишком легко "исправить" правильное слово на другое
+TYPO_MIN_LENGTH = 4
+TYPO_SHORT_LENGTH = 5
+# Словарь общей лексики (по слову в строке): слова из него никогда не исправляются
+QUERY_WORDLIST = os.getenv("QUERY_WORDLIST")
+# Поля фильма, слова которых считаются знакомыми
+KNOWN_WORD_FIELDS = ("description", "shortDescription")
+
+# Слова, без которых запрос сверяется с названиями. Жанры и типы ("мультфильм",
+# "сериал") сюда не входят: по ним разбираются фильтры запроса
+STOPWORDS = frozenset("""
+фильм фильмы фильма фильмов кино
+про о об в во на с со и или из за по для от до к ко а но что как
+найти покажи посмотреть смотреть онлайн бесплатно
+the a an of and or in on about movie movies film films
+""".split())
+
+_PUNCTUATION = re.compile(r"[^\w\s]+", re.UNICODE)
+
+Rewrite = namedtuple("Rewrite", ["folded", "text", "corrections", "title_row"])
+Rewrite.__doc__ = """
+Результат переписывания запроса: folded — свернутый запрос, text — свернутый
+запрос с принятыми исправлениями опечаток (ключ кэша и запрос для модели),
+corrections — список исправлений [(было, стало)], title_row — строка фильма,
+если свернутый запрос в точности совпадает с названием, иначе None.
+"""
+
+
+def fold(text):
+    """Свертка регистра, Unicode, ё → е, пунктуации и пробелов"""
+    text = unicodedata.normalize("NFKC", text or "").casefold().replace("ё", "е")
+    return " ".join(_PUNCTUATION.sub(" ", text).split())
+
+
+def strip_stopwords(tokens):
+    """Убирает стоп-слова; если не осталось ничего, возвращает токены как есть"""
+    kept = [token for token in tokens if token not in STOPWORDS]
+    return kept or tokens
+
+
+def edit_distance(a, b, limit):
+    """Расстояние Дамерау-Левенштейна (с перестановкой соседних символов); больше limit — limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SymSpell:
+    """Исправление опечаток в отдельных словах по словарю с частотами"""
+
+    def __init__(self, frequencies, max_distance=TYPO_MAX_DISTANCE, prefix_length=TYPO_PREFIX_LENGTH,
+                 known_words=None):
+        self.frequencies = frequencies
+        # Слова, которые не исправляются (кандидатами для исправления остаются только слова frequencies)
+        self.known_words = frozenset(frequencies) if known_words is None else frozenset(known_words) | set(frequencies)
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        # Удаление из префикса -> слово словаря (или кортеж слов): большинство удалений
+        # уникальны, и строка вместо списка заметно уменьшает индекс
+        self.deletes = {}
+        for word in frequencies:
+            if len(word) >= TYPO_MIN_LENGTH:
+                for variant in self._deletes(word[:prefix_length]):
+                    current = self.deletes.get(variant)
+                    if current is None:
+                        self.deletes[variant] = word
+                    elif isinstance(current, str):
+                        self.deletes[variant] = (current, word)
+                    else:
+                        self.deletes[variant] = current + (word,)
+
+    def _deletes(self, word, max_distance=None):
+        """Само слово и все варианты с удалением до max_distance символов"""
+        variants = {word}
+        frontier = {word}
+        for _ in range(self.max_distance if max_distance is None else max_distance):
+            frontier = {item[:i] + item[i + 1:] for item in frontier for i in range(len(item))} - variants
+            variants |= frontier
+        return variants
+
+    def correct(self, word):
+        """Ближайшее слово словаря (при равенстве — самое частое) или само слово, если оно знакомое"""
+        if word in self.known_words or len(word) < TYPO_MIN_LENGTH or not word.isalpha():
+            return word
+
+        max_distance = 1 if len(word) <= TYPO_SHORT_LENGTH else self.max_distance
+        best, best_key = word, None
+        seen = set()
+        for variant in self._deletes(word[:self.prefix_length], max_distance):
+            candidates = self.deletes.get(variant, ())
+            for candidate in (candidates,) if isinstance(candidates, str) else candidates:
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                distance = edit_distance(word, candidate, max_distance)
+                if distance > max_distance:
+                    continue
+                key = (distance, -self.frequencies[candidate])
+                if best_key is None or key < best_key:
+                    best, best_key = candidate, key
+        return best
+
+
+class QueryRewriter:
+    """Словарь каталога и переписывание запросов"""
+
+    def __init__(self, metadata, genres=(), wordlist=QUERY_WORDLIST):
+        genres = {fold(genre) for genre in genres}
+        frequencies = Counter()
+        known_words = set(_load_wordlist(wordlist))
+        self.titles = {}  # свернутое название -> строка фильма с наибольшим рейтингом
+        self.title_texts = set()  # названия без стоп-слов: с ними сверяется исправленный запрос
+
+        for row, movie in enumerate(metadata):
+            title = fold(movie.get("name") or "")
+            tokens = title.split()
+            frequencies.update(token for token in tokens if not token.isdigit())
+            for field in KNOWN_WORD_FIELDS:
+                known_words.update(fold(movie.get(field) or "").split())
+            # Название, совпадающее с жанром или годом, не считается точным попаданием
+            if len(title) < 3 or title in genres or title.isdigit():
+                continue
+            self.title_texts.add(" ".join(strip_stopwords(tokens)))
+            current = self.titles.get(title)
+            if current is None or _rating(movie) > _rating(metadata[current]):
+                self.titles[title] = row
+
+        # Жанры встречаются в запросах чаще любых слов из названий
+        top = max(frequencies.values(), default=1)
+        for genre in genres:
+            for token in genre.split():
+                frequencies[token] += top
+        self.speller = SymSpell(dict(frequencies), known_words=known_words)
+
+    def rewrite(self, query):
+        """Переписывает запрос; см. Rewrite"""
+        folded = fold(query)
+        tokens = folded.split()
+
+        corrections = []
+        corrected = []
+        for token in tokens:
+            fixed = token if token in STOPWORDS else self.speller.correct(token)
+            if fixed != token:
+                corrections.append((token, fixed))
+            corrected.append(fixed)
+        # Исправление по словам названий принимается, только если получилось название целиком:
+        # иначе незнакомое, но правильное слово заменилось бы похожим словом из каталога
+        text = folded
+        if corrections and " ".join(strip_stopwords(corrected)) in self.title_texts:
+            text = " ".join(corrected)
+        else:
+            corrections = []
+
+        # Точное попадание — только сам запрос, а не его исправленная форма
+        return Rewrite(folded, text, corrections, self.titles.get(folded))
+
+
+def _load_wordlist(path):
+    """Слова из файла словаря (свернутые); без файла — пустой словарь"""
+    if not path:
+        return []
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [fold(line) for line in f if line.strip()]
+    except OSError as e:
+        print(f"⚠️ Не удалось прочитать словарь {path}: {e}")
+        return []
+
+
+def _rating(movie):
+    try:
+        return float(movie.get("rating") or 0)
+    except (TypeError, ValueError):
+        return 0.0
@@ -0,0 +1,175 @@
+"""
+Многоступенчатое ранжирование результатов поиска.
+
+1. Отбор кандидатов: косинусное сходство по всем эмбеддингам и top-N, плюс
+   top-N среди фильмов, подходящих под жанр и год, чтобы фильтры не терялись.
+2. Пересчет признаков только по кандидатам: текст, расстояние до года в
+   годах, доля совпавших жанров, рейтинг, лайки. Веса берутся из
+   DEFAULT_CONFIG и JSON-файла RANKING_CONFIG.
+3. Необязательное переранжирование top-30 кросс-энкодером (RERANK_MODEL),
+   которое пропускается, если у запроса осталось мало времени.
+"""
+import json
+import os
+from contextlib import contextmanager
+from time import perf_counter
+
+import numpy as np
+
+from metrics import observe_stage, get_logger
+
+logger = get_logger("ranking")
+
+DEFAULT_CONFIG = {
+    # Веса признаков второй ступени
+    "weights": {
+        "text": 0.8,
+        "year": 0.05,
+        "genre": 0.1,
+        "rating": 0.03,
+        "likes": 0.02,
+    },
+    "candidates": 200,
+    # Насколько далеко (в годах) год фильма может отстоять от запрошенного, чтобы получить бонус
+    "year_window": 10,
+    "rerank_top": 30,
+    "rerank_weight": 0.5,
+    # Минимальный остаток бюджета запроса (секунды), при котором запускается кросс-энкодер
+    "rerank_min_budget": 0.5,
+}
+
+
+def load_ranking_config(path=None):
+    """Конфигурация ранжирования: значения по умолчанию, поверх них — JSON из RANKING_CONFIG"""
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    path = path or os.getenv("RANKING_CONFIG")
+    if not path:
+        return config
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            overrides = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Не удалось прочитать конфигурацию ранжирования {path}: {e}")
+        return config
+
+    config["weights"].update(overrides.pop("weights", {}))
+    config.update(overrides)
+    print(f"✅ Конфигурация ранжирования загружена из {path}")
+    return config
+
+
+def _to_float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def build_features(metadata):
+    """Признаки фильмов для второй ступени, нормализованные в [0, 1] (кроме года)"""
+    years = np.array([_to_float(movie.get("year")) for movie in metadata], dtype=np.float32)
+    ratings = np.array([_to_float(movie.get("rating")) for movie in metadata], dtype=np.float32)
+    likes = np.array([max(_to_float(movie.get("likes")), 0.0) for movie in metadata], dtype=np.float32)
+
+    likes = np.log1p(likes)
+    return {
+        "year": years,
+        "rating": np.clip(ratings / 10.0, 0.0, 1.0),
+        "likes": likes / likes.max() if likes.size and likes.max() > 0 else likes,
+    }
+
+
+@contextmanager
+def stage(trace, name):
+    """Замеряет ступень: в гистограмму этапов и, в режиме отладки, в trace"""
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - start
+        observe_stage(name, elapsed)
+        if trace is not None:
+            trace[name] = round(elapsed * 1000, 3)
+
+
+def retrieve_candidates(text_scores, limit, mask=None):
+    """Ступень 1: top-N по тексту, плюс top-N среди подходящих под фильтры"""
+    limit = min(limit, len(text_scores))
+    candidates = np.argpartition(text_scores, -limit)[-limit:]
+
+    if mask is not None:
+        filtered = np.flatnonzero(mask)
+        if len(filtered) > limit:
+            filtered = filtered[np.argpartition(text_scores[filtered], -limit)[-limit:]]
+        candidates = np.union1d(candidates, filtered)
+    return candidates
+
+
+def filter_mask(features, genre_index, year, genres, year_window):
+    """Маска фильмов, подходящих под год или жанры запроса (None — фильтров нет)"""
+    mask = None
+    if year is not None:
+        mask = np.abs(features["year"] - year) <= year_window
+    for genre in genres:
+        rows = genre_index.get(genre)
+        if rows is not None:
+            if mask is None:
+                mask = np.zeros(len(features["year"]), dtype=bool)
+            mask[rows] = True
+    return mask
+
+
+def score_candidates(candidates, text_scores, features, genre_index, config, year=None, genres=()):
+    """Ступень 2: векторный пересчет признаков только по кандидатам"""
+    weights = config["weights"]
+    scores = weights["text"] * text_scores[candidates]
+
+    if year is not None:
+        distance = np.abs(features["year"][candidates] - year)
+        scores += weights["year"] * np.clip(1.0 - distance / config["year_window"], 0.0, 1.0)
+
+    known = [genre for genre in genres if genre in genre_index]
+    if known:
+        overlap = np.zeros(len(candidates), dtype=np.float32)
+        for genre in known:
+            overlap += np.isin(candidates, genre_index[genre])
+        scores += weights["genre"] * overlap / len(known)
+
+    scores += weights["rating"] * features["rating"][candidates]
+    scores += weights["likes"] * features["likes"][candidates]
+    return scores
+
+
+class CrossEncoderReranker:
+    """Ступень 3: кросс-энкодер по парам (запрос, название + описание)"""
+
+    def __init__(self, model_name, device="cpu"):
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name, device=device, max_length=256)
+        print(f"✅ Кросс-энкодер {model_name} загружен")
+
+    def rerank(self, query, movies, base_scores, weight):
+        """Смешивает оценку кросс-энкодера (сигмоида) с оценкой второй ступени"""
+        pairs = [
+            (query, f"{movie.get('name', '')}. {movie.get('description', '') or ''}")
+            for movie in movies
+        ]
+        logits = np.asarray(self.model.predict(pairs, show_progress_bar=False), dtype=np.float32)
+        relevance = 1.0 / (1.0 + np.exp(-logits))
+        return (1.0 - weight) * base_scores + weight * relevance
+
+
+def load_reranker(device="cpu"):
+    """Загружает кросс-энкодер из RERANK_MODEL; без переменной третья ступень выключена"""
+    model_name = os.getenv("RERANK_MODEL")
+    if not model_name:
+        return None
+    try:
+        return CrossEncoderReranker(model_name, device=device)
+    except Exception as e:
+        logger.error("reranker_load_failed", model=model_name, error=str(e))
+        print(f"⚠️ Кросс-энкодер {model_name} не загружен, третья ступень выключена")
+        return None
@@ -0,0 +1,242 @@
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import sleep, time
+
+from redis.exceptions import RedisError
+
+from metrics import cache_event, count_error, get_logger
+from diagnostics import deep_sizeof
+
+logger = get_logger("result_cache")
+
+# Снимает блокировку, только если она все еще принадлежит этому вызову:
+# после истечения TTL ее уже могла взять другая реплика
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class ResultCache:
+    """
+    Двухуровневый кэш результатов поиска.
+
+    L1 — LRU в памяти процесса, L2 — Redis, общий для всех реплик.
+    Каждая запись свежая fresh_ttl секунд, после чего еще stale_ttl секунд
+    отдается как устаревшая, а в фоне пересчитывается (stale-while-revalidate).
+    Одновременные промахи по одному ключу ждут единственного вычисления:
+    внутри процесса — через общий Future, между репликами — через
+    блокировку в Redis. Ожидание ограничивается timeout вызова: по его
+    истечении get_or_compute выбрасывает TimeoutError.
+    """
+
+    def __init__(self, redis_client=None, max_size=1000, fresh_ttl=300, stale_ttl=3600,
+                 lock_timeout=10.0, prefix="search:"):
+        self.redis_client = redis_client
+        self.max_size = max_size
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.lock_timeout = lock_timeout
+        self.prefix = prefix
+
+        self._entries = OrderedDict()  # key -> (value, created_at)
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> Future
+        self._refreshing = set()  # ключи, для которых фоновое обновление уже запланировано
+        self._generation = 1
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def size_bytes(self):
+        """Приблизительный объем L1 в памяти"""
+        with self._lock:
+            return deep_sizeof(dict(self._entries))
+
+    def clear(self):
+        """Очищает L1 (L2 устаревает сам: в ключах есть поколение индекса)"""
+        with self._lock:
+            self._entries.clear()
+
+    def load_generation(self):
+        """Текущее поколение индекса, общее для всех реплик (в Redis хранится число переиндексаций)"""
+        if self.redis_client is not None:
+            try:
+                self._generation = int(self.redis_client.get(f"{self.prefix}generation") or 0) + 1
+            except RedisError as e:
+                logger.warning("result_cache_generation_failed", error=str(e))
+        return self._generation
+
+    def bump_generation(self):
+        """Переходит к новому поколению: старые ключи L2 больше не читаются и истекают по TTL"""
+        self.clear()
+        self._generation += 1
+        if self.redis_client is not None:
+            try:
+                self._generation = int(self.redis_client.incr(f"{self.prefix}generation")) + 1
+            except RedisError as e:
+                logger.warning("result_cache_generation_failed", error=str(e))
+        return self._generation
+
+    def peek(self, key):
+        """Значение из кэша без вычисления, даже устаревшее (для деградированного режима)"""
+        entry = self._get_l1(key) or self._get_l2(key)
+        if entry is None or time() - entry[1] >= self.fresh_ttl + self.stale_ttl:
+            return None
+        return entry[0]
+
+    def get_or_compute(self, key, compute, timeout=None):
+        """
+        Возвращает результат из кэша или вычисляет его ровно один раз.
+        timeout — сколько секунд можно ждать чужого вычисления (None — без ограничения).
+        """
+        entry = self._get_l1(key)
+        if entry is None:
+            entry = self._get_l2(key)
+            if entry is not None:
+                self._set_l1(key, *entry)
+
+        if entry is not None:
+            value, created_at = entry
+            age = time() - created_at
+            if age < self.fresh_ttl:
+                return value
+            if age < self.fresh_ttl + self.stale_ttl:
+                # Отдаем устаревшее значение сразу, а свежее считаем в фоне
+                cache_event("search_stale", True)
+                with self._lock:
+                    scheduled = key in self._refreshing or key in self._inflight
+                    if not scheduled:
+                        self._refreshing.add(key)
+                if not scheduled:
+                    self._refresher.submit(self._refresh, key, compute)
+                return value
+
+        return self._single_flight(key, compute, timeout)
+
+    def _refresh(self, key, compute):
+        """Фоновое обновление устаревшей записи; пока задача ждала в очереди, запись могла освежиться"""
+        try:
+            entry = self._get_l1(key)
+            if entry is None or time() - entry[1] >= self.fresh_ttl:
+                entry = self._get_l2(key)
+            if entry is not None and time() - entry[1] < self.fresh_ttl:
+                self._set_l1(key, *entry)
+                return
+            self._single_flight(key, compute)
+        except Exception as e:
+            count_error("result_cache_refresh")
+            logger.warning("result_cache_refresh_failed", error=str(e))
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _single_flight(self, key, compute, timeout=None):
+        """Одно вычисление на ключ: остальные вызовы ждут его результата"""
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            cache_event("search_coalesced", True)
+            return future.result(timeout)
+
+        try:
+            value = self._compute_across_replicas(key, compute, timeout)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _compute_across_replicas(self, key, compute, timeout=None):
+        """Берет блокировку в Redis; если ее держит другая реплика — ждет ее результата в L2"""
+        lock_key = f"{self.prefix}lock:{key}"
+        token = uuid.uuid4().hex
+        acquired = False
+        if self.redis_client is not None:
+            try:
+                acquired = bool(self.redis_client.set(lock_key, token, nx=True, px=int(self.lock_timeout * 1000)))
+                waiting = not acquired
+            except RedisError:
+                waiting = False  # Redis недоступен — просто считаем сами
+
+            if waiting:
+                wait = self.lock_timeout if timeout is None else min(timeout, self.lock_timeout)
+                deadline = time() + wait
+                while time() < deadline:
+                    sleep(0.02)
+                    entry = self._get_l2(key)
+                    if entry is not None and time() - entry[1] < self.fresh_ttl:
+                        cache_event("search_coalesced", True)
+                        self._set_l1(key, *entry)
+                        return entry[0]
+                if wait < self.lock_timeout:
+                    raise TimeoutError(f"Результат другой реплики не готов за {wait:.2f} с")
+                # Другая реплика не успела: считаем сами, но ее блокировку не трогаем
+
+        try:
+            value = compute()
+            self._store(key, value)
+            return value
+        finally:
+            if acquired:
+                try:
+                    self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+                except RedisError:
+                    pass
+
+    def _get_l1(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        cache_event("search_l1", entry is not None)
+        return entry
+
+    def _set_l1(self, key, value, created_at):
+        with self._lock:
+            self._entries[key] = (value, created_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _get_l2(self, key):
+        if self.redis_client is None:
+            return None
+        try:
+            payload = self.redis_client.get(f"{self.prefix}{key}")
+        except RedisError as e:
+            count_error("result_cache_l2")
+            logger.warning("result_cache_l2_failed", error=str(e))
+            return None
+
+        cache_event("search_l2", payload is not None)
+        if payload is None:
+            return None
+        data = json.loads(payload)
+        return data["v"], data["t"]
+
+    def _store(self, key, value):
+        created_at = time()
+        self._set_l1(key, value, created_at)
+        if self.redis_client is None:
+            return
+        try:
+            payload = json.dumps({"v": value, "t": created_at}, ensure_ascii=False, default=str)
+            self.redis_client.set(f"{self.prefix}{key}", payload, ex=int(self.fresh_ttl + self.stale_ttl))
+        except RedisError as e:
+            count_error("result_cache_l2")
+            logger.warning("result_cache_l2_failed", error=str(e))
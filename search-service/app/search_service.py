@@ -1,24 +1,179 @@
 from flask import Flask, jsonify, request
-from turbo_search import TurboMovieSearch
+from turbo_search import TurboMovieSearch, SearchCatalog, ComputeSaturated
+from profiles import ProfileStore
+from result_cache import ResultCache
+from query_log import QueryLog, top_queries
+from redis import Redis
+from metrics import register_metrics, timed, count_error, count_shed, get_logger
+from admission import register_admission, remaining, call_timeout, budget_headers, saturated
+from diagnostics import register_diagnostics
+from jobs import JobRunner, job_response, register_jobs
+from serialization import respond, decode, accept_header
 import os
+import threading
+from time import perf_counter
 from dotenv import load_dotenv
 import requests
 
 load_dotenv()
 
 app = Flask(__name__)
+register_metrics(app)
+register_admission(app)
+logger = get_logger("search_service")
+
+# Общий для всех реплик кэш результатов (L1 в памяти + L2 в Redis)
+cache_timeout = float(os.getenv("RESULT_CACHE_TIMEOUT", 0.1))
+result_cache = ResultCache(
+    redis_client=Redis(
+        host=os.getenv("REDIS_HOST", "redis"),
+        port=int(os.getenv("REDIS_PORT", 6379)),
+        db=int(os.getenv("REDIS_DB", 0)),
+        socket_timeout=cache_timeout,
+        socket_connect_timeout=cache_timeout
+    ),
+    max_size=int(os.getenv("RESULT_CACHE_SIZE", 1000)),
+    fresh_ttl=int(os.getenv("RESULT_CACHE_TTL", 300)),
+    stale_ttl=int(os.getenv("RESULT_CACHE_STALE_TTL", 3600))
+)
+
+# Семантический путь (кодирование запроса моделью) ограничен отдельно: слот берется
+# только на время вычисления выдачи, а попадания в кэш и ожидание чужого вычисления
+# его не занимают. Когда слотов нет или бюджета не хватает, отвечаем из кэша или поиском по названию
+SEMANTIC_CONCURRENCY = int(os.getenv("SEMANTIC_CONCURRENCY", 4))
+semantic_slots = threading.BoundedSemaphore(SEMANTIC_CONCURRENCY)
 
 # Инициализация поисковой системы
 search_engine = TurboMovieSearch(
     mongo_host=os.getenv("MONGO_URI", "mongodb://mongodb:27017"),
     mongo_db=os.getenv("MONGO_DB", "movies_db"),
-    mongo_collection=os.getenv("MONGO_COLLECTION", "movies")
+    mongo_collection=os.getenv("MONGO_COLLECTION", "movies"),
+    result_cache=result_cache,
+    compute_slots=semantic_slots
+)
+
+# Профили пользователей для персонализации (Redis)
+profile_store = ProfileStore(
+    host=os.getenv("REDIS_HOST", "redis"),
+    port=int(os.getenv("REDIS_PORT", 6379)),
+    db=int(os.getenv("REDIS_DB", 0)),
+    timeout=float(os.getenv("PROFILE_TIMEOUT", 0.05))
+)
+
+register_diagnostics(app, components=search_engine.memory_usage)
+
+# Переиндексация идет в фоне, прогресс — в /jobs/<id> (состояние в Redis, видно из любой реплики).
+# Она пересобирает данные в памяти именно этого процесса, поэтому блокировка своя у каждой реплики:
+# общая блокировка вернула бы id задачи другой реплики, и эта осталась бы со старым индексом
+job_runner = JobRunner(Redis(
+    host=os.getenv("REDIS_HOST", "redis"),
+    port=int(os.getenv("REDIS_PORT", 6379)),
+    db=int(os.getenv("REDIS_DB", 0)),
+    socket_timeout=5,
+    socket_connect_timeout=5
+), shared_lock=False)
+register_jobs(app, job_runner)
+
+# Журнал запросов: по нему после деплоя прогревается кэш и прогоняется нагрузка
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "query_logs/queries.log")
+query_log = QueryLog(
+    QUERY_LOG_PATH,
+    sample_rate=float(os.getenv("QUERY_LOG_SAMPLE", 0.1)),
+    max_bytes=int(os.getenv("QUERY_LOG_MAX_BYTES", 10 * 1024 * 1024)),
+    backups=int(os.getenv("QUERY_LOG_BACKUPS", 5))
 )
 
+def _warm_search_cache(limit):
+    """Прогревает кэш самыми частыми запросами из журнала (в фоне, чтобы не задерживать старт)"""
+    try:
+        queries = top_queries(QUERY_LOG_PATH, limit)
+        if not queries:
+            return
+        start = perf_counter()
+        computed = search_engine.warm_cache(queries)
+        print(f"🔥 Кэш прогрет: {len(queries)} запросов, вычислено {computed} за {perf_counter() - start:.1f} с")
+        logger.warning("search_cache_warmed", queries=len(queries), computed=computed)
+    except Exception as e:
+        logger.error("search_cache_warm_failed", error=str(e), exc_info=True)
+
+WARM_CACHE_TOP = int(os.getenv("WARM_CACHE_TOP", 100))
+if QUERY_LOG_PATH and WARM_CACHE_TOP > 0:
+    threading.Thread(target=_warm_search_cache, args=(WARM_CACHE_TOP,), name="warm-search-cache", daemon=True).start()
+
 @app.route("/health")
 def health_check():
     return jsonify({"status": "healthy"})
 
+# Меньше этого бюджета семантический поиск и догрузка фильмов не начинаются
+SEMANTIC_MIN_BUDGET = float(os.getenv("SEMANTIC_MIN_BUDGET", 0.3))
+HYDRATE_MIN_BUDGET = float(os.getenv("HYDRATE_MIN_BUDGET", 0.05))
+
+def _redis_search(db_service_url, params):
+    """Поиск по названию через Redis в сервисе БД"""
+    with timed("redis_search"):
+        response = requests.get(
+            f"{db_service_url}/movies/search",
+            params=params,
+            timeout=call_timeout(10),
+            headers={**budget_headers(), **accept_header()}
+        )
+    
+    if response.status_code != 200:
+        count_error("redis_search")
+        logger.warning("redis_search_failed", query=params["query"], status=response.status_code, body=response.text[:200])
+        return []
+    
+    results = decode(response)
+    logger.info("redis_search", query=params["query"], status=response.status_code, found=len(results))
+    return results
+
+def _hydrate(db_service_url, results):
+    """Подтягивает полные данные фильмов; при нехватке времени отдает остаток как есть"""
+    movies = []
+    with timed("hydrate"):
+        for position, result in enumerate(results):
+            movie_id = result.get("id")
+            if not movie_id:
+                # Если ID нет, используем данные из результата поиска
+                movies.append(result)
+                continue
+            
+            left = remaining()
+            if saturated() or (left is not None and left < HYDRATE_MIN_BUDGET):
+                count_shed("hydrate_skipped")
+                movies.extend(results[position:])
+                break
+            
+            try:
+                response = requests.get(
+                    f"{db_service_url}/movies/{movie_id}",
+                    timeout=call_timeout(2),
+                    headers={**budget_headers(), **accept_header()}
+                )
+                if response.status_code == 200:
+                    movie_data = decode(response)
+                    movie_data["relevance_score"] = result.get("relevance_score", 0)
+                    movies.append(movie_data)
+            except requests.exceptions.RequestException as e:
+                count_error("hydrate")
+                logger.error("hydrate_failed", movie_id=movie_id, error=str(e))
+    return movies
+
+def _degraded_search(db_service_url, params, top_k, reason, stats):
+    """Дешевый ответ без модели: устаревший результат из кэша или поиск по названию"""
+    count_shed(f"semantic_{reason}")
+    stats["cache"] = "degraded"
+    results = search_engine.cached_search(params["query"], top_k, params["year"] or None, params["genre"] or None)
+    source = "cache"
+    if results is None:
+        results = _redis_search(db_service_url, params)
+        source = "redis"
+    
+    logger.warning("search_degraded", query=params["query"], reason=reason, source=source)
+    response = respond(results)
+    response.headers["X-Degraded"] = source
+    return response
+
 @app.route("/search")
 def search():
     query = request.args.get("query", "")
@@ -26,75 +181,93 @@ def search():
     genre = request.args.get("genre")
     top_k = int(request.args.get("top_k", 10))
     search_mode = request.args.get("search_mode", "semantic")
+    params = {
+        "query": query,
+        "year": year if year else "",
+        "genre": genre if genre else "",
+        "type": request.args.get("type", ""),
+        "country": request.args.get("country", ""),
+        "category": request.args.get("category", "")
+    }
+    # Результат кэша для журнала запросов (у поиска по названию кэша нет)
+    stats = {}
+    start = perf_counter()
     
     try:
         # Получаем URL сервиса базы данных
         db_service_url = os.getenv("DATABASE_SERVICE_URL", "http://database:5001")
-        print(f"🔍 Поисковый запрос: {query} (режим: {search_mode})")
+        logger.info("search_request", query=query, mode=search_mode)
         
         if search_mode == "redis":
             # Поиск по названию через Redis
-            params = {
-                "query": query,
-                "year": year if year else "",
-                "genre": genre if genre else "",
-                "type": request.args.get("type", ""),
-                "country": request.args.get("country", ""),
-                "category": request.args.get("category", "")
-            }
-            
-            print(f"📨 Отправка запроса к Redis: {params}")
             try:
-                response = requests.get(f"{db_service_url}/movies/search", params=params, timeout=10)
-                print(f"📥 Ответ от Redis: {response.status_code}")
-                
-                if response.status_code == 200:
-                    results = response.json()
-                    print(f"✅ Найдено результатов: {len(results)}")
-                    return jsonify(results)
-                else:
-                    print(f"❌ Ошибка при поиске через Redis: {response.status_code}")
-                    print(f"Ответ: {response.text}")
-                    return jsonify([])
+                return respond(_redis_search(db_service_url, params))
             except requests.exceptions.RequestException as e:
-                print(f"❌ Ошибка при обращении к Redis: {str(e)}")
+                count_error("redis_search")
+                logger.error("redis_search_failed", query=query, error=str(e))
                 return jsonify([])
         else:
             # Семантический поиск через FAISS
+            left = remaining()
+            if left is not None and left < SEMANTIC_MIN_BUDGET:
+                return _degraded_search(db_service_url, params, top_k, "budget", stats)
+            
+            # В режиме отладки возвращаем время каждой ступени ранжирования
+            trace = {} if request.args.get("debug") in ("1", "true") else None
+            
             try:
+                # Персонализация только для пользователей с профилем, анонимы идут прежним путем
+                user_id = request.args.get("user_id")
+                profile = profile_store.get(user_id) if user_id else None
+                
                 results = search_engine.search(
                     query=query,
                     top_k=top_k,
                     year_filter=year,
-                    genre_filter=genre
+                    genre_filter=genre,
+                    profile=profile,
+                    budget=remaining(),
+                    trace=trace,
+                    stats=stats
                 )
-                
-                # Получаем полные данные о фильмах
-                movies = []
-                for result in results:
-                    movie_id = result.get("id")
-                    if movie_id:
-                        try:
-                            response = requests.get(f"{db_service_url}/movies/{movie_id}")
-                            if response.status_code == 200:
-                                movie_data = response.json()
-                                movie_data["relevance_score"] = result.get("relevance_score", 0)
-                                movies.append(movie_data)
-                        except requests.exceptions.RequestException as e:
-                            print(f"❌ Ошибка при получении данных фильма {movie_id}: {str(e)}")
-                            continue
-                    else:
-                        # Если ID нет, используем данные из результата поиска
-                        movies.append(result)
-                
-                return jsonify(movies)
+            except ComputeSaturated:
+                return _degraded_search(db_service_url, params, top_k, "saturated", stats)
+            except TimeoutError:
+                # Чужое вычисление того же запроса не успело за оставшийся бюджет
+                return _degraded_search(db_service_url, params, top_k, "budget", stats)
             except Exception as e:
-                print(f"❌ Ошибка при семантическом поиске: {str(e)}")
+                count_error("semantic_search")
+                logger.error("semantic_search_failed", query=query, error=str(e), exc_info=True)
                 return jsonify([])
             
+            # Получаем полные данные о фильмах
+            hydrate_start = perf_counter()
+            movies = _hydrate(db_service_url, results)
+            if trace is not None:
+                trace["hydrate"] = round((perf_counter() - hydrate_start) * 1000, 3)
+                rerank = trace.pop("rerank_status", "off")
+                return respond({"results": movies, "debug": {"timings_ms": trace, "rerank": rerank}})
+            return respond(movies)
+            
     except Exception as e:
-        print(f"❌ Ошибка при поиске: {str(e)}")
+        count_error("search")
+        logger.error("search_failed", query=query, error=str(e), exc_info=True)
         return jsonify([])
+    finally:
+        query_log.record(
+            query, year, genre, top_k, search_mode, perf_counter() - start, stats.get("cache"),
+            filters={name: params[name] for name in ("type", "country", "category")},
+            rewritten=stats.get("rewritten")
+        )
+
+@app.route("/similar/<int:movie_id>")
+def similar(movie_id):
+    """Похожие фильмы по сохраненным эмбеддингам (без кодирования запроса)"""
+    top_k = min(max(request.args.get("top_k", 10, type=int), 1), 50)
+    results = search_engine.similar(movie_id, top_k=top_k)
+    if results is None:
+        return jsonify({"error": "Фильм не найден"}), 404
+    return jsonify(results)
 
 @app.route("/movie/<movie_id>")
 def get_movie(movie_id):
@@ -103,13 +276,17 @@ def get_movie(movie_id):
         db_service_url = os.getenv("DATABASE_SERVICE_URL", "http://database:5001")
         print(f"🎬 Запрос информации о фильме: {movie_id}")
         
-        response = requests.get(f"{db_service_url}/movies/{movie_id}", timeout=10)
+        response = requests.get(
+            f"{db_service_url}/movies/{movie_id}",
+            timeout=call_timeout(10),
+            headers={**budget_headers(), **accept_header()}
+        )
         print(f"📥 Ответ от сервиса БД: {response.status_code}")
         
         if response.status_code == 200:
-            movie_data = response.json()
+            movie_data = decode(response)
             print(f"✅ Данные фильма получены")
-            return jsonify(movie_data)
+            return respond(movie_data)
         else:
             print(f"❌ Ошибка при получении фильма: {response.status_code}")
             print(f"Ответ: {response.text}")
@@ -122,53 +299,84 @@ def get_movie(movie_id):
         print(f"❌ Неожиданная ошибка: {str(e)}")
         return jsonify({"error": "Внутренняя ошибка сервера"}), 500
 
-@app.route("/like_movie", methods=["POST"])
-def like_movie():
-    """Добавление лайка к фильму"""
+def _forward_like(path, liked):
+    """Передает лайк в сервис БД и при изменении состояния обновляет профиль пользователя"""
     try:
         data = request.json
         if not data or "movie_id" not in data:
             return jsonify({"error": "Не указан ID фильма"}), 400
             
         db_service_url = os.getenv("DATABASE_SERVICE_URL", "http://database:5001")
-        print(f"👍 Запрос на лайк фильма: {data}")
+        response = requests.post(f"{db_service_url}{path}", json=data, timeout=call_timeout(10), headers=budget_headers())
         
-        response = requests.post(f"{db_service_url}/movies/like", json=data, timeout=10)
-        print(f"📥 Ответ от сервиса БД: {response.status_code}")
+        if response.status_code != 200:
+            logger.warning("like_failed", path=path, status=response.status_code, body=response.text[:200])
+            return jsonify({"error": "Не удалось обработать лайк"}), response.status_code
         
-        if response.status_code == 200:
-            return jsonify(response.json())
-        else:
-            print(f"❌ Ошибка при добавлении лайка: {response.status_code}")
-            print(f"Ответ: {response.text}")
-            return jsonify({"error": "Не удалось добавить лайк"}), response.status_code
+        result = response.json()
+        # Сервис БД сообщает, изменилось ли состояние: повторный лайк профиль не сдвигает
+        changed = not result.get("already_liked", False) if liked else result.get("was_liked", False)
+        user_id = data.get("user_id") or data.get("session_id")
+        if changed and user_id:
+            embedding = search_engine.movie_embedding(int(data["movie_id"]))
+            if embedding is not None:
+                profile_store.update(user_id, embedding, liked=liked)
+        
+        return jsonify(result)
             
     except requests.exceptions.RequestException as e:
-        print(f"❌ Ошибка при запросе к сервису БД: {str(e)}")
-        return jsonify({"error": "Ошибка при добавлении лайка"}), 500
+        count_error("like")
+        logger.error("like_failed", path=path, error=str(e))
+        return jsonify({"error": "Ошибка при обработке лайка"}), 500
     except Exception as e:
-        print(f"❌ Неожиданная ошибка: {str(e)}")
+        count_error("like")
+        logger.error("like_failed", path=path, error=str(e), exc_info=True)
         return jsonify({"error": "Внутренняя ошибка сервера"}), 500
 
+@app.route("/like_movie", methods=["POST"])
+def like_movie():
+    """Добавление лайка к фильму"""
+    return _forward_like("/movies/like", liked=True)
+
+@app.route("/unlike_movie", methods=["POST"])
+def unlike_movie():
+    """Удаление лайка"""
+    return _forward_like("/movies/unlike", liked=False)
+
+def _reindex_job(job):
+    """Перезагружает каталог из MongoDB и пересобирает признаки поиска"""
+    # Новый каталог собирается рядом с текущим: поиск до подмены работает со старым
+    job.progress(stage="load_metadata")
+    metadata, movie_ids = search_engine._load_metadata()
+    job.progress(done=len(metadata), total=len(metadata))
+
+    # Эмбеддинги читаются заново; если файла под новое число фильмов нет, задача
+    # завершается ошибкой, а поиск продолжает работать со старым каталогом
+    job.progress(stage="embeddings")
+    embeddings = search_engine._load_or_generate_embeddings(metadata)
+
+    job.progress(stage="features", done=0, total=len(metadata))
+    catalog = SearchCatalog(metadata, movie_ids, embeddings)
+    job.progress(done=len(metadata))
+
+    # Подмена одной ссылкой; новое поколение индекса: старые результаты в кэше больше не используются
+    job.progress(stage="generation")
+    search_engine.replace_catalog(catalog)
+    
+    # Сообщаем об изменении каталога, чтобы веб-сервис сбросил кэши
+    job.progress(stage="notify")
+    try:
+        db_service_url = os.getenv("DATABASE_SERVICE_URL", "http://database:5001")
+        requests.post(f"{db_service_url}/catalog/version", timeout=5)
+    except requests.exceptions.RequestException as e:
+        print(f"⚠️ Не удалось обновить версию каталога: {str(e)}")
+    
+    return {"movies_count": search_engine.movie_count, "generation": search_engine.generation}
+
 @app.route("/update_index", methods=["POST"])
 def update_index():
-    try:
-        # Перезагружаем данные из MongoDB
-        search_engine.metadata = search_engine._load_metadata()
-        search_engine.movie_count = len(search_engine.metadata)
-        
-        # Обновляем индекс
-        search_engine._precompute_features()
-        
-        # Очищаем кэш
-        search_engine.search_cache.clear()
-        search_engine.cache_hits = 0
-        search_engine.total_searches = 0
-        
-        return jsonify({"status": "success", "message": "Индекс успешно обновлен"})
-    except Exception as e:
-        print(f"❌ Ошибка при обновлении индекса: {str(e)}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+    """Запускает переиндексацию (202 и id задачи); ?wait=<секунды> дожидается результата"""
+    return job_response(job_runner, "reindex", _reindex_job)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5002) 
\ No newline at end of file
@@ -7,23 +7,63 @@ import torch
 import hashlib
 import os
 import re
+from contextlib import contextmanager
 from time import time
 from typing import List, Dict, Any
+from metrics import timed, cache_event, get_logger, INDEX_SIZE, INDEX_GENERATION
+from neighbors import load_neighbor_graph
+from result_cache import ResultCache
+from query_log import normalize_query
+from query_rewrite import QueryRewriter
+from diagnostics import deep_sizeof
+from ranking import (
+    load_ranking_config, load_reranker, build_features, stage,
+    retrieve_candidates, filter_mask, score_candidates,
+)
+
+# Возможные пути к офлайн-графу похожих фильмов (см. neighbors.py)
+NEIGHBORS_PATHS = [
+    "/app/movies_neighbors.npz",
+    "movies_neighbors.npz",
+    "../movies_neighbors.npz",
+]
+
+# Поля фильма, которые нужны поиску: признаки ранжирования и то, что показывается в выдаче
+SEARCH_FIELDS = [
+    "name", "type", "year", "description", "shortDescription", "rating",
+    "poster", "genres", "countries", "category", "isSeries", "likes",
+]
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", 2000))
+
+# Персонализация: сколько кандидатов отбирается, когда есть профиль, и вес профиля
+PERSONALIZE_CANDIDATES = int(os.getenv("PERSONALIZE_CANDIDATES", 100))
+PERSONALIZE_WEIGHT = float(os.getenv("PERSONALIZE_WEIGHT", 0.15))
+
+logger = get_logger("turbo_search")
+
+
+class ComputeSaturated(Exception):
+    """Все слоты вычисления выдачи моделью заняты"""
+
 
 class TurboMovieSearch:
-    def __init__(self, mongo_host="mongodb://mongodb:27017", mongo_db="movies_db", mongo_collection="movies"):
+    def __init__(self, mongo_host="mongodb://mongodb:27017", mongo_db="movies_db", mongo_collection="movies",
+                 result_cache=None, compute_slots=None):
         print("🚀 Инициализация поисковой системы...")
-        self.client = MongoClient(mongo_host)
+        # Поиску MongoDB нужна только для загрузки каталога, поэтому пул небольшой
+        self.client = MongoClient(
+            mongo_host,
+            maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", 10)),
+            maxIdleTimeMS=int(os.getenv("MONGO_MAX_IDLE_MS", 60000)),
+            serverSelectionTimeoutMS=int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000)),
+            appname="search-service"
+        )
         self.db = self.client[mongo_db]
         self.collection = self.db[mongo_collection]
 
         # Загружаем данные из MongoDB
-        self.metadata = self._load_metadata()
-        self.embeddings = self._load_or_generate_embeddings()
-
-        # FAISS Index
-        self.index = faiss.IndexFlatL2(self.embeddings.shape[1])
-        self.index.add(self.embeddings)
+        metadata, movie_ids = self._load_metadata()
+        embeddings = self._load_or_generate_embeddings(metadata)
 
         # Определяем оптимальное устройство для модели
         device = "cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu"
@@ -35,26 +75,42 @@ class TurboMovieSearch:
             cache_folder='model_cache'
         )
 
-        # Предварительный расчёт для поиска по жанрам и годам
-        self._precompute_features()
-        
-        # Инициализация кэша результатов поиска
-        self.search_cache = {}
-        self.cache_hits = 0
+        # Ступени ранжирования (см. ranking.py)
+        self.ranking_config = load_ranking_config()
+        self.reranker = load_reranker(device)
+
+        # Кэш результатов поиска: без Redis работает только в памяти процесса
+        self.search_cache = result_cache or ResultCache()
+        # Семафор на вычисление выдачи моделью (None — без ограничения); попадания
+        # в кэш и ожидание чужого вычисления слот не занимают
+        self.compute_slots = compute_slots
         self.total_searches = 0
-        
+
+        # Каталог и все, что из него построено; поколение индекса растет при каждой
+        # переиндексации и общее для всех реплик
+        self.catalog = SearchCatalog(metadata, movie_ids, embeddings, self.search_cache.load_generation())
+
         # Сохраняем количество фильмов для отслеживания изменений
-        self.movie_count = len(self.metadata)
+        self.movie_count = len(metadata)
+        self._update_index_gauges()
         
         print("✅ Поисковая система готова к работе!")
 
+    @property
+    def generation(self):
+        return self.catalog.generation
+
     def _load_metadata(self):
-        """Загружает фильмы из MongoDB"""
-        movies = list(self.collection.find({}, {"_id": 0}))
+        """Загружает фильмы из MongoDB: (фильмы, их ID)"""
+        # Только нужные поля и крупными пачками: объем загрузки зависит от полей, а не от документов
+        projection = {field: 1 for field in SEARCH_FIELDS}
+        movies = list(self.collection.find({}, projection).batch_size(MONGO_BATCH_SIZE))
+        # ID храним отдельно, чтобы результаты поиска остались прежними
+        movie_ids = [movie.pop("_id") for movie in movies]
         print(f"📥 Загружено {len(movies)} фильмов из MongoDB")
-        return movies
+        return movies, movie_ids
 
-    def _load_or_generate_embeddings(self):
+    def _load_or_generate_embeddings(self, metadata):
         """Загружает существующие эмбеддинги"""
         try:
             # Проверяем несколько возможных путей к файлу
@@ -72,10 +128,10 @@ class TurboMovieSearch:
                     print(f"📊 Размер эмбеддингов: {embeddings.shape}")
                     
                     # Проверяем, соответствует ли количество эмбеддингов количеству фильмов
-                    if len(embeddings) == len(self.metadata):
+                    if len(embeddings) == len(metadata):
                         return embeddings
                     else:
-                        print(f"⚠️ Количество эмбеддингов ({len(embeddings)}) не соответствует количеству фильмов ({len(self.metadata)})")
+                        print(f"⚠️ Количество эмбеддингов ({len(embeddings)}) не соответствует количеству фильмов ({len(metadata)})")
                         continue
                         
                 except (FileNotFoundError, PermissionError) as e:
@@ -89,113 +145,347 @@ class TurboMovieSearch:
             print(f"❌ Ошибка при загрузке эмбеддингов: {str(e)}")
             raise Exception("Невозможно загрузить эмбеддинги")
 
-    def _precompute_features(self):
-        """Предварительно вычисляем нормализованные признаки"""
-        years = np.array([item.get('year', 2000) for item in self.metadata], dtype=np.float32)
-        self.norm_years = (years - years.min()) / (years.max() - years.min())
+    def replace_catalog(self, catalog):
+        """Переходит на новый каталог одной подменой ссылки, с новым поколением кэша"""
+        # Поколение записывается в еще не видимый каталог: ключи кэша строятся из
+        # поколения того каталога, по которому считалась выдача
+        catalog.generation = self.search_cache.bump_generation()
+        self.catalog = catalog
+        self.movie_count = len(catalog.metadata)
+        self.total_searches = 0
+        self._update_index_gauges()
 
-        self.genre_index = {}
-        for idx, item in enumerate(self.metadata):
-            for genre in item.get('genres', []):
-                if genre not in self.genre_index:
-                    self.genre_index[genre] = []
-                self.genre_index[genre].append(idx)
-
-        self.embeddings = normalize(self.embeddings)
-    
-    def _get_cache_key(self, query, year_filter, genre_filter):
-        """Создает уникальный ключ для кэширования результатов поиска"""
-        key = f"{query}|{year_filter}|{genre_filter}"
+    def _update_index_gauges(self):
+        """Обновляет метрики размера и поколения индекса"""
+        catalog = self.catalog
+        INDEX_SIZE.labels("movies", "items").set(len(catalog.metadata))
+        INDEX_SIZE.labels("embeddings", "bytes").set(catalog.embeddings.nbytes)
+        INDEX_SIZE.labels("faiss", "items").set(catalog.index.ntotal)
+        INDEX_SIZE.labels("search_cache", "items").set(len(self.search_cache))
+        INDEX_GENERATION.labels("search").set(catalog.generation)
+        if catalog.neighbor_ids is not None:
+            INDEX_SIZE.labels("neighbors", "bytes").set(catalog.neighbor_ids.nbytes + catalog.neighbor_scores.nbytes)
+
+    def _get_cache_key(self, catalog, query, year_filter, genre_filter, top_k):
+        """Создает ключ кэша: нормализованный запрос, фильтры и поколение индекса"""
+        normalized = normalize_query(query)
+        genre = genre_filter.strip().lower() if genre_filter else ""
+        key = f"{catalog.generation}|{normalized}|{year_filter or ''}|{genre}|{top_k}"
         return hashlib.md5(key.encode()).hexdigest()
 
-    def _parse_query(self, query: str):
+    def _parse_query(self, catalog, query: str):
         """Извлечение фильтров из запроса"""
         year_match = re.search(r'\b(19\d{2}|20[0-2]\d)\b', query)
-        year_boost = None
-        if year_match:
-            year = int(year_match.group())
-            year_boost = (year - 1900) / 125
+        year = int(year_match.group()) if year_match else None
 
         genres = []
-        for genre in self.genre_index.keys():
+        for genre in catalog.genre_index.keys():
             if re.search(r'\b' + re.escape(genre) + r'\b', query, re.IGNORECASE):
                 genres.append(genre)
 
         clean_query = re.sub(r'\b\d{4}\b', '', query).strip()
-        return clean_query, year_boost, genres
+        return clean_query, year, genres
 
-    def search(self, query: str, top_k=10, year_filter=None, genre_filter=None):
+    def search(self, query: str, top_k=10, year_filter=None, genre_filter=None, profile=None,
+               budget=None, trace=None, stats=None):
         """
-        Поиск фильмов по запросу с учетом фильтров
+        Поиск фильмов по запросу с учетом фильтров.
+        profile — нормализованный вектор профиля пользователя: если передан,
+        кандидаты переранжируются с учетом его вкусов (без общего кэша).
+        budget — сколько секунд осталось у запроса: от него зависит, запускать ли кросс-энкодер,
+        и сколько можно ждать чужого вычисления того же запроса (дольше — TimeoutError).
+        Если выдачу нужно считать, а все слоты compute_slots заняты, — ComputeSaturated.
+        trace — словарь для времени ступеней (режим отладки, тоже мимо кэша).
+        stats — словарь, в который записывается результат кэша (hit / miss / bypass / title)
+        и переписанный запрос (rewritten, corrections).
         """
-        start_time = time()
         self.total_searches += 1
-        
-        # Проверяем кэш
-        cache_key = self._get_cache_key(query, year_filter, genre_filter)
-        if cache_key in self.search_cache:
-            self.cache_hits += 1
-            hit_rate = (self.cache_hits / self.total_searches) * 100
-            print(f"🔍 Кэш-хит! ({self.cache_hits}/{self.total_searches}, {hit_rate:.1f}%)")
-            return self.search_cache[cache_key]
+        stats = {} if stats is None else stats
+        # Весь запрос работает с одним каталогом, даже если переиндексация подменит его посередине
+        catalog = self.catalog
+
+        # Нормализация и исправление опечаток до кэша: варианты одного запроса делят одну запись.
+        # Ключ строится из того же текста, что идет в модель, — иначе под одним ключом
+        # оказались бы выдачи для разных запросов
+        rewrite = catalog.rewriter.rewrite(query)
+        stats["rewritten"] = rewrite.text
+        stats["corrections"] = rewrite.corrections
+        cache_event("typo_correction", bool(rewrite.corrections))
+        cache_event("title_lookup", rewrite.title_row is not None)
+        query = rewrite.text or query
+
+        # Точное название фильма: сам фильм и его соседи, без обращения к модели
+        if rewrite.title_row is not None and not year_filter and not genre_filter and profile is None:
+            stats["cache"] = "title"
+            with timed("title_lookup"):
+                return self._title_results(catalog, rewrite.title_row, top_k)
+
+        # Персональная и отладочная выдача в общий кэш не попадают
+        if profile is not None or trace is not None:
+            stats["cache"] = "bypass"
+            with self._compute_slot():
+                return self._search(catalog, query, top_k, year_filter, genre_filter, profile, budget, trace)
+
+        cache_key = self._get_cache_key(catalog, query, year_filter, genre_filter, top_k)
 
-        clean_query, year_boost, genres = self._parse_query(query)
+        # Без кросс-энкодера (мало бюджета) выдача хуже полной: ее не кэшируем,
+        # чтобы она не отдавалась под тем же ключом до истечения TTL
+        if self._rerank_skipped(budget):
+            cached = self.search_cache.peek(cache_key)
+            stats["cache"] = "hit" if cached is not None else "bypass"
+            if cached is not None:
+                return cached
+            with self._compute_slot():
+                return self._search(catalog, query, top_k, year_filter, genre_filter, budget=budget)
 
-        if year_filter:
+        def compute():
+            stats["cache"] = "miss"
+            with self._compute_slot():
+                return self._search(catalog, query, top_k, year_filter, genre_filter, budget=budget)
+
+        stats["cache"] = "hit"
+        results = self.search_cache.get_or_compute(cache_key, compute, timeout=budget)
+        INDEX_SIZE.labels("search_cache", "items").set(len(self.search_cache))
+        return results
+
+    @contextmanager
+    def _compute_slot(self):
+        """Слот на вычисление выдачи; если свободного нет — ComputeSaturated, без ожидания"""
+        if self.compute_slots is None:
+            yield
+            return
+        if not self.compute_slots.acquire(blocking=False):
+            raise ComputeSaturated()
+        try:
+            yield
+        finally:
+            self.compute_slots.release()
+
+    def warm_cache(self, queries):
+        """Заполняет кэш результатами запросов [(запрос, год, жанр, top_k)]; возвращает число вычисленных"""
+        computed = 0
+        for query, year, genre, top_k in queries:
+            stats = {}
             try:
-                year_boost = (int(year_filter) - 1900) / 125
-            except (ValueError, TypeError):
-                year_boost = None
-                
-        if genre_filter:
-            genres.append(genre_filter.lower())
+                self.search(query, top_k=int(top_k), year_filter=year or None, genre_filter=genre or None, stats=stats)
+            except Exception as e:
+                logger.warning("warm_cache_failed", query=query, error=str(e))
+                continue
+            computed += stats.get("cache") == "miss"
+        return computed
 
-        # Получаем эмбеддинг запроса
-        query_embedding = self.model.encode(
-            clean_query,
-            convert_to_numpy=True,
-            normalize_embeddings=True
-        )
+    def cached_search(self, query: str, top_k=10, year_filter=None, genre_filter=None):
+        """Результат из кэша без обращения к модели или None"""
+        catalog = self.catalog
+        query = catalog.rewriter.rewrite(query).text or query
+        return self.search_cache.peek(self._get_cache_key(catalog, query, year_filter, genre_filter, top_k))
 
-        # Вычисляем текстовое сходство
-        text_scores = np.dot(self.embeddings, query_embedding.T).flatten()
-        
-        # Инициализируем дополнительные скоры
-        year_scores = np.zeros_like(text_scores)
-        genre_scores = np.zeros_like(text_scores)
+    def _title_results(self, catalog, row, top_k):
+        """Выдача для точного совпадения с названием: фильм первым, за ним похожие"""
+        movie = catalog.metadata[row].copy()
+        movie['relevance_score'] = 1.0
+        results = [movie]
+        if top_k > 1:
+            rows, scores = catalog.neighbor_rows(row, top_k - 1)
+            for idx, score in zip(rows, scores):
+                movie = catalog.metadata[idx].copy()
+                movie['relevance_score'] = float(score)
+                results.append(movie)
+        return results
 
-        # Учитываем год, если указан
-        if year_boost is not None:
-            year_scores = 1.0 - np.abs(self.norm_years - year_boost)
+    def _search(self, catalog, query, top_k=10, year_filter=None, genre_filter=None, profile=None, budget=None, trace=None):
+        """Ранжирование без обращения к кэшу: отбор кандидатов, пересчет признаков, кросс-энкодер"""
+        start_time = time()
+        config = self.ranking_config
 
-        # Учитываем жанры
-        if genres:
-            for genre in genres:
-                if genre in self.genre_index:
-                    genre_scores[self.genre_index[genre]] += 0.1
+        with stage(trace, "parse"):
+            clean_query, year, genres = self._parse_query(catalog, query)
 
-        # Комбинируем все скоры с весами
-        total_scores = 0.85 * text_scores + 0.05 * year_scores + 0.1 * genre_scores
+            if year_filter:
+                try:
+                    year = int(year_filter)
+                except (ValueError, TypeError):
+                    year = None
+                    
+            if genre_filter:
+                genres.append(genre_filter.lower())
+
+        # Получаем эмбеддинг запроса
+        with stage(trace, "encode"):
+            query_embedding = self.model.encode(
+                clean_query,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+
+        with stage(trace, "retrieve"):
+            # Текстовое сходство по всему каталогу — один матрично-векторный проход
+            text_scores = np.dot(catalog.embeddings, query_embedding.T).flatten()
+            limit = max(config["candidates"], top_k, PERSONALIZE_CANDIDATES if profile is not None else 0)
+            mask = filter_mask(catalog.features, catalog.genre_index, year, genres, config["year_window"])
+            candidates = retrieve_candidates(text_scores, limit, mask)
 
-        # Получаем топ-K результатов
-        indices = np.argpartition(total_scores, -top_k)[-top_k:]
-        best_indices = indices[np.argsort(-total_scores[indices])]
+        with stage(trace, "score"):
+            scores = score_candidates(
+                candidates, text_scores, catalog.features, catalog.genre_index, config, year, genres
+            )
+            if profile is not None:
+                scores += PERSONALIZE_WEIGHT * np.dot(catalog.embeddings[candidates], profile)
+            order = np.argsort(-scores)
+            candidates, scores = candidates[order], scores[order]
+
+        rerank_status = self._rerank(catalog, clean_query or query, candidates, scores, budget, trace)
+        if trace is not None:
+            trace["rerank_status"] = rerank_status
 
         # Формируем результаты
         results = []
-        for idx in best_indices:
-            if total_scores[idx] > 0.1:  # Фильтруем низкорелевантные результаты
-                movie = self.metadata[idx].copy()
-                movie['relevance_score'] = float(total_scores[idx])
+        for idx, score in zip(candidates[:top_k], scores[:top_k]):
+            if score > 0.1:  # Фильтруем низкорелевантные результаты
+                movie = catalog.metadata[idx].copy()
+                movie['relevance_score'] = float(score)
                 results.append(movie)
 
-        # Сохраняем в кэш
-        self.search_cache[cache_key] = results
-        
-        # Ограничиваем размер кэша
-        if len(self.search_cache) > 1000:
-            random_key = next(iter(self.search_cache))
-            del self.search_cache[random_key]
+        logger.info("search", query=query, took_ms=round((time() - start_time) * 1000, 2), found=len(results))
+        return results 
+
+    def _rerank_skipped(self, budget):
+        """Кросс-энкодер включен, но оставшегося бюджета на него не хватает"""
+        return (self.reranker is not None and budget is not None
+                and budget < self.ranking_config["rerank_min_budget"])
+
+    def _rerank(self, catalog, query, candidates, scores, budget, trace):
+        """
+        Ступень 3: переранжирует верх списка кросс-энкодером (на месте).
+        Возвращает статус для отладки: off / skipped_budget / applied.
+        """
+        if self.reranker is None:
+            return "off"
+        if self._rerank_skipped(budget):
+            return "skipped_budget"
+
+        with stage(trace, "rerank"):
+            top = min(self.ranking_config["rerank_top"], len(candidates))
+            movies = [catalog.metadata[idx] for idx in candidates[:top]]
+            reranked = self.reranker.rerank(query, movies, scores[:top], self.ranking_config["rerank_weight"])
+            order = np.argsort(-reranked)
+            candidates[:top] = candidates[:top][order]
+            scores[:top] = reranked[order]
+        return "applied"
+
+    def memory_usage(self):
+        """Сколько байт занимают данные поиска (для /debug/memory)"""
+        catalog = self.catalog
+        usage = {
+            "metadata": deep_sizeof(catalog.metadata),
+            "movie_ids": deep_sizeof(catalog.movie_ids),
+            "id_to_row": deep_sizeof(catalog.id_to_row),
+            "embeddings": catalog.embeddings.nbytes,
+            "faiss_index": catalog.index.ntotal * catalog.index.d * 4,
+            "features": sum(array.nbytes for array in catalog.features.values()),
+            "genre_index": deep_sizeof(catalog.genre_index),
+            "query_rewriter": deep_sizeof(catalog.rewriter.titles) + deep_sizeof(catalog.rewriter.title_texts)
+                              + deep_sizeof(catalog.rewriter.speller.deletes) + deep_sizeof(catalog.rewriter.speller.known_words),
+            "search_cache_l1": self.search_cache.size_bytes(),
+        }
+        if catalog.neighbor_ids is not None:
+            usage["neighbors"] = catalog.neighbor_ids.nbytes + catalog.neighbor_scores.nbytes
+        if hasattr(self.model, "parameters"):
+            usage["model"] = sum(p.numel() * p.element_size() for p in self.model.parameters())
+        return usage
+
+    def movie_embedding(self, movie_id):
+        """Нормализованный эмбеддинг фильма по ID (или None)"""
+        catalog = self.catalog
+        row = catalog.id_to_row.get(movie_id)
+        return None if row is None else catalog.embeddings[row]
+
+    def similar(self, movie_id, top_k=10):
+        """
+        Похожие фильмы по сохраненному эмбеддингу фильма, без обращения к модели.
+        Возвращает None, если фильма нет в индексе.
+        """
+        catalog = self.catalog
+        row = catalog.id_to_row.get(movie_id)
+        if row is None:
+            return None
+
+        with timed("similar"):
+            rows, scores = catalog.neighbor_rows(row, top_k)
+
+        results = []
+        for idx, score in zip(rows, scores):
+            movie = catalog.metadata[idx].copy()
+            movie['id'] = catalog.movie_ids[idx]
+            movie['relevance_score'] = float(score)
+            results.append(movie)
+        return results
+
+
+class SearchCatalog:
+    """
+    Одна версия каталога: фильмы, эмбеддинги и все, что по ним построено.
+    Объект после сборки не меняется: переиндексация собирает новый и подменяет
+    ссылку на него целиком, поэтому запрос, взявший каталог в начале, до конца
+    видит согласованные строки, признаки и соседей.
+    """
+
+    def __init__(self, metadata, movie_ids, embeddings, generation=None):
+        self.metadata = metadata
+        self.movie_ids = movie_ids
+        self.generation = generation
+
+        # FAISS Index
+        self.index = faiss.IndexFlatL2(embeddings.shape[1])
+        self.index.add(embeddings)
+        self.embeddings = normalize(embeddings)
+
+        # Предварительный расчёт для поиска по жанрам и годам
+        self._precompute_features()
+
+        # Граф похожих фильмов (если собран офлайн)
+        self._load_neighbors()
+
+    def _precompute_features(self):
+        """Предварительно вычисляем нормализованные признаки"""
+        self.features = build_features(self.metadata)
+
+        genre_rows = {}
+        for idx, item in enumerate(self.metadata):
+            for genre in item.get('genres', []):
+                if genre not in genre_rows:
+                    genre_rows[genre] = []
+                genre_rows[genre].append(idx)
+        self.genre_index = {genre: np.array(rows, dtype=np.int64) for genre, rows in genre_rows.items()}
+
+        # Словарь для нормализации запросов и исправления опечаток (см. query_rewrite.py)
+        with timed("rewriter_build"):
+            self.rewriter = QueryRewriter(self.metadata, self.genre_index.keys())
+
+        # Номер строки эмбеддингов по ID фильма
+        self.id_to_row = {movie_id: row for row, movie_id in enumerate(self.movie_ids)}
+
+    def _load_neighbors(self):
+        """Загружает офлайн-граф соседей, если он построен для текущего каталога"""
+        self.neighbor_ids = None
+        self.neighbor_scores = None
+        for path in NEIGHBORS_PATHS:
+            graph = load_neighbor_graph(path, len(self.metadata))
+            if graph is not None:
+                self.neighbor_ids, self.neighbor_scores = graph
+                return
+        print("⚠️ Граф соседей не найден, похожие фильмы будут считаться по запросу")
+
+    def neighbor_rows(self, row, top_k):
+        """Строки и оценки top_k ближайших к фильму в строке row"""
+        if self.neighbor_ids is not None and top_k <= self.neighbor_ids.shape[1]:
+            # Готовые соседи из офлайн-графа
+            return self.neighbor_ids[row, :top_k], self.neighbor_scores[row, :top_k].astype(np.float32)
 
-        print(f"⏱ Поиск за {time() - start_time:.2f}s | Найдено {len(results)} фильмов")
-        return results 
\ No newline at end of file
+        # Графа нет — один проход скалярного произведения по каталогу
+        all_scores = np.dot(self.embeddings, self.embeddings[row])
+        all_scores[row] = -np.inf
+        top_k = min(top_k, len(all_scores) - 1)
+        candidates = np.argpartition(all_scores, -top_k)[-top_k:]
+        rows = candidates[np.argsort(-all_scores[candidates])]
+        return rows, all_scores[rows]
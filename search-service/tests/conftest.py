@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Модули сервиса лежат плоско в app/ и common/ (в образе они копируются в один каталог)
+# и импортируются так же, как при запуске сервиса
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+sys.path[:0] = [os.path.join(ROOT_DIR, "search-service", "app"), os.path.join(ROOT_DIR, "common")]
@@ -0,0 +1,109 @@
+from query_rewrite import QueryRewriter, SymSpell, fold
+
+CATALOG = [
+    {"name": "Матрица", "rating": 8.5, "description": "Хакер узнает правду о мире"},
+    {"name": "Мания", "rating": 6.0, "description": "Фильм о мафии и мафия в городе"},
+    {"name": "Война", "rating": 7.0, "description": "Фильм про войну"},
+    {"name": "Инопланетянин", "rating": 7.9, "description": "Мальчик находит пришельца"},
+    {"name": "Сердце", "rating": 7.1, "description": "Драма"},
+    {"name": "Темный рыцарь", "rating": 9.0, "shortDescription": "Бэтмен против Джокера"},
+    {"name": "Драма", "rating": 5.0},
+]
+GENRES = ["драма", "фантастика", "боевик"]
+
+
+def make_rewriter(wordlist=None):
+    return QueryRewriter(CATALOG, GENRES, wordlist=wordlist)
+
+
+def test_fold():
+    assert fold("  Ёлки-палки,   ФИЛЬМ! ") == "елки палки фильм"
+    assert fold("ＭＡＴＲＩＸ") == "matrix"
+    assert fold(None) == ""
+
+
+def test_symspell_corrects_unknown_words():
+    speller = SymSpell({"матрица": 1, "фантастика": 5})
+    assert speller.correct("матрца") == "матрица"
+    assert speller.correct("фонтастика") == "фантастика"
+
+
+def test_symspell_keeps_known_and_short_words():
+    speller = SymSpell({"мания": 1}, known_words={"мафия"})
+    assert speller.correct("мафия") == "мафия"
+    assert speller.correct("мания") == "мания"
+    assert speller.correct("кот") == "кот"
+    assert speller.correct("1999") == "1999"
+
+
+def test_exact_title_short_circuits():
+    rewrite = make_rewriter().rewrite("  МАТРИЦА ")
+    assert rewrite.folded == "матрица"
+    assert rewrite.title_row == 0
+    assert rewrite.corrections == []
+
+
+def test_typo_in_title_is_corrected_without_short_circuit():
+    rewrite = make_rewriter().rewrite("матрца")
+    assert rewrite.text == "матрица"
+    assert rewrite.corrections == [("матрца", "матрица")]
+    # Фильм по исправленному названию без модели не отдается
+    assert rewrite.folded == "матрца"
+    assert rewrite.title_row is None
+
+
+def test_correction_keeps_stopwords():
+    rewrite = make_rewriter().rewrite("фильм матрца")
+    assert rewrite.text == "фильм матрица"
+
+
+def test_valid_words_stay_unchanged():
+    rewriter = make_rewriter()
+    for query, text in (("мафия", "мафия"), ("про войну", "про войну")):
+        rewrite = rewriter.rewrite(query)
+        assert rewrite.text == text
+        assert rewrite.corrections == []
+        assert rewrite.title_row is None
+
+
+def test_generic_query_is_not_a_title_hit():
+    rewriter = make_rewriter()
+    for query in ("инопланетяне", "сердца"):
+        rewrite = rewriter.rewrite(query)
+        assert rewrite.folded == query
+        assert rewrite.title_row is None
+
+
+def test_correction_must_produce_whole_title():
+    # "рыцари" похоже на слово названия, но "темный рыцарь" целиком не получается
+    rewrite = make_rewriter().rewrite("добрые рыцари")
+    assert rewrite.text == "добрые рыцари"
+    assert rewrite.corrections == []
+
+
+def test_stopwords_do_not_make_title_hit():
+    rewrite = make_rewriter().rewrite("фильм война")
+    assert rewrite.text == "фильм война"
+    assert rewrite.title_row is None
+
+
+def test_queries_with_different_words_get_different_text():
+    # Тип и жанр в запросе меняют фильтры: такие запросы не должны делить ключ кэша
+    rewriter = make_rewriter()
+    texts = {rewriter.rewrite(query).text
+             for query in ("мультфильм про собаку", "фильм про собаку", "собаку", "кино о войне", "войне")}
+    assert len(texts) == 5
+
+
+def test_genre_title_is_not_a_title_hit():
+    assert make_rewriter().rewrite("драма").title_row is None
+
+
+def test_wordlist_words_are_not_corrected(tmp_path):
+    wordlist = tmp_path / "words.txt"
+    wordlist.write_text("инопланетяне\nсердца\n", encoding="utf-8")
+    rewriter = make_rewriter(str(wordlist))
+    for query in ("инопланетяне", "сердца"):
+        rewrite = rewriter.rewrite(query)
+        assert rewrite.text == query
+        assert rewrite.corrections == []
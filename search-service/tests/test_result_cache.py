@@ -0,0 +1,137 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep, time
+
+import fakeredis
+import pytest
+
+from result_cache import ResultCache
+
+
+class SlowCompute:
+    """compute() для кэша: считает вызовы и работает delay секунд"""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+        sleep(self.delay)
+        return ["fresh"]
+
+
+def test_stale_hits_schedule_one_refresh():
+    cache = ResultCache(fresh_ttl=60, stale_ttl=3600)
+    cache._set_l1("k", ["stale"], time() - 120)
+    compute = SlowCompute()
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        results = list(pool.map(lambda _: cache.get_or_compute("k", compute), range(20)))
+    cache._refresher.shutdown(wait=True)
+
+    assert results == [["stale"]] * 20
+    assert compute.calls == 1
+    assert cache.get_or_compute("k", compute) == ["fresh"]
+
+
+def test_stale_hits_after_refresh_do_not_recompute():
+    cache = ResultCache(fresh_ttl=60, stale_ttl=3600)
+    cache._set_l1("k", ["stale"], time() - 120)
+    compute = SlowCompute(delay=0.05)
+
+    for _ in range(20):
+        cache.get_or_compute("k", compute)
+        sleep(0.01)
+    cache._refresher.shutdown(wait=True)
+
+    assert compute.calls == 1
+
+
+def test_refresh_uses_fresher_l2_entry():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    cache = ResultCache(redis_client=redis_client, fresh_ttl=60, stale_ttl=3600)
+    other_replica = ResultCache(redis_client=redis_client, fresh_ttl=60, stale_ttl=3600)
+    cache._set_l1("k", ["stale"], time() - 120)
+    other_replica._store("k", ["from other replica"])
+    compute = SlowCompute(delay=0)
+
+    assert cache.get_or_compute("k", compute) == ["stale"]
+    cache._refresher.shutdown(wait=True)
+
+    assert compute.calls == 0
+    assert cache.get_or_compute("k", compute) == ["from other replica"]
+
+
+def test_concurrent_misses_compute_once():
+    cache = ResultCache(redis_client=fakeredis.FakeRedis(decode_responses=True))
+    compute = SlowCompute()
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        results = list(pool.map(lambda _: cache.get_or_compute("k", compute), range(10)))
+
+    assert results == [["fresh"]] * 10
+    assert compute.calls == 1
+
+
+def test_lock_released_by_owner():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    cache = ResultCache(redis_client=redis_client)
+
+    cache.get_or_compute("k", SlowCompute(delay=0))
+
+    assert redis_client.get("search:lock:k") is None
+
+
+def test_other_replica_lock_survives_wait_timeout():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    redis_client.set("search:lock:k", "other-replica", px=10_000)
+    cache = ResultCache(redis_client=redis_client, lock_timeout=0.1)
+
+    assert cache.get_or_compute("k", SlowCompute(delay=0)) == ["fresh"]
+    assert redis_client.get("search:lock:k") == "other-replica"
+
+
+def test_expired_lock_taken_by_other_replica_is_not_deleted():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    cache = ResultCache(redis_client=redis_client, lock_timeout=0.05)
+
+    def compute():
+        # Наша блокировка истекла, и ее взяла другая реплика
+        sleep(0.1)
+        redis_client.set("search:lock:k", "other-replica", px=10_000)
+        return ["fresh"]
+
+    cache.get_or_compute("k", compute)
+
+    assert redis_client.get("search:lock:k") == "other-replica"
+
+
+def test_wait_for_other_replica_is_limited_by_timeout():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    redis_client.set("search:lock:k", "other-replica", px=10_000)
+    cache = ResultCache(redis_client=redis_client, lock_timeout=10)
+    compute = SlowCompute(delay=0)
+
+    start = time()
+    with pytest.raises(TimeoutError):
+        cache.get_or_compute("k", compute, timeout=0.1)
+
+    assert time() - start < 1
+    assert compute.calls == 0
+
+
+def test_wait_for_inflight_compute_is_limited_by_timeout():
+    cache = ResultCache()
+    compute = SlowCompute(delay=0.5)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        leader = pool.submit(cache.get_or_compute, "k", compute)
+        sleep(0.05)
+        with pytest.raises(TimeoutError):
+            cache.get_or_compute("k", compute, timeout=0.05)
+        assert leader.result() == ["fresh"]
+
+    assert compute.calls == 1